@@ -1,34 +1,60 @@
 import logging
+import math
 import os
 import subprocess
 import json
-import random
 from telegram import Update, Chat, Bot
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackContext
 from io import BytesIO
-from PIL import Image
-import requests
-from tenacity import retry, stop_after_attempt, wait_fixed
 import asyncio
-from flask import Flask, request, jsonify
-
-# Configure logging
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+import sys
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Optional
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+
+# Share the bot's generation scheduler from project/src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'project'))
+from src.scheduler import GenerationScheduler, QueueFullError
+from src.catalog import PromptRotation
+from src.database import init_db
+from src.rate_limit import RateLimiter
+from src.image_client import ImageAPIError, ImageClient, InlineImageDecoder
+from src.image_utils import image_buffer
+from src.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+from src.updates import UpdateProcessor
+from src.warmup import warm_up, warm_telegram
+from src.webhook import GracefulServer
+from src.channel_poster import ChannelPoster, register_schedule
+from src.log_pipeline import start_logging
+
+# Configure logging; a background thread writes the records, off the event loop
+start_logging(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Environment variables
 openai_api_key = os.getenv('OPENAI_API_KEY')
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID')
-ZAPIER_WEBHOOK_URL = os.getenv('ZAPIER_WEBHOOK_URL')
+# b64_json returns the image with the generation response; url fetches it in a second request
+IMAGE_RESPONSE_FORMAT = os.getenv('IMAGE_RESPONSE_FORMAT', 'b64_json')
+# Built-in posting calendar, e.g. "0 9 * * *;0 18 * * 1-5"; posts generate this many minutes ahead
+CHANNEL_SCHEDULE = os.getenv('CHANNEL_SCHEDULE')
+CHANNEL_MISSED_POSTS = os.getenv('CHANNEL_MISSED_POSTS', 'skip')  # skip, latest or catch_up
+CHANNEL_LEAD_MINUTES = int(os.getenv('CHANNEL_LEAD_MINUTES', '30'))
 
 # Validate environment variables
 def validate_environment():
     required_vars = {
         'OPENAI_API_KEY': openai_api_key,
         'TELEGRAM_BOT_TOKEN': TOKEN,
-        'TELEGRAM_CHANNEL_ID': TELEGRAM_CHANNEL_ID,
-        'ZAPIER_WEBHOOK_URL': ZAPIER_WEBHOOK_URL
+        'TELEGRAM_CHANNEL_ID': TELEGRAM_CHANNEL_ID
     }
     
     missing_vars = [name for name, value in required_vars.items() if not value]
@@ -37,93 +63,33 @@ def validate_environment():
         logger.error(f"Missing required environment variables: {', '.join(missing_vars)}")
         exit(1)
 
-# Initialize Telegram bot
-bot = Bot(token=TOKEN)
-
-# List of slogans and meme ideas
-slogans_and_ideas = [
-    ("Bee the Change. Power the World.", "A happy bee holding a miniature solar panel, with a background of CPUs mining in the hive."),
-    ("Hive Together, Thrive Together.", "Happy Bees forming a chain, representing a blockchain, with smiling faces as they connect to each other."),
-    ("Buzzing Towards a Greener Future.", "A happy bee flying towards a sun, with solar panels beneath and energy lines connecting the world."),
-    ("Small Buzz, Big Impact.", "A small bee with a huge lightning bolt, symbolizing that CPU mining with Whive has a big environmental impact."),
-    ("Proof of Work, Proof of Honey.", "A happy bee dressed as a miner with coins that look like honey dripping, symbolizing mining rewards."),
-    ("Let Your CPU Bee Part of the Swarm.", "A happy bee sitting on a laptop with a 'Join the Hive' button on screen, showing CPU mining activity."),
-    ("The Hive is Stronger When We Buzz Together.", "Multiple Happy Bees with mining hats working together to build a stronger hive, showcasing network collaboration."),
-    ("CPU Power, Green Future.", "A happy bee plugging a CPU into a tree, with energy flowing from the tree into the hive."),
-    ("Empower the Hive, Harvest the Future.", "Happy Bees collecting honey while solar panels charge the hive, emphasizing energy harvesting."),
-    ("Sustainable Rewards, Sweet as Honey.", "Happy Bees flying with honey jars filled with digital rewards, showing that renewable energy rewards are sweet."),
-    ("Bee Smart. Bee Renewable.", "A happy bee holding a lightbulb above a field of solar panels, showcasing innovation in renewable energy."),
-    ("From Hive to Hive, Decentralized Energy for All.", "Happy Bees flying between hives exchanging energy, symbolizing peer-to-peer decentralized energy trading."),
-    ("Power Up Your Hive, One CPU at a Time.", "A happy bee installing a CPU into a hive, powering it up like a battery."),
-    ("Buzz Around the World with Green Energy.", "Happy Bees carrying a globe with solar panels covering it, representing sustainable energy."),
-    ("Bee Efficient, Bee Rewarded.", "A happy bee mining with a pickaxe, surrounded by honeycombs that represent block rewards."),
-    ("Mining for a Better Buzz.", "A happy bee miner with a smile, holding a chunk of honey labeled 'Green Rewards.'"),
-    ("The Buzzing Network of Sustainable Growth.", "Happy Bees flying around a blockchain, leaving behind flowers that bloom, showing sustainable growth."),
-    ("Bee the Proof-of-Work in a Sustainable World.", "A happy bee holding up a 'Proof of Work' sign above a lush field, symbolizing energy-efficient mining."),
-    ("Buzz Responsibly, Mine Sustainably.", "A happy bee miner next to solar panels, emphasizing environmentally friendly mining."),
-    ("Hive Mind for Renewable Energy.", "A group of Happy Bees in a conference room, planning how to implement solar energy."),
-    ("Buzzing Past ASICs to Bring Power to the People.", "A happy bee zooming past large mining machines labeled 'ASICs,' reaching the people instead."),
-    ("Buzz Lightyear! From Solar to Blockchain!", "A happy bee dressed as Buzz Lightyear flying into the blockchain with a solar panel backpack."),
-    ("Be the Buzz, Energize the Future.", "A happy bee buzzing around a battery icon, slowly filling it up with energy."),
-    ("Hive with Us. Change the Future.", "A happy bee inviting others into a hive, which has a banner reading 'Welcome to the Future.'"),
-    ("Green Energy? We've Got the Buzz for It!", "Happy Bees working in a hive full of green leaves, symbolizing green energy and sustainability."),
-    ("Buzz Where It's Needed – CPU Mining for All!", "A happy bee on a laptop, flying across a world map to represent decentralizing mining to all locations."),
-    ("Hive Together, Win Together!", "Happy Bees exchanging honey jars labeled 'Rewards,' showcasing the idea of collective benefits."),
-    ("Proof of Honey, Powered by Green Energy.", "Happy Bees producing honey in a field of solar panels, emphasizing proof-of-work tied to renewable energy."),
-    ("Sweet Rewards for Green Energy Pioneers.", "A happy bee presenting a golden honey jar to another bee with a 'Pioneer' badge."),
-    ("Bee a Pioneer, Buzz Sustainably.", "A happy bee explorer planting a flag that reads 'Green Energy Champion.'"),
-    ("Bee Renewable, Bee Rewarded.", "A happy bee flying in circles around solar panels while receiving digital honey rewards."),
-    ("The Hive Network Buzzing with Energy.", "A network of Happy Bees connecting their hives with electric cables representing blockchain nodes."),
-    ("One Hive, One Mission – Sustainability.", "Happy Bees carrying signs reading 'Green Future' and 'Sustainable Mining' marching together."),
-    ("Hive Hard, Earn Sweet.", "A happy bee miner with a honeycomb backpack labeled 'Sweet Rewards,' mining on solar power."),
-    ("Buzz Beyond Borders – Global Mining.", "A happy bee flying over a globe with countries lighting up, symbolizing the global nature of mining."),
-    ("Let’s Hive to Survive.", "Happy Bees flying with determination towards renewable energy sources to protect their hive."),
-    ("Green Energy, Golden Rewards.", "A happy bee turning sunlight into golden honey coins, symbolizing green rewards for clean energy."),
-    ("Hive Smart, Buzz Efficient.", "A happy bee using a laptop, generating a honeycomb full of coins, symbolizing intelligent and efficient mining."),
-    ("Buzzin' Beyond ASICs – Join the Hive!", "A happy bee with crossed-out ASIC mining machines, showing a preference for CPU mining."),
-    ("For the Planet, For the Buzz.", "Happy Bees planting trees, with coins floating above them, representing benefits for both the hive and the planet."),
-    ("Buzz Together for a Brighter Tomorrow.", "A field full of solar-powered bee hives, with rays of sunlight shining down on them."),
-    ("Mining Made for Every Bee.", "Happy Bees in different outfits (worker bee, student bee, etc.) mining with laptops, showing inclusivity."),
-    ("Swarm the Future with Renewable Buzz.", "A swarm of Happy Bees flying towards a glowing future, representing a transition to sustainable energy."),
-    ("Decentralized Mining – Let It Bee.", "A happy bee with mining gear pointing to the blockchain hive and saying 'Let it bee.'"),
-    ("Renewable Energy? It’s the Happy Bees Knees!", "A happy bee showing its knees while solar panels are connected to the hive, emphasizing energy."),
-    ("Buzz Power, Not Fossil Power.", "Happy Bees turning away from an oil pumpjack towards a field of solar panels."),
-    ("Hive Now for a Sustainable Future.", "Happy Bees building a hive with green leaves growing on it, representing future sustainability."),
-    ("Bee the Miner the World Needs.", "A heroic-looking bee holding a CPU chip like a superhero, symbolizing energy-efficient mining."),
-    ("We Bee-Lieve in Sustainable Mining.", "A group of Happy Bees cheering with a banner saying 'Sustainable Mining Rocks.'"),
-    ("CPU Power is Bee Power!", "A happy bee holding a CPU chip, with energy radiating towards a hive."),
-    ("Hive On, Shine On.", "Happy Bees in a solar-powered hive with a sun shining above, representing the power of renewable energy."),
-    ("Join the Hive, Earn the Buzz.", "A happy bee buzzing in a circle with coins, inviting others to join in for rewards."),
-    ("Sustainable Mining is the Bees’ Buzz.", "Happy Bees having a meeting and discussing how to keep mining sustainable."),
-    ("Buzzing with Green Energy Rewards.", "A happy bee flying with honey pots labeled 'Green Rewards,' showing how sustainable mining pays off."),
-    ("Buzz Light, Mine Right.", "Happy Bees mining with solar-powered tools under the sunlight, showcasing responsible mining."),
-    ("Together We Thrive, Together We Hive.", "Happy Bees working in harmony, building a giant hive, representing a collaborative effort."),
-    ("Power the Buzz, Protect the Hive.", "A happy bee guarding the hive while other Happy Bees generate power using CPUs, symbolizing community protection."),
-    ("Bee Green, Bee Strong.", "Happy Bees using renewable energy to strengthen their hive, showcasing a collective effort."),
-    ("CPU Mining – Buzz for the Future.", "A happy bee flying through a futuristic landscape full of solar panels, representing mining for the future.")
-]
-
-# List of random capital cities
-# List of random capital cities
-capital_cities = [
-    "Nairobi", "Tokyo", "Paris", "London", "Berlin", "Brasília", "Canberra", "Ottawa", "Washington D.C.", "Beijing",
-    "Moscow", "Cairo", "Buenos Aires", "New Delhi", "Rome", "Madrid", "Seoul", "Bangkok", "Jakarta", "Pretoria",
-    "Helsinki", "Oslo", "Stockholm", "Lisbon", "Vienna", "Bern", "Amsterdam", "Brussels", "Dublin", "Warsaw",
-    "Athens", "Havana", "Kingston", "Kigali", "Baghdad", "New York", "Riyadh", "Hanoi", "Manila", "Santiago",
-    "Lima", "Bogotá", "Caracas", "Quito", "San José", "Panama City", "Port-au-Prince", "Kingstown", "Castries", "Nassau",
-    "Georgetown", "Paramaribo", "Port of Spain", "Bridgetown", "Belmopan", "Suva", "Apia", "Wellington", "Yamoussoukro",
-    "Ouagadougou", "Bamako", "Accra", "Conakry", "Freetown", "Monrovia", "Dakar", "Bissau", "Mogadishu", "Addis Ababa",
-    "Milan", "Dubai", "Sydney", "Rabat", "Algiers", "Tripoli", "Tunis", "Nouakchott", "Niamey", "Ndjamena", "Lusaka",
-    "Harare", "Gaborone", "Windhoek", "Lilongwe", "Maputo", "Kampala", "Dodoma", "Antananarivo", "Victoria", "Port Louis",
-    "Male", "Colombo", "Islamabad", "Kabul", "Kathmandu", "Thimphu", "Dhaka", "Bandar Seri Begawan", "Kuala Lumpur", "Singapore",
-    "Rangoon", "Vientiane", "Phnom Penh", "Ulaanbaatar", "Bishkek", "Tashkent", "Dushanbe", "Ashgabat", "Astana", "Baku",
-    "Yerevan", "Tbilisi", "Nicosia", "Valletta", "San Marino", "Vaduz", "Luxembourg", "Monaco", "Andorra la Vella",
-    "Reykjavik", "Port Moresby", "Majuro", "Tarawa", "Ngerulmud", "Honiara", "Palikir", "Funafuti", "Nouméa", "Port Vila",
-    "Pago Pago", "Saipan", "Melekeok", "Dili", "Moroni", "Djibouti", "Libreville", "Brazzaville", "Kinshasa", "Malabo",
-    "Bangui", "Yaoundé", "Abuja", "Cotonou", "Lomé", "Porto-Novo", "Luanda", "Moroni", "Malé", "Vatican City", "Bratislava"
-]
-
-@retry(stop=stop_after_attempt(5), wait=wait_fixed(2))
+# Created by serve() once the environment has been validated
+bot: Optional[Bot] = None
+
+# Bounded generation pool shared by the bot and the Zapier endpoint on one event loop
+scheduler = GenerationScheduler(
+    workers=int(os.getenv('GENERATION_WORKERS', '2')),
+    queue_size=int(os.getenv('GENERATION_QUEUE_SIZE', '10'))
+)
+
+# Pooled async client for channel posts, so no worker blocks on curl or the image download
+image_client = ImageClient(openai_api_key, response_format=IMAGE_RESPONSE_FORMAT)
+
+# Retries back off without blocking a worker; the breaker fails fast while the API is down
+retry_policy = RetryPolicy(attempts=5, base_delay=2, breaker=CircuitBreaker())
+
+# Per-user limits, kept in SQLite so they are shared with the main bot and survive restarts
+rate_limiter = RateLimiter.from_config(
+    {
+        'cooldown_minutes': float(os.getenv('COOLDOWN_MINUTES', '5')),
+        'max_daily_memes': int(os.getenv('MAX_DAILY_MEMES', '50'))
+    },
+    {'store': 'sqlite', 'db_path': os.getenv('RATE_LIMIT_DB', 'bot_data.db')}
+)
+
+# Each chat, and the channel, walks through every slogan and city pairing before one repeats
+rotation = PromptRotation()
+
 def generate_meme(slogan: str, meme_idea: str) -> BytesIO:
     """
     Generate a meme image based on the given slogan and meme idea using the OpenAI API via a cURL command.
@@ -137,13 +103,17 @@ def generate_meme(slogan: str, meme_idea: str) -> BytesIO:
     
     Raises:
         subprocess.CalledProcessError: If an error occurs during the cURL request.
+        ImageAPIError: If the API response carries no image.
     """
+    # Only needed once the bot is generating; kept off the startup path
+    import requests
+
     try:
         # Combine the slogan and meme idea to create the full prompt
         full_prompt = f"{slogan}\n{meme_idea}"
 
         # Log the full prompt for debugging
-        logger.debug(f"Full prompt: {full_prompt}")
+        logger.debug("Full prompt: %s", full_prompt)
 
         # JSON data for the API request
         data = json.dumps({
@@ -152,7 +122,7 @@ def generate_meme(slogan: str, meme_idea: str) -> BytesIO:
             "n": 1,
             "size": "1024x1024",
             "quality": "hd",
-            "response_format": "url"
+            "response_format": IMAGE_RESPONSE_FORMAT
         })
 
         # Constructing the cURL command for the API request
@@ -160,33 +130,44 @@ def generate_meme(slogan: str, meme_idea: str) -> BytesIO:
             "curl", "-X", "POST", "https://api.openai.com/v1/images/generations",
             "-H", "Content-Type: application/json",
             "-H", f"Authorization: Bearer {openai_api_key}",
-            "-d", data
+            "-d", data,
+            "-w", "\n%{http_code}"
         ]
 
         # Executing the cURL command and capturing the response
-        response = subprocess.run(curl_command, capture_output=True, text=True, check=True)
-        response_data = json.loads(response.stdout)
-
-        # Log the response for debugging
-        logger.debug(f"OpenAI API response: {response_data}")
+        response = subprocess.run(curl_command, capture_output=True, check=True)
+        body, _, status = response.stdout.rpartition(b'\n')
+        status = status.decode()
+        decoder = InlineImageDecoder()
+        try:
+            # Decodes an inline image without building the base64 text as a str
+            decoder.feed(body)
+            response_data = decoder.close()
+        except ValueError:
+            # Gateways answer 502/503 with HTML
+            response_data = {}
+
+        # Log the response for debugging, without the image
+        logger.debug("OpenAI API response: %s", response_data.get('error') or 'image received')
 
         # Check for the 'data' key in the response
         if 'data' not in response_data:
             logger.error(f"API response does not contain 'data' key: {response_data}")
-            if 'error' in response_data and response_data['error']['code'] == 'billing_hard_limit_reached':
-                raise RuntimeError("Billing limit reached. Cannot generate more images.")
-            raise KeyError("'data' key not found in the API response")
-
-        # Extract the URL of the generated image from the response
-        image_url = response_data['data'][0]['url']
-
-        # Download the generated image
-        response_image = Image.open(BytesIO(requests.get(image_url).content))
-
-        # Save the generated image to a bytes buffer
-        output = BytesIO()
-        response_image.save(output, format='PNG')
-        output.seek(0)
+            error = response_data.get('error') or {}
+            raise ImageAPIError(
+                error.get('message', f"Unexpected API response ({status})"),
+                code=error.get('code'),
+                status=int(status) if status.isdigit() else None
+            )
+
+        # Forward the original bytes without re-encoding, downloading them when they are not inline
+        entry = response_data['data'][0]
+        if 'image' in entry:
+            output = image_buffer(entry['image'])
+        else:
+            image_response = requests.get(entry['url'], timeout=30)
+            image_response.raise_for_status()
+            output = image_buffer(image_response.content)
         logger.info("Meme generated successfully.")
         return output
     except subprocess.CalledProcessError as e:
@@ -206,10 +187,15 @@ async def meme_command(update: Update, context: CallbackContext) -> None:
     user = update.message.from_user
     username = user.username if user.username else user.first_name
 
+    decision = await rate_limiter.check(user.id, update.message.chat_id)
+    if not decision.allowed:
+        minutes = max(1, math.ceil(decision.retry_after / 60))
+        await update.message.reply_text(f"Please wait {minutes} minutes before generating another meme.")
+        return
+
     try:
-        # Randomly select a slogan, meme idea, and a capital city
-        slogan, meme_idea = random.choice(slogans_and_ideas)
-        capital_city = random.choice(capital_cities)
+        # Next slogan, meme idea, and capital city this chat hasn't seen
+        slogan, meme_idea, capital_city = await rotation.next(update.message.chat_id)
 
         # Append the capital city to the meme idea
         meme_idea_with_city = f"{meme_idea} The scene is set in {capital_city}."
@@ -217,7 +203,7 @@ async def meme_command(update: Update, context: CallbackContext) -> None:
         logger.info("Generating meme for user %s with slogan: '%s' and meme idea: '%s'", username, slogan, meme_idea_with_city)
 
         # Generate meme
-        meme_image = generate_meme(slogan, meme_idea_with_city)
+        meme_image = await retry_policy.call(asyncio.to_thread, generate_meme, slogan, meme_idea_with_city)
         if meme_image:
             # Send the meme back to the user with additional text
             caption = f"{slogan}\nEarn $WHIVE - http://nyukia.ai 💸"
@@ -226,106 +212,195 @@ async def meme_command(update: Update, context: CallbackContext) -> None:
         else:
             # Inform the user about the error
             await update.message.reply_text("Sorry, there was an error generating your meme. Please try again later.")
-    except RuntimeError as e:
-        if str(e) == "Billing limit reached. Cannot generate more images.":
+    except CircuitOpenError:
+        await update.message.reply_text("Sorry, image generation is temporarily unavailable. Please try again in a few minutes.")
+    except ImageAPIError as e:
+        if e.code == 'billing_hard_limit_reached':
             await update.message.reply_text("Sorry, the billing limit for image generation has been reached. Please try again later.")
         else:
-            logger.error(f"Runtime error: {e}")
+            logger.error(f"Image API error: {e}")
             await update.message.reply_text("Sorry, there was an error generating your meme. Please try again later.")
     except Exception as e:
         logger.error(f"Error generating meme: {e}")
         await update.message.reply_text("Sorry, there was an error generating your meme. Please try again later.")
 
-async def post_to_telegram(meme_image: BytesIO, caption: str) -> bool:
+async def post_to_telegram(meme_image: BytesIO, caption: str, chat_id: str = None) -> bool:
     """Post the generated meme to the Telegram channel."""
+    # Every channel post is a fresh generation, so there is never a known file_id to reuse
     try:
-        await bot.send_photo(chat_id=TELEGRAM_CHANNEL_ID, photo=meme_image, caption=caption)
+        await bot.send_photo(chat_id=chat_id or TELEGRAM_CHANNEL_ID, photo=meme_image, caption=caption)
         logger.info("Meme successfully posted to Telegram channel.")
         return True
     except Exception as e:
         logger.error(f"Error posting to Telegram: {e}")
         return False
 
-# Flask app to handle Zapier requests
-app = Flask(__name__)
-
-@app.route('/generate_meme', methods=['POST'])
-def generate_meme_zapier():
-    """Endpoint to generate a meme and post to Telegram when called by Zapier."""
+async def generate_image_for_zapier(prompt: str):
+    """Generate an image for the channel post and return its URL (None when inline) and bytes."""
+    result = await image_client.create_image(prompt, quality="hd")
+    if 'image' in result:
+        return None, image_buffer(result['image'])
+
+    # Download and prepare the image for Telegram
+    image_url = result['url']
+    return image_url, image_buffer(await image_client.download(image_url))
+
+def compose_channel_post(slogan: str, meme_idea: str, capital_city: str):
+    """Return the image prompt and caption for a channel post."""
+    meme_idea_with_city = f"{meme_idea} The scene is set in {capital_city}."
+    return f"{slogan}\n{meme_idea_with_city}", f"{slogan}\nEarn $WHIVE - http://nyukia.ai 💸"
+
+async def generate_channel_image(prompt: str) -> bytes:
+    """Generate a calendar post ahead of its slot through the shared bounded pool."""
+    job = scheduler.submit(retry_policy.call, generate_image_for_zapier, prompt)
+    _, meme_image = await job.result()
+    return meme_image.getvalue()
+
+async def send_channel_post(channel_id: str, meme_image: BytesIO, caption: str) -> bool:
+    return await post_to_telegram(meme_image, caption, chat_id=channel_id)
+
+# How many finished Zapier jobs to remember for the status endpoint
+MAX_CHANNEL_JOBS = 500
+
+@dataclass
+class ChannelJob:
+    slogan: str
+    caption: str
+    id: str = field(default_factory=lambda: uuid.uuid4().hex)
+    status: str = "queued"
+    image_url: Optional[str] = None
+    error: Optional[str] = None
+    created: float = field(default_factory=time.time)
+    finished: Optional[float] = None
+
+channel_jobs: "OrderedDict[str, ChannelJob]" = OrderedDict()
+background_tasks = set()
+
+async def generate_for_channel_job(channel_job: ChannelJob, prompt: str):
+    """Scheduler job: generate the image once a worker is free."""
+    channel_job.status = "generating"
+    return await retry_policy.call(generate_image_for_zapier, prompt)
+
+async def complete_channel_job(channel_job: ChannelJob, job) -> None:
+    """Wait for the generated image and post it to the channel."""
     try:
-        # Randomly select a slogan, meme idea, and a capital city
-        slogan, meme_idea = random.choice(slogans_and_ideas)
-        capital_city = random.choice(capital_cities)
-        meme_idea_with_city = f"{meme_idea} The scene is set in {capital_city}."
-
-        logger.info("Generating meme for Zapier with slogan: '%s' and meme idea: '%s'", slogan, meme_idea_with_city)
-
-        # Generate meme and get the URL
-        data = json.dumps({
-            "model": "dall-e-3",
-            "prompt": f"{slogan}\n{meme_idea_with_city}",
-            "n": 1,
-            "size": "1024x1024",
-            "quality": "hd",
-            "response_format": "url"
-        })
-
-        curl_command = [
-            "curl", "-X", "POST", "https://api.openai.com/v1/images/generations",
-            "-H", "Content-Type: application/json",
-            "-H", f"Authorization: Bearer {openai_api_key}",
-            "-d", data
-        ]
-
-        response = subprocess.run(curl_command, capture_output=True, text=True, check=True)
-        response_data = json.loads(response.stdout)
-        image_url = response_data['data'][0]['url']
-
-        # Download and prepare the image for Telegram
-        meme_image = BytesIO(requests.get(image_url).content)
-        caption = f"{slogan}\nEarn $WHIVE - http://nyukia.ai 💸"
-
-        # Post to Telegram
-        telegram_success = post_to_telegram(meme_image, caption)
-
-        if telegram_success:
-            return jsonify({
-                "status": "success",
-                "message": "Meme posted to Telegram successfully.",
-                "data": {
-                    "image_url": image_url,
-                    "slogan": slogan,
-                    "caption": caption
-                }
-            }), 200
+        channel_job.image_url, meme_image = await job.result()
+        channel_job.status = "posting"
+        if await post_to_telegram(meme_image, channel_job.caption):
+            channel_job.status = "posted"
         else:
-            return jsonify({
-                "status": "error",
-                "message": "Failed to post meme to Telegram.",
-                "data": {
-                    "image_url": image_url,
-                    "slogan": slogan,
-                    "caption": caption
-                }
-            }), 500
+            channel_job.status = "failed"
+            channel_job.error = "Failed to post meme to Telegram."
     except Exception as e:
-        logger.error(f"Error in generate_meme_zapier: {e}")
-        return jsonify({
-            "status": "error",
-            "message": str(e)
-        }), 500
+        logger.error(f"Zapier job {channel_job.id} failed: {e}")
+        channel_job.status = "failed"
+        channel_job.error = str(e)
+    finally:
+        channel_job.finished = time.time()
+
+async def generate_meme_zapier(request: Request) -> JSONResponse:
+    """Endpoint called by Zapier; queues a meme for the channel and returns a job id right away."""
+    # Shares the channel's rotation with the scheduled posts
+    slogan, meme_idea, capital_city = await rotation.next(TELEGRAM_CHANNEL_ID)
+    prompt, caption = compose_channel_post(slogan, meme_idea, capital_city)
+    channel_job = ChannelJob(slogan=slogan, caption=caption)
 
-if __name__ == '__main__':
-    validate_environment()
-    # Run the Flask app to handle incoming requests from Zapier
-    app.run(host='0.0.0.0', port=5000)
-
-    # Create the Telegram bot application
-    application = ApplicationBuilder().token(TOKEN).build()
+    try:
+        # Generate meme through the shared bounded pool
+        job = scheduler.submit(generate_for_channel_job, channel_job, prompt)
+    except QueueFullError:
+        logger.warning("Generation queue is full, rejecting Zapier request")
+        return JSONResponse({
+            "status": "busy",
+            "message": "Meme generator is busy, please retry later."
+        }, status_code=503)
+
+    logger.info("Queued Zapier job %s at position %d with slogan: '%s'", channel_job.id, job.position, slogan)
+    channel_jobs[channel_job.id] = channel_job
+    while len(channel_jobs) > MAX_CHANNEL_JOBS:
+        channel_jobs.popitem(last=False)
+
+    task = asyncio.create_task(complete_channel_job(channel_job, job))
+    background_tasks.add(task)
+    task.add_done_callback(background_tasks.discard)
+
+    return JSONResponse({
+        "status": "accepted",
+        "job_id": channel_job.id,
+        "status_url": str(request.url_for('job_status', job_id=channel_job.id))
+    }, status_code=202)
+
+async def job_status(request: Request) -> JSONResponse:
+    """Report the progress of a Zapier job."""
+    channel_job = channel_jobs.get(request.path_params['job_id'])
+    if channel_job is None:
+        return JSONResponse({"status": "error", "message": "Unknown job id."}, status_code=404)
+    return JSONResponse({
+        "job_id": channel_job.id,
+        "status": channel_job.status,
+        "data": {
+            "image_url": channel_job.image_url,
+            "slogan": channel_job.slogan,
+            "caption": channel_job.caption
+        },
+        "error": channel_job.error,
+        "created": channel_job.created,
+        "finished": channel_job.finished
+    })
+
+# Zapier/cron endpoint, served on the same event loop as the bot
+app = Starlette(routes=[
+    Route('/generate_meme', generate_meme_zapier, methods=['POST']),
+    Route('/jobs/{job_id}', job_status, methods=['GET'], name='job_status'),
+])
+
+async def serve() -> None:
+    """Run the bot and the Zapier endpoint together until interrupted."""
+    global bot
+    application = ApplicationBuilder().token(TOKEN).concurrent_updates(UpdateProcessor(16)).build()
+    bot = application.bot
 
     # Add handlers for the bot commands and messages
     application.add_handler(CommandHandler("meme", meme_command))
 
-    # Start the bot and run it until manually stopped
-    logger.info("Starting the bot...")
-    application.run_polling()
\ No newline at end of file
+    channel_poster = None
+    if CHANNEL_SCHEDULE:
+        schedules = [
+            register_schedule(TELEGRAM_CHANNEL_ID, expression.strip(), CHANNEL_MISSED_POSTS, CHANNEL_LEAD_MINUTES)
+            for expression in CHANNEL_SCHEDULE.split(';') if expression.strip()
+        ]
+        channel_poster = ChannelPoster(
+            schedules,
+            rotation,
+            compose_channel_post,
+            generate_channel_image,
+            send_channel_post
+        )
+
+    server = GracefulServer(uvicorn.Config(app, host='0.0.0.0', port=int(os.getenv('PORT', '5000'))))
+    async with application:
+        # Open the API connections now rather than on the first meme
+        await warm_up({
+            'image API': lambda: image_client.warm_up(2),
+            'Bot API': lambda: warm_telegram(bot, 2)
+        })
+        await scheduler.start()
+        await application.start()
+        await application.updater.start_polling()
+        if channel_poster:
+            await channel_poster.start()
+        logger.info("Starting the bot and the Zapier endpoint...")
+        try:
+            await server.serve()
+        finally:
+            if channel_poster:
+                await channel_poster.stop()
+            await application.updater.stop()
+            await application.stop()
+            await scheduler.stop()
+            await image_client.aclose()
+
+if __name__ == '__main__':
+    validate_environment()
+    init_db()
+    asyncio.run(serve())
\ No newline at end of file
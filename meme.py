@@ -2,22 +2,34 @@ import logging
 import os
 import subprocess
 import json
-import random
+import secrets
 from telegram import Update, Chat, Bot
 from telegram.ext import ApplicationBuilder, CommandHandler, MessageHandler, filters, CallbackContext
 from io import BytesIO
-from PIL import Image
-import requests
-from tenacity import retry, stop_after_attempt, wait_fixed
 import asyncio
-
-# Configure logging
-logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
+import sys
+
+# Share image helpers with the bot in project/src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'project'))
+from src.image_utils import image_buffer
+from src.catalog import PromptRotation
+from src.database import init_db, start_writer, stop_writer
+from src.deferred import DeferredActions
+from src.compositor import MemeCompositor
+from src.image_client import ImageAPIError, InlineImageDecoder
+from src.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
+from src.updates import UpdateProcessor
+from src.log_pipeline import start_logging
+
+# Configure logging; a background thread writes the records, off the event loop
+start_logging(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # OpenAI API key and Telegram bot token from environment variables
 openai_api_key = os.getenv('OPENAI_API_KEY')
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# b64_json returns the image with the generation response; url fetches it in a second request
+IMAGE_RESPONSE_FORMAT = os.getenv('IMAGE_RESPONSE_FORMAT', 'b64_json')
 
 if not openai_api_key:
     logger.error("API key not found in environment. Please set OPENAI_API_KEY.")
@@ -27,89 +39,19 @@ if not TOKEN:
     logger.error("Telegram bot token not found in environment. Please set TELEGRAM_BOT_TOKEN.")
     exit()
 
-# List of slogans and meme ideas
-slogans_and_ideas = [
-    ("Bee the Change. Power the World.", "A happy bee holding a miniature solar panel, with a background of CPUs mining in the hive."),
-    ("Hive Together, Thrive Together.", "Happy Bees forming a chain, representing a blockchain, with smiling faces as they connect to each other."),
-    ("Buzzing Towards a Greener Future.", "A happy bee flying towards a sun, with solar panels beneath and energy lines connecting the world."),
-    ("Small Buzz, Big Impact.", "A small bee with a huge lightning bolt, symbolizing that CPU mining with Whive has a big environmental impact."),
-    ("Proof of Work, Proof of Honey.", "A happy bee dressed as a miner with coins that look like honey dripping, symbolizing mining rewards."),
-    ("Let Your CPU Bee Part of the Swarm.", "A happy bee sitting on a laptop with a 'Join the Hive' button on screen, showing CPU mining activity."),
-    ("The Hive is Stronger When We Buzz Together.", "Multiple Happy Bees with mining hats working together to build a stronger hive, showcasing network collaboration."),
-    ("CPU Power, Green Future.", "A happy bee plugging a CPU into a tree, with energy flowing from the tree into the hive."),
-    ("Empower the Hive, Harvest the Future.", "Happy Bees collecting honey while solar panels charge the hive, emphasizing energy harvesting."),
-    ("Sustainable Rewards, Sweet as Honey.", "Happy Bees flying with honey jars filled with digital rewards, showing that renewable energy rewards are sweet."),
-    ("Bee Smart. Bee Renewable.", "A happy bee holding a lightbulb above a field of solar panels, showcasing innovation in renewable energy."),
-    ("From Hive to Hive, Decentralized Energy for All.", "Happy Bees flying between hives exchanging energy, symbolizing peer-to-peer decentralized energy trading."),
-    ("Power Up Your Hive, One CPU at a Time.", "A happy bee installing a CPU into a hive, powering it up like a battery."),
-    ("Buzz Around the World with Green Energy.", "Happy Bees carrying a globe with solar panels covering it, representing sustainable energy."),
-    ("Bee Efficient, Bee Rewarded.", "A happy bee mining with a pickaxe, surrounded by honeycombs that represent block rewards."),
-    ("Mining for a Better Buzz.", "A happy bee miner with a smile, holding a chunk of honey labeled 'Green Rewards.'"),
-    ("The Buzzing Network of Sustainable Growth.", "Happy Bees flying around a blockchain, leaving behind flowers that bloom, showing sustainable growth."),
-    ("Bee the Proof-of-Work in a Sustainable World.", "A happy bee holding up a 'Proof of Work' sign above a lush field, symbolizing energy-efficient mining."),
-    ("Buzz Responsibly, Mine Sustainably.", "A happy bee miner next to solar panels, emphasizing environmentally friendly mining."),
-    ("Hive Mind for Renewable Energy.", "A group of Happy Bees in a conference room, planning how to implement solar energy."),
-    ("Buzzing Past ASICs to Bring Power to the People.", "A happy bee zooming past large mining machines labeled 'ASICs,' reaching the people instead."),
-    ("Buzz Lightyear! From Solar to Blockchain!", "A happy bee dressed as Buzz Lightyear flying into the blockchain with a solar panel backpack."),
-    ("Be the Buzz, Energize the Future.", "A happy bee buzzing around a battery icon, slowly filling it up with energy."),
-    ("Hive with Us. Change the Future.", "A happy bee inviting others into a hive, which has a banner reading 'Welcome to the Future.'"),
-    ("Green Energy? We've Got the Buzz for It!", "Happy Bees working in a hive full of green leaves, symbolizing green energy and sustainability."),
-    ("Buzz Where It's Needed – CPU Mining for All!", "A happy bee on a laptop, flying across a world map to represent decentralizing mining to all locations."),
-    ("Hive Together, Win Together!", "Happy Bees exchanging honey jars labeled 'Rewards,' showcasing the idea of collective benefits."),
-    ("Proof of Honey, Powered by Green Energy.", "Happy Bees producing honey in a field of solar panels, emphasizing proof-of-work tied to renewable energy."),
-    ("Sweet Rewards for Green Energy Pioneers.", "A happy bee presenting a golden honey jar to another bee with a 'Pioneer' badge."),
-    ("Bee a Pioneer, Buzz Sustainably.", "A happy bee explorer planting a flag that reads 'Green Energy Champion.'"),
-    ("Bee Renewable, Bee Rewarded.", "A happy bee flying in circles around solar panels while receiving digital honey rewards."),
-    ("The Hive Network Buzzing with Energy.", "A network of Happy Bees connecting their hives with electric cables representing blockchain nodes."),
-    ("One Hive, One Mission – Sustainability.", "Happy Bees carrying signs reading 'Green Future' and 'Sustainable Mining' marching together."),
-    ("Hive Hard, Earn Sweet.", "A happy bee miner with a honeycomb backpack labeled 'Sweet Rewards,' mining on solar power."),
-    ("Buzz Beyond Borders – Global Mining.", "A happy bee flying over a globe with countries lighting up, symbolizing the global nature of mining."),
-    ("Let’s Hive to Survive.", "Happy Bees flying with determination towards renewable energy sources to protect their hive."),
-    ("Green Energy, Golden Rewards.", "A happy bee turning sunlight into golden honey coins, symbolizing green rewards for clean energy."),
-    ("Hive Smart, Buzz Efficient.", "A happy bee using a laptop, generating a honeycomb full of coins, symbolizing intelligent and efficient mining."),
-    ("Buzzin' Beyond ASICs – Join the Hive!", "A happy bee with crossed-out ASIC mining machines, showing a preference for CPU mining."),
-    ("For the Planet, For the Buzz.", "Happy Bees planting trees, with coins floating above them, representing benefits for both the hive and the planet."),
-    ("Buzz Together for a Brighter Tomorrow.", "A field full of solar-powered bee hives, with rays of sunlight shining down on them."),
-    ("Mining Made for Every Bee.", "Happy Bees in different outfits (worker bee, student bee, etc.) mining with laptops, showing inclusivity."),
-    ("Swarm the Future with Renewable Buzz.", "A swarm of Happy Bees flying towards a glowing future, representing a transition to sustainable energy."),
-    ("Decentralized Mining – Let It Bee.", "A happy bee with mining gear pointing to the blockchain hive and saying 'Let it bee.'"),
-    ("Renewable Energy? It’s the Happy Bees Knees!", "A happy bee showing its knees while solar panels are connected to the hive, emphasizing energy."),
-    ("Buzz Power, Not Fossil Power.", "Happy Bees turning away from an oil pumpjack towards a field of solar panels."),
-    ("Hive Now for a Sustainable Future.", "Happy Bees building a hive with green leaves growing on it, representing future sustainability."),
-    ("Bee the Miner the World Needs.", "A heroic-looking bee holding a CPU chip like a superhero, symbolizing energy-efficient mining."),
-    ("We Bee-Lieve in Sustainable Mining.", "A group of Happy Bees cheering with a banner saying 'Sustainable Mining Rocks.'"),
-    ("CPU Power is Bee Power!", "A happy bee holding a CPU chip, with energy radiating towards a hive."),
-    ("Hive On, Shine On.", "Happy Bees in a solar-powered hive with a sun shining above, representing the power of renewable energy."),
-    ("Join the Hive, Earn the Buzz.", "A happy bee buzzing in a circle with coins, inviting others to join in for rewards."),
-    ("Sustainable Mining is the Bees’ Buzz.", "Happy Bees having a meeting and discussing how to keep mining sustainable."),
-    ("Buzzing with Green Energy Rewards.", "A happy bee flying with honey pots labeled 'Green Rewards,' showing how sustainable mining pays off."),
-    ("Buzz Light, Mine Right.", "Happy Bees mining with solar-powered tools under the sunlight, showcasing responsible mining."),
-    ("Together We Thrive, Together We Hive.", "Happy Bees working in harmony, building a giant hive, representing a collaborative effort."),
-    ("Power the Buzz, Protect the Hive.", "A happy bee guarding the hive while other Happy Bees generate power using CPUs, symbolizing community protection."),
-    ("Bee Green, Bee Strong.", "Happy Bees using renewable energy to strengthen their hive, showcasing a collective effort."),
-    ("CPU Mining – Buzz for the Future.", "A happy bee flying through a futuristic landscape full of solar panels, representing mining for the future.")
-]
-
-# List of random capital cities
-capital_cities = [
-    "Nairobi", "Tokyo", "Paris", "London", "Berlin", "Brasília", "Canberra", "Ottawa", "Washington D.C.", "Beijing",
-    "Moscow", "Cairo", "Buenos Aires", "New Delhi", "Rome", "Madrid", "Seoul", "Bangkok", "Jakarta", "Pretoria",
-    "Helsinki", "Oslo", "Stockholm", "Lisbon", "Vienna", "Bern", "Amsterdam", "Brussels", "Dublin", "Warsaw",
-    "Athens", "Havana", "Kingston", "Kigali", "Baghdad", "New York", "Riyadh", "Hanoi", "Manila", "Santiago",
-    "Lima", "Bogotá", "Caracas", "Quito", "San José", "Panama City", "Port-au-Prince", "Kingstown", "Castries", "Nassau",
-    "Georgetown", "Paramaribo", "Port of Spain", "Bridgetown", "Belmopan", "Suva", "Apia", "Wellington", "Yamoussoukro",
-    "Ouagadougou", "Bamako", "Accra", "Conakry", "Freetown", "Monrovia", "Dakar", "Bissau", "Mogadishu", "Addis Ababa",
-    "Milan", "Dubai", "Sydney", "Rabat", "Algiers", "Tripoli", "Tunis", "Nouakchott", "Niamey", "Ndjamena", "Lusaka",
-    "Harare", "Gaborone", "Windhoek", "Lilongwe", "Maputo", "Kampala", "Dodoma", "Antananarivo", "Victoria", "Port Louis",
-    "Male", "Colombo", "Islamabad", "Kabul", "Kathmandu", "Thimphu", "Dhaka", "Bandar Seri Begawan", "Kuala Lumpur", "Singapore",
-    "Rangoon", "Vientiane", "Phnom Penh", "Ulaanbaatar", "Bishkek", "Tashkent", "Dushanbe", "Ashgabat", "Astana", "Baku",
-    "Yerevan", "Tbilisi", "Nicosia", "Valletta", "San Marino", "Vaduz", "Luxembourg", "Monaco", "Andorra la Vella",
-    "Reykjavik", "Port Moresby", "Majuro", "Tarawa", "Ngerulmud", "Honiara", "Palikir", "Funafuti", "Nouméa", "Port Vila",
-    "Pago Pago", "Saipan", "Melekeok", "Dili", "Moroni", "Djibouti", "Libreville", "Brazzaville", "Kinshasa", "Malabo",
-    "Bangui", "Yaoundé", "Abuja", "Cotonou", "Lomé", "Porto-Novo", "Luanda", "Moroni", "Malé", "Vatican City", "Bratislava"
-]
-
-@retry(stop=stop_after_attempt(5), wait=wait_fixed(2))
+# Local renderer used instead of the API once the billing limit is hit
+compositor = MemeCompositor(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bee_template.png'))
+
+# Retries back off without blocking the event loop; the breaker switches to the compositor when the API is down
+retry_policy = RetryPolicy(attempts=5, base_delay=2, breaker=CircuitBreaker())
+
+# Welcome messages are removed this long after they are sent; pending deletions survive restarts
+WELCOME_MESSAGE_SECONDS = 15
+deferred_actions = DeferredActions()
+
+# Each chat walks through every slogan and city pairing before one repeats
+rotation = PromptRotation()
+
 def generate_meme(slogan: str, meme_idea: str) -> BytesIO:
     """
     Generate a meme image based on the given slogan and meme idea using the OpenAI API via a cURL command.
@@ -123,13 +65,17 @@ def generate_meme(slogan: str, meme_idea: str) -> BytesIO:
     
     Raises:
         subprocess.CalledProcessError: If an error occurs during the cURL request.
+        ImageAPIError: If the API response carries no image.
     """
+    # Only needed once the bot is generating; kept off the startup path
+    import requests
+
     try:
         # Combine the slogan and meme idea to create the full prompt
         full_prompt = f"{slogan}\n{meme_idea}"
 
         # Log the full prompt for debugging
-        logger.debug(f"Full prompt: {full_prompt}")
+        logger.debug("Full prompt: %s", full_prompt)
 
         # JSON data for the API request
         data = json.dumps({
@@ -138,7 +84,7 @@ def generate_meme(slogan: str, meme_idea: str) -> BytesIO:
             "n": 1,
             "size": "1024x1024",
             "quality": "hd",
-            "response_format": "url"
+            "response_format": IMAGE_RESPONSE_FORMAT
         })
 
         # Constructing the cURL command for the API request
@@ -146,33 +92,44 @@ def generate_meme(slogan: str, meme_idea: str) -> BytesIO:
             "curl", "-X", "POST", "https://api.openai.com/v1/images/generations",
             "-H", "Content-Type: application/json",
             "-H", f"Authorization: Bearer {openai_api_key}",
-            "-d", data
+            "-d", data,
+            "-w", "\n%{http_code}"
         ]
 
         # Executing the cURL command and capturing the response
-        response = subprocess.run(curl_command, capture_output=True, text=True, check=True)
-        response_data = json.loads(response.stdout)
+        response = subprocess.run(curl_command, capture_output=True, check=True)
+        body, _, status = response.stdout.rpartition(b'\n')
+        status = status.decode()
+        decoder = InlineImageDecoder()
+        try:
+            # Decodes an inline image without building the base64 text as a str
+            decoder.feed(body)
+            response_data = decoder.close()
+        except ValueError:
+            # Gateways answer 502/503 with HTML
+            response_data = {}
 
-        # Log the response for debugging
-        logger.debug(f"OpenAI API response: {response_data}")
+        # Log the response for debugging, without the image
+        logger.debug("OpenAI API response: %s", response_data.get('error') or 'image received')
 
         # Check for the 'data' key in the response
         if 'data' not in response_data:
             logger.error(f"API response does not contain 'data' key: {response_data}")
-            if 'error' in response_data and response_data['error']['code'] == 'billing_hard_limit_reached':
-                raise RuntimeError("Billing limit reached. Cannot generate more images.")
-            raise KeyError("'data' key not found in the API response")
-
-        # Extract the URL of the generated image from the response
-        image_url = response_data['data'][0]['url']
-
-        # Download the generated image
-        response_image = Image.open(BytesIO(requests.get(image_url).content))
-
-        # Save the generated image to a bytes buffer
-        output = BytesIO()
-        response_image.save(output, format='PNG')
-        output.seek(0)
+            error = response_data.get('error') or {}
+            raise ImageAPIError(
+                error.get('message', f"Unexpected API response ({status})"),
+                code=error.get('code'),
+                status=int(status) if status.isdigit() else None
+            )
+
+        # Forward the original bytes without re-encoding, downloading them when they are not inline
+        entry = response_data['data'][0]
+        if 'image' in entry:
+            output = image_buffer(entry['image'])
+        else:
+            image_response = requests.get(entry['url'], timeout=30)
+            image_response.raise_for_status()
+            output = image_buffer(image_response.content)
         logger.info("Meme generated successfully.")
         return output
     except subprocess.CalledProcessError as e:
@@ -199,9 +156,8 @@ async def meme_command(update: Update, context: CallbackContext) -> None:
             return
 
     try:
-        # Randomly select a slogan, meme idea, and a capital city
-        slogan, meme_idea = random.choice(slogans_and_ideas)
-        capital_city = random.choice(capital_cities)
+        # Next slogan, meme idea, and capital city this chat hasn't seen
+        slogan, meme_idea, capital_city = await rotation.next(update.message.chat_id)
 
         # Append the capital city to the meme idea
         meme_idea_with_city = f"{meme_idea} The scene is set in {capital_city}. Draw in Tin Tin meme style."
@@ -209,7 +165,7 @@ async def meme_command(update: Update, context: CallbackContext) -> None:
         logger.info("Generating meme for user %s with slogan: '%s' and meme idea: '%s'", username, slogan, meme_idea_with_city)
 
         # Generate meme
-        meme_image = generate_meme(slogan, meme_idea_with_city)
+        meme_image = await retry_policy.call(asyncio.to_thread, generate_meme, slogan, meme_idea_with_city)
         if meme_image:
             # Send the meme back to the user with additional text
             caption = f"{slogan} To Bee or Not To Bee in {capital_city}🐝\n Play to Earn $WHIVE Trivia Game- http://nyukia.ai 💸"
@@ -218,11 +174,15 @@ async def meme_command(update: Update, context: CallbackContext) -> None:
         else:
             # Inform the user about the error
             await update.message.reply_text("Sorry, there was an error generating your meme. Please try again later.")
-    except RuntimeError as e:
-        if str(e) == "Billing limit reached. Cannot generate more images.":
-            await update.message.reply_text("Sorry, the billing limit for image generation has been reached. Please try again later.")
+    except (ImageAPIError, CircuitOpenError) as e:
+        if isinstance(e, CircuitOpenError) or e.code == 'billing_hard_limit_reached':
+            # Fall back to a locally rendered meme from the bee template
+            meme_image = await asyncio.to_thread(compositor.render, slogan, capital_city)
+            caption = f"{slogan} To Bee or Not To Bee in {capital_city}🐝\n Play to Earn $WHIVE Trivia Game- http://nyukia.ai 💸"
+            await update.message.reply_photo(photo=meme_image)
+            await update.message.reply_text(caption)
         else:
-            logger.error(f"Runtime error: {e}")
+            logger.error(f"Image API error: {e}")
             await update.message.reply_text("Sorry, there was an error generating your meme. Please try again later.")
     except Exception as e:
         logger.error(f"Error generating meme: {e}")
@@ -235,15 +195,20 @@ async def welcome_new_member(update: Update, context: CallbackContext) -> None:
         welcome_message = f"Welcome {username}! Type /meme to get a custom meme."
         message = await update.message.reply_text(welcome_message)
 
-        # Wait for 15 seconds and then delete the message if no response
-        await asyncio.sleep(15)
-        try:
-            await message.delete()
-        except Exception as e:
-            logger.error(f"Error deleting message: {e}")
+        # Delete the message after a while, without holding up the handler
+        deferred_actions.delete_later(message.chat_id, message.message_id, WELCOME_MESSAGE_SECONDS)
 
         logger.info("Sent welcome message to %s", username)
 
+async def startup(application) -> None:
+    """Resume the deletions left pending by the last run."""
+    await deferred_actions.start(application.bot)
+
+async def shutdown(application) -> None:
+    """Stop the deletion timer and flush queued database writes."""
+    await deferred_actions.stop()
+    stop_writer()
+
 def main() -> None:
     """Main function to run the Telegram bot."""
     # Check if the API key and token are available
@@ -251,8 +216,19 @@ def main() -> None:
         logger.error("API key or token not found. Make sure to set OPENAI_API_KEY and TELEGRAM_BOT_TOKEN environment variables.")
         return
 
+    # Rotation cursors and pending deletions live in bot_data.db, written in batches
+    init_db()
+    start_writer()
+
     # Create the Telegram bot application
-    application = ApplicationBuilder().token(TOKEN).build()
+    application = (
+        ApplicationBuilder()
+        .token(TOKEN)
+        .concurrent_updates(UpdateProcessor(32))
+        .post_init(startup)
+        .post_shutdown(shutdown)
+        .build()
+    )
 
     # Add handlers for the bot commands and messages
     application.add_handler(CommandHandler("meme", meme_command))
@@ -260,7 +236,17 @@ def main() -> None:
 
     # Start the bot and run it until manually stopped
     logger.info("Starting the bot...")
-    application.run_polling()
+    webhook_url = os.getenv('WEBHOOK_URL')
+    if webhook_url:
+        from src.webhook import WebhookServer
+        WebhookServer(
+            application,
+            os.getenv('TELEGRAM_WEBHOOK_SECRET') or secrets.token_urlsafe(32),
+            url=webhook_url,
+            port=int(os.getenv('WEBHOOK_PORT', '8443'))
+        ).run()
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
     main()
\ No newline at end of file
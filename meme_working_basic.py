@@ -5,9 +5,15 @@ import json
 from telegram import Update, Chat
 from telegram.ext import ApplicationBuilder, CommandHandler, CallbackContext
 from io import BytesIO
-from PIL import Image
 import requests
-from tenacity import retry, stop_after_attempt, wait_fixed
+import asyncio
+import sys
+
+# Share image helpers with the bot in project/src
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'project'))
+from src.image_utils import image_buffer
+from src.image_client import ImageAPIError, InlineImageDecoder
+from src.resilience import CircuitBreaker, CircuitOpenError, RetryPolicy
 
 # Configure logging
 logging.basicConfig(format='%(asctime)s - %(name)s - %(levelname)s - %(message)s', level=logging.INFO)
@@ -16,12 +22,16 @@ logger = logging.getLogger(__name__)
 # OpenAI API key and Telegram bot token from environment variables
 openai_api_key = os.getenv('OPENAI_API_KEY')
 TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
+# b64_json returns the image with the generation response; url fetches it in a second request
+IMAGE_RESPONSE_FORMAT = os.getenv('IMAGE_RESPONSE_FORMAT', 'b64_json')
 
 if not openai_api_key:
     logger.error("API key not found in environment. Please set OPENAI_API_KEY.")
     exit()
 
-@retry(stop=stop_after_attempt(5), wait=wait_fixed(2))
+# Retries back off without blocking the event loop; the breaker fails fast while the API is down
+retry_policy = RetryPolicy(attempts=5, base_delay=2, breaker=CircuitBreaker())
+
 def generate_meme(prompt: str) -> BytesIO:
     """
     Generate a meme image based on the given prompt using the OpenAI API via a cURL command.
@@ -34,13 +44,14 @@ def generate_meme(prompt: str) -> BytesIO:
     
     Raises:
         subprocess.CalledProcessError: If an error occurs during the cURL request.
+        ImageAPIError: If the API response carries no image.
     """
     try:
         # Add context to the user's input without including text in the final image
         full_prompt = f"Create an image featuring a happy and cheeky honey bee with a face resembling Pepe the Frog, wearing cultural attire of {prompt}. The bee is mining green honey-coated hexagonal coins using a CPU computer that looks like a hexagonal box. The scene is set in a picturesque and modern environment in {prompt}. The overall mood of the image should be lively and playful, capturing the humorous and symbolic nature of the meme. Ensure the image contains no text at all."
 
         # Log the full prompt for debugging
-        logger.debug(f"Full prompt: {full_prompt}")
+        logger.debug("Full prompt: %s", full_prompt)
 
         # JSON data for the API request
         data = json.dumps({
@@ -49,7 +60,7 @@ def generate_meme(prompt: str) -> BytesIO:
             "n": 1,
             "size": "1024x1024",
             "quality": "hd",
-            "response_format": "url"
+            "response_format": IMAGE_RESPONSE_FORMAT
         })
 
         # Constructing the cURL command for the API request
@@ -57,33 +68,44 @@ def generate_meme(prompt: str) -> BytesIO:
             "curl", "-X", "POST", "https://api.openai.com/v1/images/generations",
             "-H", "Content-Type: application/json",
             "-H", f"Authorization: Bearer {openai_api_key}",
-            "-d", data
+            "-d", data,
+            "-w", "\n%{http_code}"
         ]
 
         # Executing the cURL command and capturing the response
-        response = subprocess.run(curl_command, capture_output=True, text=True, check=True)
-        response_data = json.loads(response.stdout)
-
-        # Log the response for debugging
-        logger.debug(f"OpenAI API response: {response_data}")
+        response = subprocess.run(curl_command, capture_output=True, check=True)
+        body, _, status = response.stdout.rpartition(b'\n')
+        status = status.decode()
+        decoder = InlineImageDecoder()
+        try:
+            # Decodes an inline image without building the base64 text as a str
+            decoder.feed(body)
+            response_data = decoder.close()
+        except ValueError:
+            # Gateways answer 502/503 with HTML
+            response_data = {}
+
+        # Log the response for debugging, without the image
+        logger.debug("OpenAI API response: %s", response_data.get('error') or 'image received')
 
         # Check for the 'data' key in the response
         if 'data' not in response_data:
             logger.error(f"API response does not contain 'data' key: {response_data}")
-            if 'error' in response_data and response_data['error']['code'] == 'billing_hard_limit_reached':
-                raise RuntimeError("Billing limit reached. Cannot generate more images.")
-            raise KeyError("'data' key not found in the API response")
-
-        # Extract the URL of the generated image from the response
-        image_url = response_data['data'][0]['url']
-
-        # Download the generated image
-        response_image = Image.open(BytesIO(requests.get(image_url).content))
-
-        # Save the generated image to a bytes buffer
-        output = BytesIO()
-        response_image.save(output, format='PNG')
-        output.seek(0)
+            error = response_data.get('error') or {}
+            raise ImageAPIError(
+                error.get('message', f"Unexpected API response ({status})"),
+                code=error.get('code'),
+                status=int(status) if status.isdigit() else None
+            )
+
+        # Forward the original bytes without re-encoding, downloading them when they are not inline
+        entry = response_data['data'][0]
+        if 'image' in entry:
+            output = image_buffer(entry['image'])
+        else:
+            image_response = requests.get(entry['url'], timeout=30)
+            image_response.raise_for_status()
+            output = image_buffer(image_response.content)
         return output
     except subprocess.CalledProcessError as e:
         logger.error(f"Error occurred during cURL request: {e}")
@@ -117,7 +139,7 @@ async def meme_command(update: Update, context: CallbackContext) -> None:
         logger.info("Location from %s: %s", user.first_name, location)
 
         # Generate meme
-        meme_image = generate_meme(location)
+        meme_image = await retry_policy.call(asyncio.to_thread, generate_meme, location)
         if meme_image:
             # Send the meme back to the user with additional text
             await update.message.reply_photo(photo=meme_image)
@@ -125,11 +147,13 @@ async def meme_command(update: Update, context: CallbackContext) -> None:
         else:
             # Inform the user about the error
             await update.message.reply_text("Sorry, there was an error generating your meme. Please try a different location.")
-    except RuntimeError as e:
-        if str(e) == "Billing limit reached. Cannot generate more images.":
+    except CircuitOpenError:
+        await update.message.reply_text("Sorry, image generation is temporarily unavailable. Please try again in a few minutes.")
+    except ImageAPIError as e:
+        if e.code == 'billing_hard_limit_reached':
             await update.message.reply_text("Sorry, the billing limit for image generation has been reached. Please try again later.")
         else:
-            logger.error(f"Runtime error: {e}")
+            logger.error(f"Image API error: {e}")
             await update.message.reply_text("Sorry, there was an error generating your meme. Please try a different location.")
     except Exception as e:
         logger.error(f"Error generating meme: {e}")
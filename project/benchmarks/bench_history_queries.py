@@ -0,0 +1,101 @@
+"""Measure meme_history query latency before and after the index migrations.
+
+Builds a throwaway database with synthetic history, times the queries that
+daily caps, per-user stats and leaderboards need on the initial schema,
+then applies the remaining migrations and times them again.
+
+    python benchmarks/bench_history_queries.py [--rows 1000000] [--users 10000]
+"""
+import argparse
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from src.migrations import MIGRATIONS, run_migrations, schema_version
+
+QUERIES = {
+    'user daily cap': (
+        'SELECT COUNT(*) FROM meme_history WHERE user_id = ? AND timestamp >= ?',
+        lambda user, since: (user, since)
+    ),
+    'user recent memes': (
+        'SELECT slogan, timestamp FROM meme_history WHERE user_id = ? ORDER BY timestamp DESC LIMIT 10',
+        lambda user, since: (user,)
+    ),
+    # Without the hint SQLite prefers a skip-scan of the per-user index for this shape
+    'daily leaderboard': (
+        'SELECT user_id, COUNT(*) AS memes FROM meme_history INDEXED BY idx_meme_history_time_user '
+        'WHERE timestamp >= ? '
+        'GROUP BY user_id ORDER BY memes DESC LIMIT 10',
+        lambda user, since: (since,)
+    ),
+}
+
+def populate(conn: sqlite3.Connection, rows: int, users: int):
+    now = datetime.now()
+    start = now - timedelta(days=365)
+    span = (now - start).total_seconds()
+    batch = []
+    for i in range(rows):
+        timestamp = start + timedelta(seconds=span * i / rows)
+        batch.append((random.randrange(users), f"slogan {random.randrange(60)}", timestamp))
+        if len(batch) == 50000:
+            conn.executemany('INSERT INTO meme_history (user_id, slogan, timestamp) VALUES (?, ?, ?)', batch)
+            batch = []
+    conn.executemany('INSERT INTO meme_history (user_id, slogan, timestamp) VALUES (?, ?, ?)', batch)
+    conn.commit()
+
+def time_queries(conn: sqlite3.Connection, users: int, samples: int, indexed: bool) -> dict:
+    since = datetime.now() - timedelta(days=1)
+    results = {}
+    for name, (sql, params) in QUERIES.items():
+        if not indexed:
+            sql = sql.replace('INDEXED BY idx_meme_history_time_user ', '')
+        timings = []
+        for _ in range(samples):
+            start = time.perf_counter()
+            conn.execute(sql, params(random.randrange(users), since)).fetchall()
+            timings.append((time.perf_counter() - start) * 1000)
+        results[name] = (statistics.median(timings), max(timings))
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1_000_000)
+    parser.add_argument('--users', type=int, default=10_000)
+    parser.add_argument('--samples', type=int, default=20)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        conn = sqlite3.connect(os.path.join(tmp, 'bench.db'))
+        schema_version(conn)
+        MIGRATIONS[0][2](conn)
+        conn.execute(
+            'INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+            (1, MIGRATIONS[0][1], datetime.now())
+        )
+
+        start = time.perf_counter()
+        populate(conn, args.rows, args.users)
+        print(f"Inserted {args.rows} rows for {args.users} users in {time.perf_counter() - start:.1f}s\n")
+
+        before = time_queries(conn, args.users, args.samples, indexed=False)
+        start = time.perf_counter()
+        run_migrations(conn)
+        print(f"Migrated to schema v{schema_version(conn)} in {time.perf_counter() - start:.1f}s\n")
+        after = time_queries(conn, args.users, args.samples, indexed=True)
+
+        print(f"{'query':<20} {'v1 p50 ms':>10} {'v1 max ms':>10} {'new p50 ms':>11} {'new max ms':>11}")
+        for name in QUERIES:
+            print(f"{name:<20} {before[name][0]:>10.2f} {before[name][1]:>10.2f} "
+                  f"{after[name][0]:>11.3f} {after[name][1]:>11.3f}")
+        conn.close()
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,79 @@
+"""Compare the old PIL decode/re-encode download path with the pass-through path.
+
+Each mode runs in its own subprocess so peak RSS is measured independently.
+
+    python benchmarks/bench_image_path.py [--iterations 20] [--image ../bee_template.png]
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+from io import BytesIO
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_IMAGE = os.path.join(os.path.dirname(PROJECT_DIR), 'bee_template.png')
+
+def reencode(data: bytes) -> BytesIO:
+    """The path generate_meme used to take"""
+    from PIL import Image
+    output = BytesIO()
+    image = Image.open(BytesIO(data))
+    image.save(output, format='PNG')
+    output.seek(0)
+    return output
+
+def passthrough(data: bytes) -> BytesIO:
+    from src.image_utils import image_buffer
+    return image_buffer(data)
+
+def run_mode(mode: str, image_path: str, iterations: int):
+    sys.path.insert(0, PROJECT_DIR)
+    func = reencode if mode == 'reencode' else passthrough
+    with open(image_path, 'rb') as f:
+        data = f.read()
+
+    # Warm up imports so they are not billed to the first meme
+    func(data)
+
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    for _ in range(iterations):
+        func(data).read()
+    cpu = time.process_time() - cpu_start
+    wall = time.perf_counter() - wall_start
+
+    print(json.dumps({
+        'mode': mode,
+        'cpu_ms_per_meme': cpu / iterations * 1000,
+        'wall_ms_per_meme': wall / iterations * 1000,
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=20)
+    parser.add_argument('--image', default=DEFAULT_IMAGE)
+    parser.add_argument('--mode', choices=['reencode', 'passthrough'], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.image, args.iterations)
+        return
+
+    print(f"{os.path.getsize(args.image)} byte image, {args.iterations} iterations\n")
+    print(f"{'mode':<12} {'cpu ms/meme':>12} {'wall ms/meme':>13} {'peak RSS KB':>12}")
+    for mode in ('reencode', 'passthrough'):
+        out = subprocess.run(
+            [sys.executable, __file__, '--mode', mode, '--image', args.image,
+             '--iterations', str(args.iterations)],
+            capture_output=True, text=True, check=True
+        )
+        result = json.loads(out.stdout)
+        print(f"{mode:<12} {result['cpu_ms_per_meme']:>12.2f} {result['wall_ms_per_meme']:>13.2f} "
+              f"{result['peak_rss_kb']:>12}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
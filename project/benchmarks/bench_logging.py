@@ -0,0 +1,141 @@
+"""Compare logging straight to the handlers against the queue pipeline in src.log_pipeline.
+
+"direct" is the old setup_logging: a RotatingFileHandler and a console handler on
+the root logger, both writing on the caller's thread. "queue" is start_logging():
+the caller only queues the record, and a listener thread formats it as JSON,
+writes it and rotates the file. Each mode runs in its own interpreter. The console
+goes to /dev/null, and the file rotates at --max-kb so rotation cost is included.
+
+Reported per mode:
+- records/s as seen by the logging call, and until everything is on disk
+- event-loop lag while handlers log in bursts: how late a 1 ms timer fires
+- the cost of a DEBUG call filtered out at INFO, with f-string and %-style arguments
+
+    python benchmarks/bench_logging.py [--records 100000] [--burst 50] [--seconds 3] [--max-kb 1024]
+"""
+import argparse
+import asyncio
+import json
+import logging
+import logging.handlers
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+from src.log_pipeline import TEXT_FORMAT, start_logging
+
+SLOGAN = "Hive Together, Thrive Together."
+RESPONSE = {'created': 1700000000, 'data': [{'revised_prompt': 'A happy bee ' * 40, 'url': 'https://example.com/x.png'}]}
+
+def setup_direct(path: str, max_bytes: int):
+    formatter = logging.Formatter(TEXT_FORMAT)
+    root = logging.getLogger()
+    root.setLevel(logging.INFO)
+    file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=5)
+    file_handler.setFormatter(formatter)
+    console_handler = logging.StreamHandler()
+    console_handler.setFormatter(formatter)
+    root.addHandler(file_handler)
+    root.addHandler(console_handler)
+    return None
+
+def percentile(samples: list, q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+async def loop_lag(logger: logging.Logger, burst: int, seconds: float) -> list:
+    """Lateness of a 1 ms timer while another task logs `burst` records every 10 ms"""
+    lags, stop = [], time.perf_counter() + seconds
+
+    async def handlers():
+        user = 0
+        while time.perf_counter() < stop:
+            for _ in range(burst):
+                user += 1
+                logger.info("Generating meme for user %s with slogan: '%s'", user, SLOGAN)
+            await asyncio.sleep(0.01)
+
+    async def ticker():
+        while time.perf_counter() < stop:
+            start = time.perf_counter()
+            await asyncio.sleep(0.001)
+            lags.append(time.perf_counter() - start - 0.001)
+
+    await asyncio.gather(handlers(), ticker())
+    return lags
+
+def child(args):
+    # Both modes write the console to /dev/null; StreamHandler picks up sys.stderr when created
+    sys.stderr = open(os.devnull, 'w')
+    workdir = tempfile.mkdtemp()
+    path = os.path.join(workdir, 'bot.log')
+    max_bytes = args.max_kb * 1024
+    if args.mode == 'queue':
+        listener = start_logging(path, max_bytes=max_bytes, queue_size=args.records * 2)
+    else:
+        listener = setup_direct(path, max_bytes)
+    logger = logging.getLogger('bench')
+
+    start = time.perf_counter()
+    for i in range(args.records):
+        logger.info("Generating meme for user %s with slogan: '%s'", i, SLOGAN)
+    emitted = time.perf_counter() - start
+    if listener:
+        listener.stop()
+        listener.start()
+    written = time.perf_counter() - start
+
+    lags = asyncio.run(loop_lag(logger, args.burst, args.seconds))
+
+    calls = 100000
+    start = time.perf_counter()
+    for _ in range(calls):
+        logger.debug(f"OpenAI API response: {RESPONSE}")
+    fstring = (time.perf_counter() - start) / calls
+    start = time.perf_counter()
+    for _ in range(calls):
+        logger.debug("OpenAI API response: %s", RESPONSE)
+    lazy = (time.perf_counter() - start) / calls
+
+    if listener:
+        listener.stop()
+    rotated = len([name for name in os.listdir(workdir) if name != 'bot.log'])
+    print(json.dumps({
+        'emit_rate': args.records / emitted, 'write_rate': args.records / written,
+        'lag_p50': percentile(lags, 0.5), 'lag_p99': percentile(lags, 0.99), 'lag_max': max(lags),
+        'debug_fstring': fstring, 'debug_lazy': lazy, 'rotated': rotated
+    }))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--records', type=int, default=100000, help='records for the throughput test')
+    parser.add_argument('--burst', type=int, default=50, help='records logged every 10 ms in the lag test')
+    parser.add_argument('--seconds', type=float, default=3, help='length of the lag test')
+    parser.add_argument('--max-kb', type=int, default=1024, help='log file size that triggers rotation')
+    parser.add_argument('--mode', choices=('direct', 'queue'), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        child(args)
+        return
+
+    print(f"{args.records} records; lag test logs {args.burst} records every 10 ms for {args.seconds:.0f}s\n")
+    print(f"{'mode':<7} {'emit/s':>9} {'written/s':>10} {'lag p50 ms':>11} {'p99 ms':>8} {'max ms':>8} "
+          f"{'rotations':>9} {'filtered f-str ns':>18} {'filtered %s ns':>15}")
+    for mode in ('direct', 'queue'):
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--mode', mode, '--records', str(args.records),
+             '--burst', str(args.burst), '--seconds', str(args.seconds), '--max-kb', str(args.max_kb)],
+            capture_output=True, text=True, check=True
+        ).stdout
+        r = json.loads(output.strip().splitlines()[-1])
+        print(f"{mode:<7} {r['emit_rate']:>9.0f} {r['write_rate']:>10.0f} {r['lag_p50'] * 1000:>11.2f} "
+              f"{r['lag_p99'] * 1000:>8.2f} {r['lag_max'] * 1000:>8.2f} {r['rotated']:>9} "
+              f"{r['debug_fstring'] * 1e9:>18.0f} {r['debug_lazy'] * 1e9:>15.0f}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
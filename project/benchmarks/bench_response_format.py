@@ -0,0 +1,100 @@
+"""Compare fetching generated images inline (b64_json) against the URL and second download.
+
+Both modes call the stub in benchmarks/fakes/fake_openai.py on a local port
+through ImageClient, the same way MemeGenerator does. --download-ms stands in
+for the extra round trip (and TLS handshake) to the image host that the URL
+mode pays, and --rtt-ms for the round trip both modes pay to the API. Peak memory is traced per image.
+
+    python benchmarks/bench_response_format.py [--images 50] [--concurrency 4] [--download-ms 150]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import subprocess
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import httpx
+from src.image_client import ImageClient
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+async def wait_until_up(url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+async def fetch(client: ImageClient, response_format: str) -> bytes:
+    result = await client.create_image("A happy bee", response_format=response_format)
+    if 'image' in result:
+        return result['image']
+    return await client.download(result['url'])
+
+async def run(base_url: str, response_format: str, args) -> tuple:
+    client = ImageClient('sk-bench', base_url=base_url, max_connections=args.concurrency,
+                         response_format=response_format)
+    slots = asyncio.Semaphore(args.concurrency)
+    latencies, sizes = [], set()
+
+    async def one():
+        async with slots:
+            start = time.perf_counter()
+            sizes.add(len(await fetch(client, response_format)))
+            latencies.append(time.perf_counter() - start)
+
+    await fetch(client, response_format)  # warm the connection pool
+    tracemalloc.start()
+    start = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(args.images)))
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    await client.aclose()
+    return elapsed, sorted(latencies), peak, sizes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--images', type=int, default=50)
+    parser.add_argument('--concurrency', type=int, default=4)
+    parser.add_argument('--latency-ms', type=float, default=0, help='median generation time at the stub')
+    parser.add_argument('--download-ms', type=float, default=150,
+                        help='median extra time the URL mode spends reaching the image host')
+    args = parser.parse_args()
+
+    port = free_port()
+    stub = subprocess.Popen(
+        [sys.executable, '-m', 'benchmarks.fakes.fake_openai', '--port', str(port),
+         '--latency-ms', str(args.latency_ms), '--download-ms', str(args.download_ms), '--latency-sigma', '0.1', '--seed', '1'],
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    try:
+        asyncio.run(wait_until_up(f"http://127.0.0.1:{port}/stats"))
+        print(f"{args.images} images, {args.concurrency} at a time, {args.latency_ms:.0f} ms generation, "
+              f"{args.download_ms:.0f} ms to the image host\n")
+        print(f"{'mode':<9} {'images/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'peak MB':>8}")
+        for response_format in ('url', 'b64_json'):
+            elapsed, latencies, peak, sizes = asyncio.run(run(f"http://127.0.0.1:{port}/v1", response_format, args))
+            assert len(sizes) == 1, "every image should decode to the same bytes"
+            p50 = latencies[len(latencies) // 2] * 1000
+            p95 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))] * 1000
+            print(f"{response_format:<9} {args.images / elapsed:>9.1f} {p50:>8.1f} {p95:>8.1f} "
+                  f"{peak / 2 ** 20:>8.1f}")
+    finally:
+        stub.terminate()
+        stub.wait()
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
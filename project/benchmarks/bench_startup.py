@@ -0,0 +1,91 @@
+"""Measure how long a fresh interpreter takes to import the bot, with a regression budget.
+
+Each run starts a new `python -X importtime` process that imports the entry module
+(main.py by default) and nothing else, so the numbers are cold-start costs without
+network or database time. The report shows the median over the runs and where the
+time goes by top-level package. The run fails when the median is over --budget-ms,
+or when a module that should only load on first use (the imaging and web stacks)
+is imported eagerly.
+
+    python benchmarks/bench_startup.py [--runs 7] [--budget-ms 600] [--module main]
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Loaded on first render, first webhook server or first URL download, never at import
+LAZY_MODULES = ('PIL', 'uvicorn', 'starlette', 'requests')
+
+IMPORTTIME = re.compile(r'import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+CHILD = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+print(json.dumps({{'seconds': time.perf_counter() - start, 'modules': sorted(sys.modules)}}))
+"""
+
+def run_once(module: str) -> dict:
+    """Import `module` in a fresh interpreter and return its timings"""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', CHILD.format(module=module)],
+        cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+    )
+    wall = time.perf_counter() - start
+    by_package = defaultdict(int)
+    for match in IMPORTTIME.finditer(result.stderr):
+        self_us, _, _, name = match.groups()
+        by_package[name.split('.')[0]] += int(self_us)
+    child = json.loads(result.stdout.strip().splitlines()[-1])
+    return {'wall': wall, 'import': child['seconds'], 'modules': child['modules'], 'packages': by_package}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=7)
+    parser.add_argument('--module', default='main', help='entry module to import from the project directory')
+    parser.add_argument('--budget-ms', type=float, default=600, help='fail when the median import is slower')
+    parser.add_argument('--top', type=int, default=12, help='packages to list')
+    args = parser.parse_args()
+
+    # Not timed: the first run warms the OS page cache and writes the .pyc files
+    run_once(args.module)
+    runs = [run_once(args.module) for _ in range(args.runs)]
+
+    import_ms = statistics.median(run['import'] for run in runs) * 1000
+    wall_ms = statistics.median(run['wall'] for run in runs) * 1000
+    print(f"import {args.module}: {import_ms:.0f} ms median over {args.runs} runs "
+          f"(min {min(run['import'] for run in runs) * 1000:.0f}, "
+          f"max {max(run['import'] for run in runs) * 1000:.0f}); "
+          f"{wall_ms:.0f} ms including interpreter start\n")
+
+    packages = defaultdict(list)
+    for run in runs:
+        for package, self_us in run['packages'].items():
+            packages[package].append(self_us)
+    print(f"{'package':<24} {'ms':>8}")
+    ranked = sorted(packages.items(), key=lambda item: -statistics.median(item[1]))
+    for package, samples in ranked[:args.top]:
+        print(f"{package:<24} {statistics.median(samples) / 1000:>8.1f}")
+
+    ok = True
+    eager = sorted({name for name in runs[0]['modules'] if name.split('.')[0] in LAZY_MODULES})
+    if eager:
+        print(f"\nFAIL: imported at startup but meant to load on first use: "
+              f"{', '.join(sorted({name.split('.')[0] for name in eager}))}")
+        ok = False
+    if import_ms > args.budget_ms:
+        print(f"\nFAIL: import took {import_ms:.0f} ms, over the {args.budget_ms:.0f} ms budget")
+        ok = False
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
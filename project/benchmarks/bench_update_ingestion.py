@@ -0,0 +1,115 @@
+"""Compare update throughput and handling latency between long polling and webhooks.
+
+Both modes run against an in-memory Bot API with the same simulated round
+trip to Telegram and the same handler. Latency is measured from the moment
+Telegram has the update until the handler finishes with it.
+
+    python benchmarks/bench_update_ingestion.py [--updates 2000] [--rate 500] [--rtt-ms 60]
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from telegram import Update
+from telegram.ext import ApplicationBuilder, TypeHandler
+from benchmarks.fakes.fake_telegram import FakeBotAPI, FakeTelegramSender, make_message_update
+from src.webhook import UpdateProcessor, WebhookServer
+
+SECRET = 'bench-secret'
+
+def build_application(api: FakeBotAPI, concurrency: int, work: float, arrived: dict, latencies: list,
+                      done: asyncio.Event, total: int):
+    async def handle(update: Update, context):
+        await asyncio.sleep(work)
+        latencies.append(time.perf_counter() - arrived[update.update_id])
+        if len(latencies) == total:
+            done.set()
+
+    application = (
+        ApplicationBuilder()
+        .token('123456:bench')
+        .request(api)
+        .get_updates_request(api)
+        .concurrent_updates(UpdateProcessor(concurrency))
+        .build()
+    )
+    application.add_handler(TypeHandler(Update, handle))
+    return application
+
+async def offer(updates: list, rate: float, deliver, arrived: dict):
+    """Hand updates to Telegram at `rate` per second (all at once when 0)"""
+    start = time.perf_counter()
+    for i, update in enumerate(updates):
+        if rate:
+            delay = start + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        arrived[update['update_id']] = time.perf_counter()
+        deliver(update)
+
+async def run_polling(args, updates: list) -> tuple:
+    api = FakeBotAPI(latency=args.rtt_ms / 1000)
+    arrived, latencies, done = {}, [], asyncio.Event()
+    application = build_application(api, args.concurrency, args.work_ms / 1000, arrived, latencies,
+                                    done, len(updates))
+    async with application:
+        await application.start()
+        await application.updater.start_polling(poll_interval=0, timeout=10)
+        start = time.perf_counter()
+        await offer(updates, args.rate, api.push_update, arrived)
+        await done.wait()
+        elapsed = time.perf_counter() - start
+        await application.updater.stop()
+        await application.stop()
+    return elapsed, latencies
+
+async def run_webhook(args, updates: list) -> tuple:
+    api = FakeBotAPI(latency=args.rtt_ms / 1000)
+    arrived, latencies, done = {}, [], asyncio.Event()
+    application = build_application(api, args.concurrency, args.work_ms / 1000, arrived, latencies,
+                                    done, len(updates))
+    server = WebhookServer(application, SECRET)
+    sender = FakeTelegramSender(f"http://bench{server.path}", SECRET, app=server.app,
+                                latency=args.rtt_ms / 1000)
+    deliveries = []
+
+    def deliver(update: dict):
+        deliveries.append(asyncio.create_task(sender.send(update)))
+
+    async with application:
+        await application.start()
+        start = time.perf_counter()
+        await offer(updates, args.rate, deliver, arrived)
+        await done.wait()
+        elapsed = time.perf_counter() - start
+        await asyncio.gather(*deliveries)
+        await application.stop()
+    await sender.aclose()
+    return elapsed, latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=2000)
+    parser.add_argument('--rate', type=float, default=500, help='updates/s offered, 0 for a single burst')
+    parser.add_argument('--rtt-ms', type=float, default=60, help='round trip to the Bot API')
+    parser.add_argument('--work-ms', type=float, default=5, help='time the handler spends per update')
+    parser.add_argument('--concurrency', type=int, default=64, help='handlers running at once')
+    args = parser.parse_args()
+
+    updates = [make_message_update(i + 1, user_id=1000 + i % 500) for i in range(args.updates)]
+    print(f"{args.updates} updates at {args.rate or 'burst'} updates/s, "
+          f"{args.rtt_ms:.0f} ms RTT, {args.work_ms:.0f} ms handler\n")
+    print(f"{'mode':<8} {'updates/s':>10} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for mode, runner in (('polling', run_polling), ('webhook', run_webhook)):
+        elapsed, latencies = asyncio.run(runner(args, updates))
+        latencies = sorted(ms * 1000 for ms in latencies)
+        p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        print(f"{mode:<8} {len(latencies) / elapsed:>10.0f} {statistics.median(latencies):>8.1f} "
+              f"{p99:>8.1f} {latencies[-1]:>8.1f}")
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
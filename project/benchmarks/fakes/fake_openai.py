@@ -0,0 +1,124 @@
+"""Local stand-in for the OpenAI images API, for load tests that must not spend money.
+
+    python -m benchmarks.fakes.fake_openai --port 8787 --latency-ms 1500 --error-rate 0.02
+"""
+import argparse
+import asyncio
+import base64
+import itertools
+import json
+import logging
+import math
+import os
+import random
+from collections import Counter
+from typing import Optional
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+
+logger = logging.getLogger(__name__)
+
+# Same bytes and dimensions as a real 1024x1024 PNG from the API
+DEFAULT_IMAGE_PATH = os.path.join(os.path.dirname(__file__), '..', '..', '..', 'bee_template.png')
+
+class FakeImagesAPI:
+    """Answers /v1/images/generations after a lognormal delay, failing at the configured rates"""
+
+    def __init__(self, latency_ms: float = 1500, latency_sigma: float = 0.3,
+                 download_ms: float = 50, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 policy_rate: float = 0.0, image_path: str = DEFAULT_IMAGE_PATH,
+                 seed: Optional[int] = None):
+        self.latency_ms = latency_ms
+        self.latency_sigma = latency_sigma
+        self.download_ms = download_ms
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.policy_rate = policy_rate
+        with open(image_path, 'rb') as f:
+            self.image = f.read()
+        self.image_b64 = base64.b64encode(self.image)
+        self.calls = Counter()
+        self._random = random.Random(seed)
+        self._image_ids = itertools.count(1)
+        self.app = Starlette(routes=[
+            Route('/v1/images/generations', self.generations, methods=['POST']),
+            Route('/images/{image_id}.png', self.image_file, methods=['GET']),
+            Route('/stats', self.stats, methods=['GET'])
+        ])
+
+    def _delay(self, median_ms: float) -> float:
+        if median_ms <= 0:
+            return 0.0
+        return self._random.lognormvariate(math.log(median_ms / 1000), self.latency_sigma)
+
+    def _outcome(self) -> str:
+        roll = self._random.random()
+        for outcome, rate in (('server_error', self.error_rate), ('rate_limited', self.rate_limit_rate),
+                              ('content_policy', self.policy_rate)):
+            if roll < rate:
+                return outcome
+            roll -= rate
+        return 'ok'
+
+    async def generations(self, request: Request) -> Response:
+        body = await request.json()
+        self.calls['generations'] += 1
+        self.calls[f"quality:{body.get('quality', 'standard')}"] += 1
+        await asyncio.sleep(self._delay(self.latency_ms))
+
+        outcome = self._outcome()
+        self.calls[outcome] += 1
+        if outcome == 'server_error':
+            return JSONResponse({'error': {'message': 'The server had an error processing your request.',
+                                           'type': 'server_error', 'code': None}}, status_code=500)
+        if outcome == 'rate_limited':
+            return JSONResponse({'error': {'message': 'Rate limit exceeded for images per minute.',
+                                           'type': 'requests', 'code': 'rate_limit_exceeded'}},
+                                status_code=429, headers={'Retry-After': '1'})
+        if outcome == 'content_policy':
+            return JSONResponse({'error': {'message': 'Your request was rejected by the safety system.',
+                                           'type': 'invalid_request_error',
+                                           'code': 'content_policy_violation'}}, status_code=400)
+
+        if body.get('response_format') == 'b64_json':
+            self.calls['inline'] += 1
+            # Spliced rather than serialised, so the stub does not add json.dumps time to the comparison
+            prefix = json.dumps({'created': 0, 'data': [{'revised_prompt': body.get('prompt'), 'b64_json': ''}]})
+            head, tail = prefix.rsplit('""', 1)
+            return Response(f'{head}"'.encode() + self.image_b64 + f'"{tail}'.encode(),
+                            media_type='application/json')
+        url = f"{request.base_url}images/{next(self._image_ids)}.png"
+        return JSONResponse({'created': 0, 'data': [{'url': url, 'revised_prompt': body.get('prompt')}]})
+
+    async def image_file(self, request: Request) -> Response:
+        self.calls['downloads'] += 1
+        await asyncio.sleep(self._delay(self.download_ms))
+        return Response(self.image, media_type='image/png')
+
+    async def stats(self, request: Request) -> Response:
+        return JSONResponse(dict(self.calls))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    parser.add_argument('--latency-ms', type=float, default=1500, help='median generation time')
+    parser.add_argument('--latency-sigma', type=float, default=0.3, help='spread of the lognormal latency')
+    parser.add_argument('--download-ms', type=float, default=50, help='median image download time')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of calls answered with a 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share answered with a 429')
+    parser.add_argument('--policy-rate', type=float, default=0.0,
+                        help='share rejected as content_policy_violation')
+    parser.add_argument('--image', default=DEFAULT_IMAGE_PATH, help='PNG served for every generation')
+    parser.add_argument('--seed', type=int)
+    args = parser.parse_args()
+
+    api = FakeImagesAPI(args.latency_ms, args.latency_sigma, args.download_ms, args.error_rate,
+                        args.rate_limit_rate, args.policy_rate, args.image, args.seed)
+    uvicorn.run(api.app, host=args.host, port=args.port, log_level='warning')
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -0,0 +1,130 @@
+import asyncio
+import itertools
+import json
+import time
+from typing import Dict, List, Optional, Tuple
+import httpx
+from telegram.request import BaseRequest, RequestData
+from src.updates import SECRET_HEADER
+
+BOT_USER = {'id': 1, 'is_bot': True, 'first_name': 'Bee Meme Bot', 'username': 'bee_meme_bot'}
+
+def make_message_update(update_id: int, user_id: int, chat_id: Optional[int] = None,
+                        text: str = '/meme') -> dict:
+    """Bot API payload for a private or group text message"""
+    chat_id = chat_id if chat_id is not None else user_id
+    entities = [{'type': 'bot_command', 'offset': 0, 'length': len(text.split()[0])}] if text.startswith('/') else []
+    return {
+        'update_id': update_id,
+        'message': {
+            'message_id': update_id,
+            'date': int(time.time()),
+            'chat': {'id': chat_id, 'type': 'private' if chat_id == user_id else 'group'},
+            'from': {'id': user_id, 'is_bot': False, 'first_name': f"user{user_id}"},
+            'text': text,
+            'entities': entities
+        }
+    }
+
+class FakeBotAPI(BaseRequest):
+    """In-memory Bot API: queues updates for getUpdates and records what the bot sends"""
+
+    def __init__(self, latency: float = 0.0):
+        # Simulated round trip to api.telegram.org, half on the way in and half on the way out
+        self.latency = latency
+        self.sent: List[Tuple[str, dict]] = []
+        self._updates: List[dict] = []
+        self._arrived = asyncio.Event()
+        self._message_ids = itertools.count(1)
+
+    async def initialize(self):
+        pass
+
+    async def shutdown(self):
+        pass
+
+    def push_update(self, update: dict):
+        """Make an update available to the next getUpdates call"""
+        self._updates.append(update)
+        self._arrived.set()
+
+    async def do_request(self, url: str, method: str, request_data: Optional[RequestData] = None,
+                         read_timeout=None, write_timeout=None, connect_timeout=None,
+                         pool_timeout=None) -> Tuple[int, bytes]:
+        endpoint = url.rsplit('/', 1)[-1]
+        params = request_data.parameters if request_data else {}
+        await asyncio.sleep(self.latency / 2)
+
+        if endpoint == 'getUpdates':
+            result = await self._get_updates(params.get('offset', 0), params.get('timeout', 0))
+        elif endpoint == 'getMe':
+            result = BOT_USER
+        elif endpoint.startswith('send'):
+            self.sent.append((endpoint, params))
+            result = self._message(params)
+        else:
+            # setWebhook, deleteWebhook, deleteMessage, answerCallbackQuery, ...
+            result = True
+        await asyncio.sleep(self.latency / 2)
+        return 200, json.dumps({'ok': True, 'result': result}).encode()
+
+    async def _get_updates(self, offset: int, timeout: float) -> List[dict]:
+        self._updates = [u for u in self._updates if u['update_id'] >= offset]
+        if not self._updates and timeout:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        batch, self._updates = self._updates[:100], self._updates[100:]
+        return batch
+
+    def _message(self, params: Dict) -> dict:
+        message_id = next(self._message_ids)
+        message = {
+            'message_id': message_id,
+            'date': int(time.time()),
+            'chat': {'id': int(params.get('chat_id', 0)), 'type': 'private'},
+            'from': BOT_USER
+        }
+        if 'photo' in params or 'text' not in params:
+            message['photo'] = [{'file_id': f"fake-photo-{message_id}", 'file_unique_id': str(message_id),
+                                 'width': 1024, 'height': 1024}]
+        else:
+            message['text'] = params['text']
+        return message
+
+class FakeTelegramSender:
+    """Delivers updates to a webhook the way Telegram does, over HTTP with the secret header"""
+
+    def __init__(self, url: str, secret_token: str, app=None, max_connections: int = 40,
+                 latency: float = 0.0):
+        self.url = url
+        self.secret_token = secret_token
+        # Telegram keeps at most `max_connections` deliveries open, each one a full round trip
+        self.latency = latency
+        self._slots = asyncio.Semaphore(max_connections)
+        # An ASGI app is driven in-process, without opening a socket
+        transport = httpx.ASGITransport(app=app) if app is not None else None
+        self._client = httpx.AsyncClient(transport=transport, timeout=30)
+        self.statuses: Dict[int, int] = {}
+
+    async def send(self, update: dict) -> int:
+        """POST one update and return the HTTP status, redelivering on 5xx like Telegram"""
+        while True:
+            async with self._slots:
+                await asyncio.sleep(self.latency / 2)
+                response = await self._client.post(self.url, json=update,
+                                                   headers={SECRET_HEADER: self.secret_token})
+                await asyncio.sleep(self.latency / 2)
+            self.statuses[response.status_code] = self.statuses.get(response.status_code, 0) + 1
+            if response.status_code < 500:
+                return response.status_code
+            await asyncio.sleep(float(response.headers.get('Retry-After', 1)))
+
+    async def send_many(self, updates: List[dict]):
+        """Deliver a batch of updates, `max_connections` at a time"""
+        await asyncio.gather(*(self.send(update) for update in updates))
+
+    async def aclose(self):
+        await self._client.aclose()
\ No newline at end of file
@@ -0,0 +1,224 @@
+"""Replay synthetic /meme, /stats and /menu traffic against the bot, fully offline.
+
+The application is the one main.py runs, built by build_application(), talking
+to an in-memory Bot API and to the images stub in benchmarks/fakes/fake_openai.py,
+started on a local port. Latency is measured from the moment an update is
+queued until every handler is done with it. Exits non-zero when a --max-p95-ms
+budget is exceeded, so a CI job can catch hot-path regressions before deploy.
+
+    python benchmarks/loadtest.py [--updates 1000] [--rate 50] [--mix meme=6,stats=3,menu=1]
+                                  [--api-latency-ms 1500] [--error-rate 0.02] [--max-p95-ms 4000]
+"""
+import argparse
+import asyncio
+import logging
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+
+PROJECT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_DIR)
+import httpx
+from telegram import Update
+from telegram.ext import TypeHandler
+from src import database
+from src.analytics import stats
+from benchmarks.fakes.fake_telegram import FakeBotAPI, make_message_update
+from src.metrics import phase_seconds, registry
+from main import build_application, load_config
+
+def parse_mix(value: str) -> dict:
+    """'meme=6,stats=3,menu=1' -> {'/meme': 6.0, '/stats': 3.0, '/menu': 1.0}"""
+    mix = {}
+    for part in value.split(','):
+        command, _, weight = part.partition('=')
+        mix[f"/{command.strip().lstrip('/')}"] = float(weight or 1)
+    return mix
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def rss_mb() -> float:
+    """Current resident set size"""
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def percentile(samples: list, q: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(q * len(samples)))] if samples else 0.0
+
+def start_fake_openai(args, port: int) -> subprocess.Popen:
+    command = [
+        sys.executable, '-m', 'benchmarks.fakes.fake_openai', '--port', str(port),
+        '--latency-ms', str(args.api_latency_ms), '--latency-sigma', str(args.api_latency_sigma),
+        '--error-rate', str(args.error_rate), '--rate-limit-rate', str(args.rate_limit_rate),
+        '--policy-rate', str(args.policy_rate), '--seed', str(args.seed)
+    ]
+    return subprocess.Popen(command, cwd=PROJECT_DIR)
+
+async def wait_until_up(url: str, timeout: float = 15.0):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.get(url)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+def loadtest_config(args, workdir: str, base_url: str) -> dict:
+    """config.yml with the stub API, a scratch cache and limits that let the load through"""
+    config = load_config()
+    config['api']['base_url'] = base_url
+    config['cache']['directory'] = os.path.join(workdir, 'cache')
+    config['bot'].update(cooldown_minutes=1 / 600, max_daily_memes=10 ** 9)
+    config['rate_limits'] = {'store': 'memory'}
+    config['metrics']['enabled'] = False
+    if not args.with_inventory:
+        config['inventory']['daily_budget_usd'] = 0
+    return config
+
+async def replay(args, config: dict, stub_url: str) -> dict:
+    api = FakeBotAPI(latency=args.rtt_ms / 1000)
+    application = build_application(config, '123456:loadtest', 'sk-loadtest', request=api)
+
+    queued, latencies, done = {}, defaultdict(list), asyncio.Event()
+    commands = {}
+
+    async def finished(update: Update, context):
+        command = commands[update.update_id]
+        latencies[command].append(time.perf_counter() - queued[update.update_id])
+        if sum(len(samples) for samples in latencies.values()) == args.updates:
+            done.set()
+
+    # Handler groups run in order, so group 1 sees the update after the command handler returned
+    application.add_handler(TypeHandler(Update, finished), group=1)
+
+    rng = random.Random(args.seed)
+    mix = parse_mix(args.mix)
+    texts = rng.choices(list(mix), weights=list(mix.values()), k=args.updates)
+    updates = [make_message_update(i + 1, user_id=100000 + rng.randrange(args.users), text=text)
+               for i, text in enumerate(texts)]
+
+    rss_before = rss_mb()
+    async with application:
+        await application.post_init(application)
+        await application.start()
+        start = time.perf_counter()
+        for i, payload in enumerate(updates):
+            if args.rate:
+                delay = start + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            commands[payload['update_id']] = payload['message']['text']
+            queued[payload['update_id']] = time.perf_counter()
+            await application.update_queue.put(Update.de_json(payload, application.bot))
+        try:
+            await asyncio.wait_for(done.wait(), args.timeout)
+        except asyncio.TimeoutError:
+            print(f"Timed out after {args.timeout:.0f}s with "
+                  f"{sum(len(s) for s in latencies.values())}/{args.updates} updates handled")
+        elapsed = time.perf_counter() - start
+        rss_after = rss_mb()
+        await application.stop()
+        await application.post_shutdown(application)
+
+    async with httpx.AsyncClient() as client:
+        api_calls = (await client.get(f"{stub_url}/stats")).json()
+
+    return {
+        'elapsed': elapsed,
+        'latencies': latencies,
+        'rss': (rss_before, rss_after, peak_rss_mb()),
+        'api_calls': api_calls,
+        'bot_calls': Counter(method for method, _ in api.sent)
+    }
+
+def report(args, result: dict) -> bool:
+    """Print the results; False when the p95 budget is blown"""
+    latencies = result['latencies']
+    handled = sum(len(samples) for samples in latencies.values())
+    print(f"{handled} updates in {result['elapsed']:.1f}s: {handled / result['elapsed']:.1f} updates/s\n")
+
+    print(f"{'command':<8} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    everything = [value for samples in latencies.values() for value in samples]
+    for command, samples in sorted(latencies.items()) + [('all', everything)]:
+        p50, p95, p99, worst = (percentile(samples, q) * 1000 for q in (0.5, 0.95, 0.99, 1.0))
+        print(f"{command:<8} {len(samples):>6} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f} {worst:>9.1f}")
+
+    print(f"\n{'phase':<12} {'n':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for phase, histogram in phase_seconds.children.items():
+        p50, p95, p99 = (value * 1000 for value in histogram.percentiles(0.5, 0.95, 0.99))
+        print(f"{phase:<12} {histogram.count:>6} {p50:>9.1f} {p95:>9.1f} {p99:>9.1f}")
+
+    before, after, peak = result['rss']
+    print(f"\nRSS: {before:.0f} MB before, {after:.0f} MB after, {peak:.0f} MB peak")
+    api_calls = result['api_calls']
+    print("Images API: " + ', '.join(f"{name}={count}" for name, count in sorted(api_calls.items())))
+    print("Bot API: " + ', '.join(f"{name}={count}" for name, count in sorted(result['bot_calls'].items())))
+    print(f"Memes: {stats.successful_generations} ok, {stats.failed_generations} failed")
+    # The same counters /metrics exposes, minus the phase histograms printed above
+    counters = [line for line in registry.render().splitlines()
+                if not line.startswith('#') and not line.startswith('meme_phase_seconds')]
+    print("Counters: " + ', '.join(counters))
+
+    p95 = percentile(everything, 0.95) * 1000
+    if args.max_p95_ms and p95 > args.max_p95_ms:
+        print(f"\nFAIL: p95 {p95:.0f} ms is over the {args.max_p95_ms:.0f} ms budget")
+        return False
+    return handled == args.updates
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--updates', type=int, default=1000)
+    parser.add_argument('--rate', type=float, default=50, help='updates/s offered, 0 for a single burst')
+    parser.add_argument('--users', type=int, default=300, help='distinct users sending them')
+    parser.add_argument('--mix', default='meme=6,stats=3,menu=1', help='relative weight of each command')
+    parser.add_argument('--rtt-ms', type=float, default=40, help='round trip to the Bot API')
+    parser.add_argument('--api-latency-ms', type=float, default=1500, help='median image generation time')
+    parser.add_argument('--api-latency-sigma', type=float, default=0.3)
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of image calls failing with 500')
+    parser.add_argument('--rate-limit-rate', type=float, default=0.0, help='share failing with 429')
+    parser.add_argument('--policy-rate', type=float, default=0.0, help='share rejected by content policy')
+    parser.add_argument('--with-inventory', action='store_true', help='let the inventory pre-generate stock')
+    parser.add_argument('--max-p95-ms', type=float, help='fail when overall p95 latency is above this')
+    parser.add_argument('--timeout', type=float, default=600)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+    # load_config() and the compositor's template path are relative to the project directory
+    os.chdir(PROJECT_DIR)
+    port = free_port()
+    stub_url = f"http://127.0.0.1:{port}"
+    stub = start_fake_openai(args, port)
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            asyncio.run(wait_until_up(f"{stub_url}/stats"))
+            database.DB_PATH = os.path.join(workdir, 'loadtest.db')
+            database.init_db()
+            database.start_writer()
+            config = loadtest_config(args, workdir, f"{stub_url}/v1")
+            print(f"{args.updates} updates at {args.rate or 'burst'} updates/s from {args.users} users, "
+                  f"mix {args.mix}, {args.api_latency_ms:.0f} ms image API, {args.rtt_ms:.0f} ms Bot API RTT\n")
+            ok = report(args, asyncio.run(replay(args, config, stub_url)))
+    finally:
+        stub.terminate()
+        stub.wait()
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
\ No newline at end of file
@@ -1,54 +1,163 @@
+import asyncio
 import logging
-import logging.handlers
 import os
+import secrets
+import sys
+from typing import Optional
 import yaml
-from telegram.ext import ApplicationBuilder, CommandHandler, CallbackQueryHandler
+from telegram.ext import Application, ApplicationBuilder, CommandHandler, CallbackQueryHandler
+from telegram.request import BaseRequest
 from src.handlers import CommandHandlers
 from src.meme_generator import MemeGenerator
-from src.database import init_db
+from src.image_client import ImageClient
+from src.image_cache import ImageCache
+from src.postprocess import PostProcessor
+from src.scheduler import GenerationScheduler
+from src.inventory import MemeInventory
+from src.catalog import PromptRotation
+from src.compositor import MemeCompositor
+from src.rate_limit import RateLimiter
+from src.resilience import RetryPolicy
+from src.updates import UpdateProcessor
+from src.sharding import (Dispatcher, worker_config, WORKER_INDEX_ENV, WORKER_PORT_ENV, WORKER_SECRET_ENV,
+                          WORKER_PATH)
+from src.database import init_db, archive_old_history, start_writer, stop_writer
+from src.analytics import stats
+from src.metrics import registry, MetricsServer
+from src.warmup import warm_up, warm_telegram
+from src.log_pipeline import start_logging_from_config
 
-def setup_logging():
-    """Setup rotating file handler"""
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
+def setup_logging(config: dict, path: str = 'logs/bot.log'):
+    """Send every log record through a queue to a listener thread that writes and rotates the log"""
+    start_logging_from_config(config, path)
 
-    # Create logs directory if it doesn't exist
-    os.makedirs('logs', exist_ok=True)
+def load_config():
+    """Load configuration from YAML file"""
+    with open('config/config.yml', 'r') as f:
+        return yaml.safe_load(f)
 
-    handler = logging.handlers.RotatingFileHandler(
-        'logs/bot.log',
-        maxBytes=1024*1024,
-        backupCount=5
+def build_application(config: dict, token: str, api_key: str, request: Optional[BaseRequest] = None) -> Application:
+    """Wire up every component and return the bot application, ready to run"""
+    # Initialize components
+    image_client = ImageClient.from_config(api_key, config['api'])
+    image_cache = ImageCache.from_config(config.get('cache', {}))
+    postprocessor = PostProcessor.from_config(config['api'])
+    retry_policy = RetryPolicy.from_config(config['api'])
+    meme_generator = MemeGenerator(
+        image_client,
+        image_cache,
+        postprocessor,
+        retry_policy,
+        model=config['api']['dalle_model'],
+        size=config['api']['image_size']
     )
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    scheduler = GenerationScheduler.from_config(config.get('scheduler', {}))
+    rotation = PromptRotation()
+    inventory = MemeInventory.from_config(meme_generator, scheduler, config.get('inventory', {}), rotation)
+    compositor = MemeCompositor.from_config(
+        config.get('compositor', {}),
+        size=int(config['api']['image_size'].split('x')[0])
     )
-    handler.setFormatter(formatter)
-    logger.addHandler(handler)
+    rate_limiter = RateLimiter.from_config(config['bot'], config.get('rate_limits', {}))
+    handlers = CommandHandlers(meme_generator, scheduler, inventory, compositor, rate_limiter, rotation,
+                               admin_ids=config['bot'].get('admin_ids') or [])
 
-    # Also log to console
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(formatter)
-    logger.addHandler(console_handler)
+    # Counters are read from their owners at scrape time
+    registry.register('memes_total', 'Memes served by outcome', 'counter',
+                      lambda: {'success': stats.successful_generations, 'failure': stats.failed_generations},
+                      label='outcome')
+    registry.register('image_api_retries_total', 'Image API calls retried', 'counter',
+                      lambda: retry_policy.retries)
+    registry.register('image_api_breaker_trips_total', 'Times the image API circuit breaker opened', 'counter',
+                      lambda: retry_policy.breaker.trips)
+    registry.register('image_cache_requests_total', 'Image cache lookups by result', 'counter',
+                      lambda: {'hit': image_cache.hits, 'miss': image_cache.misses}, label='result')
+    registry.register('generation_queue_depth', 'Generation jobs waiting for a worker', 'gauge',
+                      lambda: scheduler.depth)
+    registry.register('generation_rejected_total', 'Requests turned away because the queue was full', 'counter',
+                      lambda: scheduler.metrics.rejected)
+    registry.register('generation_coalesced_total', 'Requests that shared an in-flight generation', 'counter',
+                      lambda: scheduler.metrics.coalesced)
+    registry.register('inventory_stock', 'Pre-generated memes ready to serve', 'gauge',
+                      lambda: inventory.level)
+    registry.register('inventory_refills_total', 'Memes generated into stock by outcome', 'counter',
+                      lambda: {'success': inventory.metrics.refills, 'failure': inventory.metrics.refill_failures},
+                      label='outcome')
+    registry.register('inventory_refill_rate', 'Refills per hour since the inventory started', 'gauge',
+                      lambda: inventory.metrics.refill_rate)
+    registry.register('inventory_spent_today_usd', 'Dollars spent on refills today', 'gauge',
+                      lambda: inventory.spent_today)
+    metrics_config = config.get('metrics', {})
+    metrics_server = MetricsServer.from_config(registry, metrics_config) if metrics_config.get('enabled') else None
 
-def load_config():
-    """Load configuration from YAML file"""
-    with open('config/config.yml', 'r') as f:
-        return yaml.safe_load(f)
+    async def startup(application):
+        # Nothing here depends on anything else, and all of it used to be paid by the first requests
+        connections = config.get('warmup', {}).get('connections', 2)
+        await warm_up({
+            'analytics': lambda: asyncio.to_thread(stats.load),
+            'image cache': lambda: asyncio.to_thread(image_cache.load_index),
+            'compositor': lambda: asyncio.to_thread(compositor.preload),
+            'image API': lambda: image_client.warm_up(connections),
+            'Bot API': lambda: warm_telegram(application.bot, connections)
+        })
+        await scheduler.start()
+        await inventory.start()
+        analytics_config = config.get('analytics', {})
+        await stats.start(analytics_config.get('snapshot_interval_seconds', 60),
+                          shared=analytics_config.get('shared', False))
+        if metrics_server:
+            await metrics_server.start()
+
+    async def shutdown(application):
+        if metrics_server:
+            await metrics_server.stop()
+        await inventory.stop()
+        await scheduler.stop()
+        await image_client.aclose()
+        postprocessor.shutdown()
+        await stats.stop()
+        stop_writer()
+
+    # Create application
+    builder = (
+        ApplicationBuilder()
+        .token(token)
+        .concurrent_updates(UpdateProcessor(config['bot'].get('max_concurrent_updates', 32)))
+        .post_init(startup)
+        .post_shutdown(shutdown)
+    )
+    if request is not None:
+        builder = builder.request(request).get_updates_request(request)
+    application = builder.build()
+
+    # Add handlers
+    application.add_handler(CommandHandler("meme", handlers.meme_command))
+    application.add_handler(CommandHandler("stats", handlers.stats_command))
+    application.add_handler(CommandHandler("help", handlers.help_command))
+    application.add_handler(CommandHandler("menu", handlers.menu_command))
+    application.add_handler(CommandHandler("perf", handlers.perf_command))
+    application.add_handler(CallbackQueryHandler(handlers.button_callback))
+    return application
 
 def main():
-    # Setup logging
-    setup_logging()
-    logger = logging.getLogger(__name__)
-    logger.info("Starting bot...")
+    # Workers are spawned by the dispatcher with their shard in the environment
+    worker_index = os.getenv(WORKER_INDEX_ENV)
 
     # Load configuration
     config = load_config()
+
+    # Setup logging; a rotating log file cannot be shared between processes
+    setup_logging(config.get('logging', {}),
+                  f"logs/bot.worker{worker_index}.log" if worker_index is not None else 'logs/bot.log')
+    logger = logging.getLogger(__name__)
+    logger.info("Starting bot..." if worker_index is None else f"Starting worker {worker_index}...")
     logger.info("Configuration loaded")
 
-    # Initialize database
+    # Initialize database; migrations and archiving run once, before any worker starts
     init_db()
-    logger.info("Database initialized")
+    db_config = config.get('database', {})
+    if db_config.get('archive_after_days') and worker_index is None:
+        archive_old_history(db_config['archive_after_days'])
 
     # Get environment variables
     token = os.getenv('TELEGRAM_BOT_TOKEN')
@@ -58,22 +167,41 @@ def main():
         logger.error("Missing required environment variables")
         return
 
-    # Initialize components
-    meme_generator = MemeGenerator(api_key)
-    handlers = CommandHandlers(meme_generator)
+    worker_count = config.get('workers', {}).get('count', 1)
+    webhook_config = config.get('webhook', {})
+    if worker_index is None and worker_count > 1:
+        Dispatcher.from_config(
+            token, [sys.executable, os.path.abspath(__file__)], config,
+            url=os.getenv('WEBHOOK_URL'), secret_token=os.getenv('TELEGRAM_WEBHOOK_SECRET')
+        ).run()
+        return
+    if worker_index is not None:
+        config = worker_config(config, int(worker_index), int(os.environ[WORKER_PORT_ENV]))
 
-    # Create application
-    application = ApplicationBuilder().token(token).build()
+    start_writer(
+        batch_size=db_config.get('batch_size', 500),
+        flush_interval=db_config.get('flush_interval_seconds', 0.5)
+    )
+    logger.info("Database initialized")
 
-    # Add handlers
-    application.add_handler(CommandHandler("meme", handlers.meme_command))
-    application.add_handler(CommandHandler("stats", handlers.stats_command))
-    application.add_handler(CommandHandler("help", handlers.help_command))
-    application.add_handler(CommandHandler("menu", handlers.menu_command))
+    application = build_application(config, token, api_key)
 
     # Start the bot
     logger.info("Bot started successfully")
-    application.run_polling()
+    if worker_index is not None:
+        from src.webhook import WebhookServer
+        # Only the dispatcher talks to Telegram about updates; it posts this shard's to localhost
+        WebhookServer(
+            application, os.environ[WORKER_SECRET_ENV], path=WORKER_PATH, listen='127.0.0.1',
+            port=int(os.environ[WORKER_PORT_ENV]), max_pending=webhook_config.get('max_pending_updates', 1000)
+        ).run()
+    elif webhook_config.get('enabled'):
+        # Telegram echoes the secret in every delivery; a random one is fine since we register it
+        secret_token = os.getenv('TELEGRAM_WEBHOOK_SECRET') or secrets.token_urlsafe(32)
+        from src.webhook import WebhookServer
+        WebhookServer.from_config(application, webhook_config, secret_token, url=os.getenv('WEBHOOK_URL')).run()
+    else:
+        application.run_polling()
 
 if __name__ == '__main__':
-    main() 
\ No newline at end of file
+    main()
\ No newline at end of file
@@ -1,32 +1,315 @@
+import asyncio
+import hashlib
+import logging
+import math
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Set
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Set, Tuple
+from .database import get_db
+
+logger = logging.getLogger(__name__)
+
+class HyperLogLog:
+    """Approximate distinct counter in 2**precision bytes (about 1.6% error at precision 12)"""
+
+    def __init__(self, precision: int = 12, registers: Optional[bytes] = None):
+        self.precision = precision
+        self.size = 1 << precision
+        self.registers = bytearray(registers) if registers else bytearray(self.size)
+        self._alpha = 0.7213 / (1 + 1.079 / self.size)
+        # Kept up to date on every register change so count() is O(1)
+        self._zeros = self.registers.count(0)
+        self._inverse_sum = sum(2.0 ** -r for r in self.registers)
+
+    def add(self, item) -> bool:
+        """Add an item; True when the estimate may have changed"""
+        digest = hashlib.blake2b(str(item).encode(), digest_size=8).digest()
+        value = int.from_bytes(digest, 'big')
+        index = value >> (64 - self.precision)
+        rest_bits = 64 - self.precision
+        rank = rest_bits - (value & ((1 << rest_bits) - 1)).bit_length() + 1
+        old = self.registers[index]
+        if rank <= old:
+            return False
+        self.registers[index] = rank
+        self._inverse_sum += 2.0 ** -rank - 2.0 ** -old
+        if old == 0:
+            self._zeros -= 1
+        return True
+
+    def count(self) -> int:
+        """Estimated number of distinct items added"""
+        estimate = self._alpha * self.size * self.size / self._inverse_sum
+        if estimate <= 2.5 * self.size and self._zeros:
+            # Linear counting is more accurate while many registers are still empty
+            estimate = self.size * math.log(self.size / self._zeros)
+        return round(estimate)
+
+    def merge(self, registers: bytes):
+        """Union with another sketch of the same precision"""
+        self.registers = bytearray(merge_registers(self.registers, registers))
+        self._zeros = self.registers.count(0)
+        self._inverse_sum = sum(2.0 ** -r for r in self.registers)
+
+def merge_registers(a: bytes, b: bytes) -> bytes:
+    """Register-wise max, the union of two HyperLogLog sketches; also used as an SQL function"""
+    return bytes(map(max, a, b))
 
 @dataclass
-class BotStats:
-    total_memes: int = 0
-    successful_generations: int = 0
-    failed_generations: int = 0
-    unique_users: Set[int] = None
-    
-    def __post_init__(self):
-        if self.unique_users is None:
-            self.unique_users = set()
-
-    def track_usage(self, user_id: int, success: bool):
-        """Track bot usage statistics"""
-        self.total_memes += 1
-        self.unique_users.add(user_id)
+class Counts:
+    memes: int = 0
+    successes: int = 0
+    failures: int = 0
+
+    def add(self, success: bool):
+        self.memes += 1
         if success:
-            self.successful_generations += 1
+            self.successes += 1
         else:
-            self.failed_generations += 1
+            self.failures += 1
+
+    def merge(self, other: 'Counts'):
+        self.memes += other.memes
+        self.successes += other.successes
+        self.failures += other.failures
 
     @property
     def success_rate(self) -> float:
-        """Calculate success rate percentage"""
-        if self.total_memes == 0:
+        """Success rate percentage"""
+        if self.memes == 0:
             return 0.0
-        return (self.successful_generations / self.total_memes) * 100
+        return (self.successes / self.memes) * 100
+
+SnapshotRows = Tuple[List[tuple], List[tuple]]
+
+class BotStats:
+    """Incremental usage counters and rollups, snapshotted to SQLite so they survive restarts
+
+    Snapshots add this process's changes to the stored rows rather than overwrite them, so
+    several bot processes can share one database; in shared mode each snapshot also reads
+    back what the others wrote.
+    """
+
+    def __init__(self, hours_kept: int = 48, days_kept: int = 90):
+        self.hours_kept = hours_kept
+        self.days_kept = days_kept
+        self.total = Counts()
+        self.hours: "OrderedDict[str, Counts]" = OrderedDict()
+        self.days: "OrderedDict[str, Counts]" = OrderedDict()
+        self.slogans: Dict[str, Counts] = {}
+        self.qualities: Dict[str, Counts] = {}
+        self.users = HyperLogLog()
+        self.daily_users: "OrderedDict[str, HyperLogLog]" = OrderedDict()
+        self.top_slogan: Optional[str] = None
+        self.shared = False
+        # Changes since the last snapshot: count deltas, and sketches to merge into the stored ones
+        self._pending: Dict[Tuple[str, str], Counts] = {}
+        self._dirty_users: Set[str] = set()
+        self._task = None
+
+    def track_usage(self, user_id: int, success: bool, slogan: Optional[str] = None,
+                    quality: Optional[str] = None, when: Optional[datetime] = None):
+        """Track bot usage statistics"""
+        when = when or datetime.now()
+        hour, day = when.strftime('%Y-%m-%dT%H'), when.strftime('%Y-%m-%d')
+
+        changed = [('total', ''), ('hour', hour), ('day', day)]
+        if slogan:
+            changed.append(('slogan', slogan))
+        if quality:
+            changed.append(('quality', quality))
+        for scope, key in changed:
+            self._counts(scope, key).add(success)
+            self._pending.setdefault((scope, key), Counts()).add(success)
+        if slogan and (self.top_slogan is None
+                       or self.slogans[slogan].memes > self.slogans[self.top_slogan].memes):
+            self.top_slogan = slogan
+
+        if self.users.add(user_id):
+            self._dirty_users.add('')
+        if self._daily_sketch(day).add(user_id):
+            self._dirty_users.add(day)
+
+    def _counts(self, scope: str, key: str) -> Counts:
+        """The in-memory Counts behind a snapshot row, created when missing"""
+        if scope == 'total':
+            return self.total
+        if scope == 'hour':
+            return self._bucket(self.hours, key, self.hours_kept)
+        if scope == 'day':
+            return self._bucket(self.days, key, self.days_kept)
+        return {'slogan': self.slogans, 'quality': self.qualities}[scope].setdefault(key, Counts())
+
+    def _daily_sketch(self, day: str) -> HyperLogLog:
+        sketch = self.daily_users.get(day)
+        if sketch is None:
+            sketch = self.daily_users[day] = HyperLogLog()
+            while len(self.daily_users) > self.days_kept:
+                self.daily_users.popitem(last=False)
+        return sketch
+
+    @staticmethod
+    def _bucket(buckets: "OrderedDict[str, Counts]", key: str, kept: int) -> Counts:
+        counts = buckets.get(key)
+        if counts is None:
+            counts = buckets[key] = Counts()
+            while len(buckets) > kept:
+                buckets.popitem(last=False)
+        return counts
+
+    @property
+    def total_memes(self) -> int:
+        return self.total.memes
+
+    @property
+    def successful_generations(self) -> int:
+        return self.total.successes
+
+    @property
+    def failed_generations(self) -> int:
+        return self.total.failures
+
+    @property
+    def success_rate(self) -> float:
+        """Calculate success rate percentage"""
+        return self.total.success_rate
+
+    @property
+    def unique_users(self) -> int:
+        """Approximate number of distinct users ever seen"""
+        return self.users.count()
+
+    def today(self) -> Tuple[Counts, int]:
+        """Today's counts and approximate distinct users"""
+        day = datetime.now().strftime('%Y-%m-%d')
+        users = self.daily_users.get(day)
+        return self.days.get(day, Counts()), users.count() if users else 0
+
+    def load(self):
+        """Restore counters from the last snapshot, seeding from user_stats on first use"""
+        with get_db() as conn:
+            rows = self._read(conn)
+            if not rows[0]:
+                self._seed_from_user_stats(conn)
+                return
+        self._apply(rows)
+        logger.info(f"Loaded analytics snapshot: {self.total_memes} memes, ~{self.unique_users} users")
+
+    @staticmethod
+    def _read(conn) -> SnapshotRows:
+        counts = conn.execute(
+            'SELECT scope, key, memes, successes, failures FROM analytics_counts ORDER BY scope, key'
+        ).fetchall()
+        sketches = conn.execute('SELECT key, registers FROM analytics_users ORDER BY key').fetchall()
+        return counts, sketches
+
+    def _apply(self, rows: SnapshotRows):
+        """Replace the in-memory counts with stored ones plus changes not yet snapshotted"""
+        counts, sketches = rows
+        now = datetime.now()
+        oldest_hour = (now - timedelta(hours=self.hours_kept)).strftime('%Y-%m-%dT%H')
+        oldest_day = (now - timedelta(days=self.days_kept)).strftime('%Y-%m-%d')
+
+        self.total = Counts()
+        for buckets in (self.hours, self.days, self.slogans, self.qualities):
+            buckets.clear()
+        for scope, key, memes, successes, failures in counts:
+            if (scope == 'hour' and key <= oldest_hour) or (scope == 'day' and key <= oldest_day):
+                continue
+            self._counts(scope, key).merge(Counts(memes, successes, failures))
+        for (scope, key), delta in self._pending.items():
+            self._counts(scope, key).merge(delta)
+        # Sketches are merged rather than replaced, so local additions are never lost
+        for key, registers in sketches:
+            if key == '':
+                self.users.merge(registers)
+            elif key > oldest_day:
+                self._daily_sketch(key).merge(registers)
+        self.top_slogan = max(self.slogans, key=lambda slogan: self.slogans[slogan].memes) if self.slogans else None
+
+    def _seed_from_user_stats(self, conn):
+        row = conn.execute(
+            'SELECT SUM(total_memes), SUM(successful_generations), SUM(failed_generations) FROM user_stats'
+        ).fetchone()
+        if not row[0]:
+            return
+        self.total = Counts(row[0], row[1] or 0, row[2] or 0)
+        self._pending[('total', '')] = Counts(row[0], row[1] or 0, row[2] or 0)
+        for (user_id,) in conn.execute('SELECT user_id FROM user_stats'):
+            self.users.add(user_id)
+        self._dirty_users.add('')
+        logger.info(f"Seeded analytics from user_stats: {self.total_memes} memes, ~{self.unique_users} users")
+
+    def _take_changes(self) -> Tuple[Dict[Tuple[str, str], Counts], Dict[str, bytes]]:
+        pending, self._pending = self._pending, {}
+        dirty, self._dirty_users = self._dirty_users, set()
+        sketches = {}
+        for key in dirty:
+            sketch = self.users if key == '' else self.daily_users.get(key)
+            if sketch is not None:
+                sketches[key] = bytes(sketch.registers)
+        return pending, sketches
+
+    def _restore_changes(self, pending: Dict[Tuple[str, str], Counts], sketches: Dict[str, bytes]):
+        for scope_key, delta in pending.items():
+            self._pending.setdefault(scope_key, Counts()).merge(delta)
+        self._dirty_users.update(sketches)
+
+    @classmethod
+    def _write(cls, pending: Dict[Tuple[str, str], Counts], sketches: Dict[str, bytes],
+               read_back: bool) -> Optional[SnapshotRows]:
+        """Add count deltas and merge sketches in one transaction, optionally reading back the result"""
+        with get_db() as conn:
+            conn.create_function('hll_merge', 2, merge_registers, deterministic=True)
+            conn.executemany(
+                'INSERT INTO analytics_counts (scope, key, memes, successes, failures) VALUES (?, ?, ?, ?, ?) '
+                'ON CONFLICT (scope, key) DO UPDATE SET memes = memes + excluded.memes, '
+                'successes = successes + excluded.successes, failures = failures + excluded.failures',
+                [(scope, key, c.memes, c.successes, c.failures) for (scope, key), c in pending.items()]
+            )
+            conn.executemany(
+                'INSERT INTO analytics_users (key, registers) VALUES (?, ?) '
+                'ON CONFLICT (key) DO UPDATE SET registers = hll_merge(registers, excluded.registers)',
+                list(sketches.items())
+            )
+            rows = cls._read(conn) if read_back else None
+            conn.commit()
+        return rows
+
+    async def snapshot(self):
+        """Persist the changes since the last snapshot; in shared mode pick up other processes' too"""
+        pending, sketches = self._take_changes()
+        if not pending and not sketches and not self.shared:
+            return
+        try:
+            rows = await asyncio.to_thread(self._write, pending, sketches, self.shared)
+        except Exception:
+            self._restore_changes(pending, sketches)
+            raise
+        if rows is not None:
+            self._apply(rows)
+
+    async def start(self, interval: float = 60.0, shared: bool = False):
+        """Snapshot to SQLite every `interval` seconds"""
+        self.shared = shared
+        if self._task is None:
+            self._task = asyncio.create_task(self._snapshot_loop(interval))
+
+    async def stop(self):
+        """Stop the snapshot loop and write a final snapshot"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        await self.snapshot()
+
+    async def _snapshot_loop(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.snapshot()
+            except Exception as e:
+                logger.error(f"Analytics snapshot failed: {e}")
 
-stats = BotStats() 
\ No newline at end of file
+stats = BotStats()
\ No newline at end of file
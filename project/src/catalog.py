@@ -0,0 +1,172 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import unicodedata
+from collections import OrderedDict
+from functools import lru_cache
+from typing import List, Optional, Sequence, Tuple
+from .database import execute_write, get_db
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'data', 'catalog.json')
+
+class AliasTable:
+    """Walker/Vose alias table: O(n) to build, O(1) per weighted draw"""
+
+    def __init__(self, weights: Sequence[float]):
+        total = float(sum(weights))
+        if not weights or total <= 0 or min(weights) < 0:
+            raise ValueError("Alias table needs non-negative weights with a positive sum")
+        n = len(weights)
+        scaled = [weight * n / total for weight in weights]
+        self.probability = [1.0] * n
+        self.alias = list(range(n))
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            low, high = small.pop(), large.pop()
+            self.probability[low] = scaled[low]
+            self.alias[low] = high
+            scaled[high] -= 1.0 - scaled[low]
+            (small if scaled[high] < 1.0 else large).append(high)
+        # Whatever is left is 1.0 up to rounding error
+
+    def sample(self, rng: random.Random = random) -> int:
+        column = rng.randrange(len(self.alias))
+        return column if rng.random() < self.probability[column] else self.alias[column]
+
+def _normalized(name: str) -> str:
+    # "Male" and "Malé" are the same city
+    decomposed = unicodedata.normalize('NFKD', name)
+    return ''.join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+class Catalog:
+    """Slogans, meme ideas and cities, addressed by a single pair index slogan * len(cities) + city"""
+
+    def __init__(self, slogans: Sequence[Tuple[str, str]], cities: Sequence[str],
+                 slogan_weights: Optional[Sequence[float]] = None,
+                 city_weights: Optional[Sequence[float]] = None):
+        self.slogans = tuple(slogans)
+        self.cities = tuple(cities)
+        self.slogan_table = AliasTable(slogan_weights or [1.0] * len(self.slogans))
+        self.city_table = AliasTable(city_weights or [1.0] * len(self.cities))
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_CATALOG_PATH) -> 'Catalog':
+        """Read the catalog file, dropping duplicate slogans and cities"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+
+        slogans, slogan_weights, seen = [], [], set()
+        for entry in data['slogans']:
+            if entry['slogan'] in seen:
+                logger.warning(f"Duplicate slogan in {path}: {entry['slogan']!r}")
+                continue
+            seen.add(entry['slogan'])
+            slogans.append((entry['slogan'], entry['idea']))
+            slogan_weights.append(entry.get('weight', 1.0))
+
+        city_weights_by_name = data.get('city_weights', {})
+        cities, city_weights, seen = [], [], set()
+        for city in data['cities']:
+            key = _normalized(city)
+            if key in seen:
+                logger.warning(f"Duplicate city in {path}: {city!r}")
+                continue
+            seen.add(key)
+            cities.append(city)
+            city_weights.append(city_weights_by_name.get(city, 1.0))
+
+        return cls(slogans, cities, slogan_weights, city_weights)
+
+    @property
+    def size(self) -> int:
+        return len(self.slogans) * len(self.cities)
+
+    def pair(self, index: int) -> Tuple[str, str, str]:
+        """(slogan, meme idea, city) at a pair index"""
+        slogan, meme_idea = self.slogans[index // len(self.cities)]
+        return slogan, meme_idea, self.cities[index % len(self.cities)]
+
+    def sample(self, rng: random.Random = random) -> Tuple[str, str, str]:
+        """Weighted random (slogan, meme idea, city)"""
+        slogan, meme_idea = self.slogans[self.slogan_table.sample(rng)]
+        return slogan, meme_idea, self.cities[self.city_table.sample(rng)]
+
+@lru_cache(maxsize=4)
+def load_catalog(path: str = DEFAULT_CATALOG_PATH) -> Catalog:
+    """The catalog at `path`, read once per process"""
+    return Catalog.load(path)
+
+def _mix(value: int) -> int:
+    value = ((value ^ (value >> 16)) * 0x45D9F3B) & 0xFFFFFFFF
+    value = ((value ^ (value >> 16)) * 0x45D9F3B) & 0xFFFFFFFF
+    return value ^ (value >> 16)
+
+def permuted_index(position: int, size: int, seed: int) -> int:
+    """Element `position` of a seeded shuffle of range(size), without building the shuffle"""
+    # A 4-round Feistel network is a bijection on the next even power of two;
+    # walking the cycle until the value lands below size keeps it one on range(size)
+    bits = max(2, (size - 1).bit_length())
+    bits += bits & 1
+    half = bits // 2
+    mask = (1 << half) - 1
+    value = position
+    while True:
+        left, right = value >> half, value & mask
+        for round_key in range(4):
+            left, right = right, left ^ (_mix(right ^ _mix(seed + round_key)) & mask)
+        value = (left << half) | right
+        if value < size:
+            return value
+
+class PromptRotation:
+    """Walks each chat through every slogan and city pairing in a shuffled order before repeating"""
+
+    def __init__(self, catalog: Optional[Catalog] = None, max_cached: int = 10000):
+        self.catalog = catalog or load_catalog()
+        self.max_cached = max_cached
+        # chat -> [seed, size, position]; chats are sharded and stock keys are per worker,
+        # so only this process moves a given cursor
+        self._cursors: 'OrderedDict[str, List[int]]' = OrderedDict()
+
+    @staticmethod
+    def _read_cursor(chat_id: str) -> List[int]:
+        with get_db() as conn:
+            row = conn.execute(
+                'SELECT seed, size, position FROM rotation_cursors WHERE chat_id = ?', (chat_id,)
+            ).fetchone()
+        return list(row) if row else [0, 0, 0]
+
+    async def _cursor(self, chat_id: str) -> List[int]:
+        cursor = self._cursors.get(chat_id)
+        if cursor is not None:
+            self._cursors.move_to_end(chat_id)
+            return cursor
+        # First use of the chat, or evicted: read it in a thread, not on the event loop
+        loaded = await asyncio.to_thread(self._read_cursor, chat_id)
+        # Another request for the chat may have loaded it while this one waited
+        cursor = self._cursors.setdefault(chat_id, loaded)
+        self._cursors.move_to_end(chat_id)
+        if len(self._cursors) > self.max_cached:
+            self._cursors.popitem(last=False)
+        return cursor
+
+    async def next(self, chat_id) -> Tuple[str, str, str]:
+        """Next (slogan, meme idea, city) for the chat; the position survives restarts"""
+        chat_id = str(chat_id)
+        cursor = await self._cursor(chat_id)
+        size = self.catalog.size
+        if cursor[1] != size or cursor[2] >= size:
+            # First pass, finished pass, or the catalog changed: start a new shuffle
+            cursor[:] = [random.getrandbits(32), size, 0]
+        seed, _, position = cursor
+        cursor[2] += 1
+        execute_write([(
+            'INSERT OR REPLACE INTO rotation_cursors (chat_id, seed, size, position) VALUES (?, ?, ?, ?)',
+            (chat_id, seed, size, position + 1)
+        )])
+        return self.catalog.pair(permuted_index(position, size, seed))
\ No newline at end of file
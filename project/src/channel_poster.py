@@ -0,0 +1,307 @@
+import asyncio
+import logging
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from io import BytesIO
+from typing import Awaitable, Callable, Iterator, List, Optional, Set, Tuple
+from .catalog import PromptRotation
+from .database import get_db
+
+logger = logging.getLogger(__name__)
+
+# What to do with slots that passed while the bot was down
+MISSED_POLICIES = ('skip', 'latest', 'catch_up')
+
+def _parse_field(field: str, low: int, high: int) -> Set[int]:
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step = part.split('/')
+            step = int(step)
+            if step < 1:
+                raise ValueError(f"Invalid cron step in {field!r}")
+        if part == '*':
+            start, end = low, high
+        elif '-' in part:
+            start, end = (int(value) for value in part.split('-'))
+        else:
+            start = int(part)
+            # "5/15" means every 15 starting at 5
+            end = high if step > 1 else start
+        if start < low or end > high or start > end:
+            raise ValueError(f"Cron field {field!r} is outside {low}-{high}")
+        values.update(range(start, end + 1, step))
+    return values
+
+class CronSchedule:
+    """Five-field cron expression: minute, hour, day of month, month, day of week"""
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minutes = _parse_field(fields[0], 0, 59)
+        self.hours = _parse_field(fields[1], 0, 23)
+        self.days = _parse_field(fields[2], 1, 31)
+        self.months = _parse_field(fields[3], 1, 12)
+        self.weekdays = {day % 7 for day in _parse_field(fields[4], 0, 7)}
+        # As in cron, when both day fields are restricted a match on either is enough
+        self._either_day = not fields[2].startswith('*') and not fields[4].startswith('*')
+
+    def _day_matches(self, moment: datetime) -> bool:
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        return (day or weekday) if self._either_day else (day and weekday)
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First slot strictly after `moment`"""
+        t = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        # Long enough for a 29 February schedule
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = (t.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+            elif not self._day_matches(t):
+                t = t.replace(hour=0, minute=0) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = t.replace(minute=0) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"Cron expression never fires: {self.expression!r}")
+
+    def slots_between(self, start: datetime, end: datetime) -> Iterator[datetime]:
+        """Slots after `start` up to and including `end`"""
+        slot = self.next_after(start)
+        while slot <= end:
+            yield slot
+            slot = self.next_after(slot)
+
+@dataclass
+class ChannelSchedule:
+    id: int
+    channel_id: str
+    cron: CronSchedule
+    missed: str = 'skip'
+    lead: timedelta = timedelta(minutes=30)
+    last_slot: Optional[datetime] = None
+
+def _execute(sql: str, params: tuple):
+    with get_db() as conn:
+        conn.execute(sql, params)
+        conn.commit()
+
+def _fetchone(sql: str, params: tuple) -> Optional[tuple]:
+    with get_db() as conn:
+        return conn.execute(sql, params).fetchone()
+
+def _as_datetime(value) -> Optional[datetime]:
+    return datetime.fromisoformat(value) if isinstance(value, str) else value
+
+def register_schedule(channel_id: str, cron: str, missed: str = 'skip', lead_minutes: int = 30) -> ChannelSchedule:
+    """Persist a channel schedule, keeping the last slot handled if it already exists"""
+    if missed not in MISSED_POLICIES:
+        raise ValueError(f"Unknown missed-post policy {missed!r}, expected one of {MISSED_POLICIES}")
+    schedule = CronSchedule(cron)
+    with get_db() as conn:
+        conn.execute('''
+            INSERT INTO channel_schedules (channel_id, cron, missed, lead_minutes) VALUES (?, ?, ?, ?)
+            ON CONFLICT (channel_id, cron) DO UPDATE SET
+                missed = excluded.missed,
+                lead_minutes = excluded.lead_minutes
+        ''', (str(channel_id), cron, missed, lead_minutes))
+        conn.commit()
+        schedule_id, last_slot = conn.execute(
+            'SELECT id, last_slot FROM channel_schedules WHERE channel_id = ? AND cron = ?', (str(channel_id), cron)
+        ).fetchone()
+    return ChannelSchedule(schedule_id, str(channel_id), schedule, missed, timedelta(minutes=lead_minutes),
+                           _as_datetime(last_slot))
+
+class ChannelPoster:
+    """Posts to channels on cron schedules, generating each post before its slot comes up
+
+    Posts carry image BLOBs of several MB, so every query runs in a thread, off the bot's loop.
+    """
+
+    def __init__(self, schedules: List[ChannelSchedule], rotation: PromptRotation,
+                 compose: Callable[[str, str, str], Tuple[str, str]],
+                 generate: Callable[[str], Awaitable[bytes]],
+                 send: Callable[[str, BytesIO, str], Awaitable[bool]],
+                 grace: timedelta = timedelta(minutes=10), max_catch_up: int = 3,
+                 max_attempts: int = 3, tick: float = 30.0):
+        self.schedules = schedules
+        self.rotation = rotation
+        self.compose = compose
+        self.generate = generate
+        self.send = send
+        self.grace = grace
+        self.max_catch_up = max_catch_up
+        self.max_attempts = max_attempts
+        self.tick = tick
+        self._preparing = {}
+        self._task = None
+
+    async def start(self):
+        """Start the posting loop"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+            logger.info(f"Channel poster started with {len(self.schedules)} schedules")
+
+    async def stop(self):
+        """Stop posting and abandon in-progress generation"""
+        tasks = [self._task, *self._preparing.values()] if self._task else list(self._preparing.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    async def _run(self):
+        while True:
+            try:
+                await self.run_once(datetime.now())
+            except Exception as e:
+                logger.error(f"Channel poster error: {e}")
+            await asyncio.sleep(self._seconds_until_next_event(datetime.now()))
+
+    def _seconds_until_next_event(self, now: datetime) -> float:
+        wake = now + timedelta(seconds=self.tick)
+        for schedule in self.schedules:
+            slot = schedule.cron.next_after(now)
+            wake = min(wake, slot)
+            if slot - schedule.lead > now:
+                wake = min(wake, slot - schedule.lead)
+        return max(0.0, (wake - now).total_seconds())
+
+    async def run_once(self, now: datetime):
+        """Post whatever is due and start generating upcoming slots"""
+        for schedule in self.schedules:
+            if schedule.last_slot is None:
+                # Never back-fill history on the very first run
+                await self._set_last_slot(schedule, now)
+            await self._post_due(schedule, now)
+            await self._prepare_upcoming(schedule, now)
+
+    async def _post_due(self, schedule: ChannelSchedule, now: datetime):
+        recent = deque(maxlen=max(1, self.max_catch_up))
+        overflow = 0
+        for slot in schedule.cron.slots_between(schedule.last_slot, now):
+            if len(recent) == recent.maxlen:
+                overflow += 1
+            recent.append(slot)
+        if not recent:
+            return
+
+        if schedule.missed == 'catch_up':
+            due = list(recent)
+        elif schedule.missed == 'latest':
+            due = [recent[-1]]
+        else:
+            due = [slot for slot in recent if now - slot <= self.grace]
+        skipped = overflow + len(recent) - len(due)
+        if skipped:
+            logger.warning(f"Skipping {skipped} missed slots for channel {schedule.channel_id} "
+                           f"({schedule.cron.expression}, policy {schedule.missed})")
+
+        for slot in due:
+            await self._post_slot(schedule, slot)
+            await self._set_last_slot(schedule, slot)
+        await self._set_last_slot(schedule, recent[-1])
+
+        await asyncio.to_thread(_execute, '''
+            UPDATE channel_posts SET status = 'skipped', image = NULL
+            WHERE schedule_id = ? AND slot <= ? AND status IN ('pending', 'ready')
+        ''', (schedule.id, recent[-1]))
+
+    async def _post_slot(self, schedule: ChannelSchedule, slot: datetime):
+        preparing = self._preparing.get((schedule.id, slot))
+        if preparing is not None:
+            await asyncio.gather(preparing, return_exceptions=True)
+
+        post = await self._load(schedule.id, slot)
+        if post is not None and post[0] == 'posted':
+            return
+        if post is None or post[0] != 'ready':
+            # Nothing was generated in advance; do it now and post late rather than not at all
+            logger.warning(f"Slot {slot} for channel {schedule.channel_id} was not pre-generated")
+            if not await self._prepare(schedule, slot):
+                await self._set_status(schedule.id, slot, 'failed')
+                return
+            post = await self._load(schedule.id, slot)
+
+        _, _, caption, image = post
+        if await self.send(schedule.channel_id, BytesIO(image), caption):
+            await asyncio.to_thread(_execute, '''
+                UPDATE channel_posts SET status = 'posted', image = NULL, posted_at = ?
+                WHERE schedule_id = ? AND slot = ?
+            ''', (datetime.now(), schedule.id, slot))
+            delay = (datetime.now() - slot).total_seconds()
+            logger.info(f"Posted slot {slot} to channel {schedule.channel_id} {delay:.2f}s after the slot")
+        else:
+            await self._set_status(schedule.id, slot, 'failed')
+
+    async def _prepare_upcoming(self, schedule: ChannelSchedule, now: datetime):
+        slot = schedule.cron.next_after(max(now, schedule.last_slot))
+        key = (schedule.id, slot)
+        if slot - now > schedule.lead or key in self._preparing:
+            return
+        post = await self._load(schedule.id, slot)
+        if post is not None and (post[0] != 'pending' or post[1] >= self.max_attempts):
+            return
+
+        task = asyncio.create_task(self._prepare(schedule, slot))
+        self._preparing[key] = task
+        task.add_done_callback(lambda _: self._preparing.pop(key, None))
+
+    async def _prepare(self, schedule: ChannelSchedule, slot: datetime) -> bool:
+        row = await asyncio.to_thread(
+            _fetchone, 'SELECT prompt FROM channel_posts WHERE schedule_id = ? AND slot = ?', (schedule.id, slot)
+        )
+        if row is None:
+            slogan, meme_idea, city = await self.rotation.next(schedule.channel_id)
+            prompt, caption = self.compose(slogan, meme_idea, city)
+            await asyncio.to_thread(_execute, '''
+                INSERT INTO channel_posts (schedule_id, slot, status, slogan, prompt, caption)
+                VALUES (?, ?, 'pending', ?, ?, ?)
+            ''', (schedule.id, slot, slogan, prompt, caption))
+        else:
+            prompt = row[0]
+
+        try:
+            image = await self.generate(prompt)
+        except Exception as e:
+            logger.error(f"Generating slot {slot} for channel {schedule.channel_id} failed: {e}")
+            await asyncio.to_thread(
+                _execute, 'UPDATE channel_posts SET attempts = attempts + 1 WHERE schedule_id = ? AND slot = ?',
+                (schedule.id, slot)
+            )
+            return False
+
+        await asyncio.to_thread(_execute, '''
+            UPDATE channel_posts SET status = 'ready', image = ?, attempts = attempts + 1
+            WHERE schedule_id = ? AND slot = ?
+        ''', (image, schedule.id, slot))
+        logger.info(f"Prepared slot {slot} for channel {schedule.channel_id}")
+        return True
+
+    async def _load(self, schedule_id: int, slot: datetime) -> Optional[Tuple[str, int, str, bytes]]:
+        return await asyncio.to_thread(
+            _fetchone,
+            'SELECT status, attempts, caption, image FROM channel_posts WHERE schedule_id = ? AND slot = ?',
+            (schedule_id, slot)
+        )
+
+    async def _set_status(self, schedule_id: int, slot: datetime, status: str):
+        await asyncio.to_thread(
+            _execute, 'UPDATE channel_posts SET status = ?, image = NULL WHERE schedule_id = ? AND slot = ?',
+            (status, schedule_id, slot)
+        )
+
+    async def _set_last_slot(self, schedule: ChannelSchedule, slot: datetime):
+        schedule.last_slot = slot
+        await asyncio.to_thread(
+            _execute, 'UPDATE channel_schedules SET last_slot = ? WHERE id = ?', (slot, schedule.id)
+        )
\ No newline at end of file
@@ -0,0 +1,140 @@
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from typing import TYPE_CHECKING, List, Optional, Tuple
+from .catalog import load_catalog
+
+if TYPE_CHECKING:
+    from PIL import Image
+
+logger = logging.getLogger(__name__)
+
+BANNER_ALPHA = 170
+MAX_PLATES = 64
+
+class MemeCompositor:
+    """Renders memes locally from bee_template.png, with no API call"""
+
+    def __init__(self, template_path: str, size: int = 1024, font_path: Optional[str] = None,
+                 font_size: int = 56, jpeg_quality: int = 85):
+        self.size = size
+        self.jpeg_quality = jpeg_quality
+        self.margin = size // 32
+        self.template_path = template_path
+        self.font_path = font_path
+        self.font_size = font_size
+        # Loaded by preload(), on first render at the latest, so importing PIL stays off startup
+        self._template = None
+
+        self._plates = OrderedDict()
+        self._overlays = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_config(cls, config: dict, size: int = 1024) -> 'MemeCompositor':
+        """Build a compositor from the `compositor` section of config.yml"""
+        return cls(
+            config.get('template_path', '../bee_template.png'),
+            size=size,
+            font_path=config.get('font_path'),
+            font_size=config.get('font_size', 56),
+            jpeg_quality=config.get('jpeg_quality', 85)
+        )
+
+    def preload(self):
+        """Decode the template and fonts; everything that does not depend on the request"""
+        with self._lock:
+            self._preload()
+
+    def _preload(self):
+        if self._template is not None:
+            return
+        from PIL import Image
+        self._font = self._load_font(self.font_path, self.font_size)
+        self._city_font = self._load_font(self.font_path, self.font_size * 2 // 3)
+        self._line_height = sum(self._font.getmetrics()) + self.margin // 4
+        with Image.open(self.template_path) as template:
+            self._template = template.convert('RGBA').resize((self.size, self.size), Image.LANCZOS)
+
+    @staticmethod
+    def _load_font(font_path: Optional[str], font_size: int):
+        from PIL import ImageFont
+        if font_path:
+            try:
+                return ImageFont.truetype(font_path, font_size)
+            except OSError as e:
+                logger.warning(f"Could not load font {font_path}: {e}")
+        return ImageFont.load_default(size=font_size)
+
+    def _wrap(self, text: str, font) -> List[str]:
+        max_width = self.size - 2 * self.margin
+        lines, line = [], ''
+        for word in text.split():
+            candidate = f"{line} {word}".strip()
+            if line and font.getlength(candidate) > max_width:
+                lines.append(line)
+                line = word
+            else:
+                line = candidate
+        if line:
+            lines.append(line)
+        return lines
+
+    def _banner(self, lines: List[str], font, line_height: int) -> 'Image.Image':
+        """Render text on a translucent strip spanning the image width"""
+        from PIL import Image, ImageDraw
+        height = len(lines) * line_height + self.margin
+        banner = Image.new('RGBA', (self.size, height), (0, 0, 0, BANNER_ALPHA))
+        draw = ImageDraw.Draw(banner)
+        for i, line in enumerate(lines):
+            x = (self.size - font.getlength(line)) / 2
+            draw.text((x, self.margin // 2 + i * line_height), line, font=font, fill=(255, 255, 255, 255))
+        return banner
+
+    def _plate(self, city: str) -> 'Image.Image':
+        """Template tinted and captioned for a city, cached per city"""
+        from PIL import Image
+        plate = self._plates.get(city)
+        if plate is not None:
+            self._plates.move_to_end(city)
+            return plate
+
+        digest = hashlib.md5(city.encode('utf-8')).digest()
+        tint = Image.new('RGBA', (self.size, self.size), (digest[0], digest[1], digest[2], 60))
+        plate = Image.alpha_composite(self._template, tint)
+
+        city_line_height = sum(self._city_font.getmetrics()) + self.margin // 4
+        banner = self._banner([f"To Bee or Not To Bee in {city}"], self._city_font, city_line_height)
+        plate.alpha_composite(banner, (0, self.size - banner.height))
+
+        self._plates[city] = plate
+        if len(self._plates) > MAX_PLATES:
+            self._plates.popitem(last=False)
+        return plate
+
+    def _slogan_overlay(self, slogan: str) -> 'Image.Image':
+        """Slogan banner, cached per slogan since the slogan list is fixed"""
+        overlay = self._overlays.get(slogan)
+        if overlay is None:
+            overlay = self._banner(self._wrap(slogan, self._font), self._font, self._line_height)
+            self._overlays[slogan] = overlay
+        return overlay
+
+    def render(self, slogan: str, city: str) -> BytesIO:
+        """Composite a meme and return it as a JPEG buffer"""
+        with self._lock:
+            self._preload()
+            image = self._plate(city).copy()
+            image.alpha_composite(self._slogan_overlay(slogan), (0, 0))
+
+        output = BytesIO()
+        image.convert('RGB').save(output, format='JPEG', quality=self.jpeg_quality)
+        output.seek(0)
+        return output
+
+    def random_meme(self) -> Tuple[str, str, BytesIO]:
+        """Render a meme for a random slogan and city"""
+        slogan, _, city = load_catalog().sample()
+        return slogan, city, self.render(slogan, city)
\ No newline at end of file
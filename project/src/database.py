@@ -1,64 +1,197 @@
 import sqlite3
+import queue
+import threading
+import time
 from contextlib import contextmanager
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 import logging
+from .migrations import run_migrations, archive_history
 
 logger = logging.getLogger(__name__)
 
+DB_PATH = 'bot_data.db'
+
 @contextmanager
 def get_db():
     """Database connection context manager"""
-    conn = sqlite3.connect('bot_data.db')
+    conn = sqlite3.connect(DB_PATH)
     try:
         yield conn
     finally:
         conn.close()
 
+class DatabaseWriter(threading.Thread):
+    """Single long-lived writer that group-commits queued statements"""
+
+    _STOP = object()
+
+    def __init__(self, path: Optional[str] = None, batch_size: int = 500, flush_interval: float = 0.5):
+        super().__init__(name='db-writer', daemon=True)
+        # Resolved here rather than at import so a DB_PATH set at runtime is honoured
+        self.path = path or DB_PATH
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.written = 0
+        self._queue = queue.Queue()
+
+    def submit(self, statements: List[Tuple[str, tuple]]):
+        """Queue statements to be committed together in a later batch"""
+        self._queue.put(statements)
+
+    def close(self):
+        """Flush everything still queued and stop the thread"""
+        self._queue.put(self._STOP)
+        self.join()
+
+    def run(self):
+        conn = sqlite3.connect(self.path, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        try:
+            stopping = False
+            while not stopping:
+                batch = [self._queue.get()]
+                deadline = time.monotonic() + self.flush_interval
+                while len(batch) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    try:
+                        batch.append(self._queue.get(timeout=remaining))
+                    except queue.Empty:
+                        break
+
+                if self._STOP in batch:
+                    stopping = True
+                    batch = [event for event in batch if event is not self._STOP]
+                    # Drain anything submitted before close()
+                    while not self._queue.empty():
+                        batch.append(self._queue.get_nowait())
+                try:
+                    self._commit(conn, batch)
+                except Exception as e:
+                    # Losing one batch is better than losing every write until restart
+                    logger.error(f"Database writer dropped a batch of {len(batch)} events: {e}")
+        finally:
+            conn.close()
+
+    def _commit(self, conn: sqlite3.Connection, batch: list):
+        if not batch:
+            return
+        try:
+            conn.execute('BEGIN')
+            for statements in batch:
+                for sql, params in statements:
+                    conn.execute(sql, params)
+            conn.execute('COMMIT')
+            self.written += len(batch)
+        except Exception as e:
+            # SQLite has already rolled back after errors such as SQLITE_FULL or IOERR
+            if conn.in_transaction:
+                conn.execute('ROLLBACK')
+            logger.error(f"Database error in batch of {len(batch)} events, retrying one by one: {e}")
+            for statements in batch:
+                try:
+                    conn.execute('BEGIN')
+                    for sql, params in statements:
+                        conn.execute(sql, params)
+                    conn.execute('COMMIT')
+                    self.written += 1
+                except Exception as e:
+                    if conn.in_transaction:
+                        conn.execute('ROLLBACK')
+                    logger.error(f"Database error: {e}")
+
+_writer: Optional[DatabaseWriter] = None
+
+def start_writer(batch_size: int = 500, flush_interval: float = 0.5):
+    """Route database writes through a background group-commit writer"""
+    global _writer
+    _writer = DatabaseWriter(batch_size=batch_size, flush_interval=flush_interval)
+    _writer.start()
+
+def stop_writer():
+    """Flush pending writes and stop the background writer"""
+    global _writer
+    if _writer is not None:
+        _writer.close()
+        _writer = None
+
+def execute_write(statements: List[Tuple[str, tuple]]):
+    """Run write statements, through the background writer when it is running"""
+    if _writer is not None:
+        _writer.submit(statements)
+        return
+
+    try:
+        with get_db() as conn:
+            for sql, params in statements:
+                conn.execute(sql, params)
+            conn.commit()
+    except Exception as e:
+        logger.error(f"Database error: {e}")
+
 def init_db():
     """Initialize database tables"""
     with get_db() as conn:
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS meme_history (
-                id INTEGER PRIMARY KEY,
-                user_id INTEGER,
-                slogan TEXT,
-                timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
-            )
-        ''')
-        
-        conn.execute('''
-            CREATE TABLE IF NOT EXISTS user_stats (
-                user_id INTEGER PRIMARY KEY,
-                total_memes INTEGER DEFAULT 0,
-                successful_generations INTEGER DEFAULT 0,
-                failed_generations INTEGER DEFAULT 0,
-                last_used DATETIME
-            )
-        ''')
-        conn.commit()
+        conn.execute('PRAGMA journal_mode=WAL')
+        run_migrations(conn)
+
+def archive_old_history(days: int):
+    """Move meme_history rows older than `days` into the daily rollup table"""
+    try:
+        with get_db() as conn:
+            archived = archive_history(conn, datetime.now() - timedelta(days=days))
+            logger.info(f"Archived {archived} meme_history rows older than {days} days")
+    except Exception as e:
+        logger.error(f"Database error: {e}")
 
 def log_meme_generation(user_id: int, slogan: str, success: bool):
     """Log meme generation attempt to database"""
+    now = datetime.now()
+    execute_write([
+        # Update meme history
+        (
+            'INSERT INTO meme_history (user_id, slogan, timestamp) VALUES (?, ?, ?)',
+            (user_id, slogan, now)
+        ),
+        # Update user stats
+        (
+            '''
+            INSERT INTO user_stats (user_id, total_memes, successful_generations,
+                failed_generations, last_used)
+            VALUES (?, 1, ?, ?, ?)
+            ON CONFLICT(user_id) DO UPDATE SET
+                total_memes = total_memes + 1,
+                successful_generations = successful_generations + ?,
+                failed_generations = failed_generations + ?,
+                last_used = ?
+            ''',
+            (user_id, 1 if success else 0, 0 if success else 1, now,
+             1 if success else 0, 0 if success else 1, now)
+        )
+    ])
+
+def get_file_id(image_key: str) -> Optional[str]:
+    """Return the Telegram file_id previously recorded for an image, if any"""
     try:
         with get_db() as conn:
-            # Update meme history
-            conn.execute(
-                'INSERT INTO meme_history (user_id, slogan, timestamp) VALUES (?, ?, ?)',
-                (user_id, slogan, datetime.now())
-            )
-            
-            # Update user stats
-            conn.execute('''
-                INSERT INTO user_stats (user_id, total_memes, successful_generations, 
-                    failed_generations, last_used)
-                VALUES (?, 1, ?, ?, ?)
-                ON CONFLICT(user_id) DO UPDATE SET
-                    total_memes = total_memes + 1,
-                    successful_generations = successful_generations + ?,
-                    failed_generations = failed_generations + ?,
-                    last_used = ?
-            ''', (user_id, 1 if success else 0, 0 if success else 1, datetime.now(),
-                  1 if success else 0, 0 if success else 1, datetime.now()))
-            conn.commit()
+            row = conn.execute(
+                'SELECT file_id FROM telegram_files WHERE image_key = ?', (image_key,)
+            ).fetchone()
+            return row[0] if row else None
     except Exception as e:
-        logger.error(f"Database error: {e}") 
\ No newline at end of file
+        logger.error(f"Database error: {e}")
+        return None
+
+def save_file_id(image_key: str, file_id: str):
+    """Remember the Telegram file_id of an uploaded image"""
+    execute_write([(
+        'INSERT OR REPLACE INTO telegram_files (image_key, file_id, created) VALUES (?, ?, ?)',
+        (image_key, file_id, datetime.now())
+    )])
+
+def forget_file_id(image_key: str):
+    """Drop a file_id that Telegram no longer accepts"""
+    execute_write([('DELETE FROM telegram_files WHERE image_key = ?', (image_key,))])
\ No newline at end of file
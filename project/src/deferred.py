@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass
+from typing import List, Optional, Set
+from telegram import Bot
+from telegram.error import BadRequest, Forbidden, RetryAfter
+from .database import execute_write, get_db
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class DeferredAction:
+    action: str  # 'delete' or 'edit'
+    chat_id: int
+    message_id: int
+    due: float
+    text: Optional[str] = None
+    attempts: int = 0
+
+class DeferredActions:
+    """Timer wheel of timed message deletions and edits, persisted so they survive restarts
+
+    Scheduling is O(1): an action goes into the slot of the tick it is due on, modulo
+    the wheel size, and each tick only looks at its own slot. Everything due in the
+    same tick is sent to Telegram concurrently.
+    """
+
+    def __init__(self, tick: float = 1.0, slots: int = 512, max_concurrent: int = 20,
+                 max_attempts: int = 3, retry_delay: float = 5.0):
+        self.tick = tick
+        self.max_concurrent = max_concurrent
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.done = 0
+        self.failed = 0
+        self._wheel: List[List[DeferredAction]] = [[] for _ in range(slots)]
+        self._current = self._tick_of(time.time())
+        self._bot: Optional[Bot] = None
+        self._task: Optional[asyncio.Task] = None
+        self._batches: Set[asyncio.Future] = set()
+
+    def _tick_of(self, moment: float) -> int:
+        return int(moment // self.tick)
+
+    @property
+    def pending(self) -> int:
+        return sum(len(slot) for slot in self._wheel)
+
+    def _add(self, entry: DeferredAction):
+        # Anything already overdue goes out on the next tick
+        tick = max(self._tick_of(entry.due), self._current)
+        self._wheel[tick % len(self._wheel)].append(entry)
+
+    def _schedule(self, entry: DeferredAction):
+        execute_write([(
+            'INSERT OR REPLACE INTO deferred_actions (action, chat_id, message_id, text, due) '
+            'VALUES (?, ?, ?, ?, ?)',
+            (entry.action, entry.chat_id, entry.message_id, entry.text, entry.due)
+        )])
+        self._add(entry)
+
+    def delete_later(self, chat_id: int, message_id: int, delay: float):
+        """Delete a message `delay` seconds from now"""
+        self._schedule(DeferredAction('delete', chat_id, message_id, time.time() + delay))
+
+    def edit_later(self, chat_id: int, message_id: int, text: str, delay: float):
+        """Replace a message's text `delay` seconds from now"""
+        self._schedule(DeferredAction('edit', chat_id, message_id, time.time() + delay, text))
+
+    def _load(self) -> int:
+        with get_db() as conn:
+            rows = conn.execute('SELECT action, chat_id, message_id, text, due FROM deferred_actions').fetchall()
+        for action, chat_id, message_id, text, due in rows:
+            self._add(DeferredAction(action, chat_id, message_id, due, text))
+        return len(rows)
+
+    def _expire(self, tick: int) -> List[DeferredAction]:
+        """Take the actions due by `tick` out of its slot; later laps of the wheel stay"""
+        slot = self._wheel[tick % len(self._wheel)]
+        due = [entry for entry in slot if self._tick_of(entry.due) <= tick]
+        if due:
+            slot[:] = [entry for entry in slot if self._tick_of(entry.due) > tick]
+        return due
+
+    async def _perform(self, entry: DeferredAction, slots: asyncio.Semaphore):
+        async with slots:
+            try:
+                if entry.action == 'delete':
+                    await self._bot.delete_message(entry.chat_id, entry.message_id)
+                else:
+                    await self._bot.edit_message_text(entry.text, chat_id=entry.chat_id,
+                                                      message_id=entry.message_id)
+                self.done += 1
+            except (BadRequest, Forbidden) as e:
+                # Already gone, too old to touch, or the bot left the chat: nothing to retry
+                logger.warning(f"Could not {entry.action} message {entry.message_id} in {entry.chat_id}: {e}")
+                self.failed += 1
+            except Exception as e:
+                # TelegramError, and network errors (httpx, OSError, timeouts) surfacing from the bot
+                entry.attempts += 1
+                if entry.attempts < self.max_attempts:
+                    delay = e.retry_after if isinstance(e, RetryAfter) else self.retry_delay
+                    entry.due = time.time() + delay
+                    self._add(entry)
+                    return
+                logger.error(f"Giving up on {entry.action} of message {entry.message_id} in {entry.chat_id}: {e}")
+                self.failed += 1
+        execute_write([(
+            'DELETE FROM deferred_actions WHERE action = ? AND chat_id = ? AND message_id = ?',
+            (entry.action, entry.chat_id, entry.message_id)
+        )])
+
+    async def _run(self):
+        slots = asyncio.Semaphore(self.max_concurrent)
+        while True:
+            # Catch up on every tick that passed while the loop was busy
+            now = self._tick_of(time.time())
+            due = []
+            while self._current <= now:
+                due.extend(self._expire(self._current))
+                self._current += 1
+            if due:
+                # Not awaited, so a slow batch never holds up the ticks after it
+                batch = asyncio.gather(*(self._perform(entry, slots) for entry in due))
+                self._batches.add(batch)
+                batch.add_done_callback(self._batches.discard)
+            await asyncio.sleep(self._current * self.tick - time.time())
+
+    async def start(self, bot: Bot):
+        """Load the actions left pending by the last run and start the wheel"""
+        self._bot = bot
+        if self._task is None:
+            loaded = self._load()
+            if loaded:
+                logger.info(f"Restored {loaded} deferred message actions")
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop the wheel; pending actions stay in the database for the next start"""
+        if self._task:
+            self._task.cancel()
+            for batch in self._batches:
+                batch.cancel()
+            await asyncio.gather(self._task, *self._batches, return_exceptions=True)
+            self._task = None
\ No newline at end of file
@@ -1,88 +1,214 @@
-from telegram import Update, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram import Update, Message, InlineKeyboardButton, InlineKeyboardMarkup
+from telegram.error import BadRequest
 from telegram.ext import ContextTypes
-from datetime import datetime, timedelta
+import asyncio
+import math
 import logging
-import random
+from typing import Iterable, Tuple
 from .analytics import stats
-from .database import log_meme_generation
+from .database import log_meme_generation, get_file_id, save_file_id, forget_file_id
 from .meme_generator import MemeGenerator
+from .scheduler import GenerationScheduler, QueueFullError
+from .inventory import MemeInventory
+from .catalog import PromptRotation
+from .prompts import build_meme_idea
+from .compositor import MemeCompositor
+from .rate_limit import RateLimiter
+from .metrics import phase_seconds, timed
 
 logger = logging.getLogger(__name__)
 
-# Store user cooldowns
-user_cooldowns = {}
-COOLDOWN_MINUTES = 5
+RATE_LIMIT_MESSAGES = {
+    'cooldown': "Please wait {minutes} minutes between meme generations!",
+    'daily': "You've reached today's meme limit. Please come back tomorrow!",
+    'chat': "This chat is generating a lot of memes. Please wait {minutes} minutes!",
+    'global': "The hive is swamped right now. Please try again in {minutes} minutes!"
+}
+
+UNIQUE_PROMPT_ATTEMPTS = 5
 
 class CommandHandlers:
-    def __init__(self, meme_generator: MemeGenerator):
+    def __init__(self, meme_generator: MemeGenerator, scheduler: GenerationScheduler,
+                 inventory: MemeInventory, compositor: MemeCompositor, rate_limiter: RateLimiter,
+                 rotation: PromptRotation, admin_ids: Iterable[int] = ()):
         self.meme_generator = meme_generator
+        self.scheduler = scheduler
+        self.inventory = inventory
+        self.compositor = compositor
+        self.rate_limiter = rate_limiter
+        self.rotation = rotation
+        self.admin_ids = set(admin_ids)
+
+    async def check_rate_limit(self, message: Message, user_id: int) -> bool:
+        """Check user, chat and global limits, telling the user when they are limited"""
+        decision = await self.rate_limiter.check(user_id, message.chat_id)
+        if not decision.allowed:
+            minutes = max(1, math.ceil(decision.retry_after / 60))
+            await message.reply_text(RATE_LIMIT_MESSAGES[decision.limit].format(minutes=minutes))
+        return decision.allowed
 
-    async def check_rate_limit(self, user_id: int) -> bool:
-        """Check if user is rate limited"""
-        if user_id in user_cooldowns:
-            last_use = user_cooldowns[user_id]
-            if datetime.now() - last_use < timedelta(minutes=COOLDOWN_MINUTES):
-                return False
-        user_cooldowns[user_id] = datetime.now()
-        return True
+    async def next_prompt(self, chat_id: int) -> Tuple[str, str]:
+        """Next (slogan, meme idea) in the chat's rotation, so the chat doesn't pay for repeats"""
+        slogan, meme_idea, city = await self.rotation.next(chat_id)
+        return slogan, build_meme_idea(meme_idea, city)
+
+    def record_meme(self, user_id: int, slogan: str, success: bool, quality: str):
+        """Count a meme in both the analytics rollups and the per-user history"""
+        stats.track_usage(user_id, success, slogan, quality)
+        with timed('db_write'):
+            log_meme_generation(user_id, slogan, success)
 
     async def meme_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Handle the /meme command"""
-        user_id = update.effective_user.id
-        
-        if not await self.check_rate_limit(user_id):
-            await update.message.reply_text(
-                f"Please wait {COOLDOWN_MINUTES} minutes between meme generations!"
-            )
+        # Get quality setting from command args
+        quality = "standard"
+        if context.args and context.args[0] in ["hd", "standard", "fast"]:
+            quality = context.args[0]
+
+        await self.send_meme(update.message, update.effective_user.id, quality)
+
+    async def send_meme(self, message: Message, user_id: int, quality: str) -> None:
+        """Queue a meme generation and reply to `message` with the result"""
+        if not await self.check_rate_limit(message, user_id):
+            return
+
+        # Render locally when asked to, or while the API is out of budget or down
+        if quality == "fast" or self.meme_generator.degraded:
+            await self.send_composite(message, user_id)
+            return
+
+        # Serve a pre-generated meme when one is in stock
+        item = self.inventory.take(quality)
+        if item is not None:
+            with timed('upload'):
+                sent = await message.reply_photo(photo=item.open())
+            save_file_id(item.image_key, sent.photo[-1].file_id)
+            await message.reply_text(f"{item.slogan}\nEarn $WHIVE - http://nyukia.ai 💸")
+            self.record_meme(user_id, item.slogan, True, quality)
+            return
+
+        with timed('prompt'):
+            slogan, meme_idea = await self.next_prompt(message.chat_id)
+            image_key = self.meme_generator.image_key(slogan, meme_idea, quality)
+
+            # Unless identical concurrent requests may share one image, pick a prompt nobody is waiting on
+            if self.scheduler.coalesce == 'unique':
+                for _ in range(UNIQUE_PROMPT_ATTEMPTS):
+                    if not self.scheduler.in_flight(image_key):
+                        break
+                    slogan, meme_idea = await self.next_prompt(message.chat_id)
+                    image_key = self.meme_generator.image_key(slogan, meme_idea, quality)
+            caption = f"{slogan}\nEarn $WHIVE - http://nyukia.ai 💸"
+
+        # Telegram already has this image, re-send it without uploading
+        if await self.send_known_photo(message, image_key):
+            await message.reply_text(caption)
+            self.record_meme(user_id, slogan, True, quality)
             return
 
-        status_message = await update.message.reply_text("🐝 Generating your meme... Please wait!")
-        
         try:
-            # Get quality setting from command args
-            quality = "standard"
-            if context.args and context.args[0] in ["hd", "standard"]:
-                quality = context.args[0]
+            job, shared = self.scheduler.submit_shared(
+                image_key, self.meme_generator.generate_meme, slogan, meme_idea, quality
+            )
+        except QueueFullError:
+            await message.reply_text("🐝 The hive is too busy right now. Please try again in a minute.")
+            return
+
+        if job.position > 0 and not shared:
+            status_message = await message.reply_text(
+                f"🐝 The hive is busy, you're #{job.position} in line. Your meme will follow shortly!"
+            )
+        else:
+            status_message = await message.reply_text("🐝 Generating your meme... Please wait!")
 
-            # Generate meme
-            slogan, meme_idea = random.choice(SLOGANS_AND_IDEAS)
-            meme_image = self.meme_generator.generate_meme(slogan, meme_idea, quality)
+        try:
+            meme_image = await job.result()
 
             if meme_image:
-                caption = f"{slogan}\nEarn $WHIVE - http://nyukia.ai 💸"
-                await update.message.reply_photo(photo=meme_image)
-                await update.message.reply_text(caption)
-                
+                # The buffer may be shared with other requesters, so send its bytes
+                with timed('upload'):
+                    sent = await message.reply_photo(photo=meme_image.getvalue())
+                save_file_id(image_key, sent.photo[-1].file_id)
+                await message.reply_text(caption)
+
                 # Track success
-                stats.track_usage(user_id, True)
-                log_meme_generation(user_id, slogan, True)
+                self.record_meme(user_id, slogan, True, quality)
+            elif self.meme_generator.degraded:
+                await self.send_composite(message, user_id)
             else:
-                await update.message.reply_text("Sorry, failed to generate meme. Please try again.")
-                stats.track_usage(user_id, False)
-                log_meme_generation(user_id, slogan, False)
+                await message.reply_text("Sorry, failed to generate meme. Please try again.")
+                self.record_meme(user_id, slogan, False, quality)
 
         except Exception as e:
             logger.error(f"Error in meme command: {e}")
-            await update.message.reply_text("Sorry, there was an error. Please try again later.")
-            stats.track_usage(user_id, False)
+            await message.reply_text("Sorry, there was an error. Please try again later.")
+            self.record_meme(user_id, slogan, False, quality)
         finally:
             await status_message.delete()
 
+    async def send_composite(self, message: Message, user_id: int) -> None:
+        """Reply with a meme rendered locally from the bee template"""
+        with timed('composite'):
+            slogan, city, image = await asyncio.to_thread(self.compositor.random_meme)
+        with timed('upload'):
+            await message.reply_photo(photo=image)
+        await message.reply_text(f"{slogan}\nEarn $WHIVE - http://nyukia.ai 💸")
+        self.record_meme(user_id, slogan, True, "fast")
+
+    async def send_known_photo(self, message: Message, image_key: str) -> bool:
+        """Reply with a previously uploaded photo by file_id; False if there is none"""
+        # A fresh connection and query per lookup; keep it off the event loop
+        file_id = await asyncio.to_thread(get_file_id, image_key)
+        if file_id is None:
+            return False
+
+        try:
+            with timed('upload'):
+                await message.reply_photo(photo=file_id)
+            return True
+        except BadRequest as e:
+            logger.warning(f"Stale file_id for {image_key}: {e}")
+            await asyncio.to_thread(forget_file_id, image_key)
+            return False
+
     async def stats_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Show bot statistics"""
-        await update.message.reply_text(
+        cache = self.meme_generator.cache
+        today, users_today = stats.today()
+        await update.effective_message.reply_text(
             f"📊 Bot Statistics:\n"
             f"Total Memes: {stats.total_memes}\n"
             f"Success Rate: {stats.success_rate:.1f}%\n"
-            f"Unique Users: {len(stats.unique_users)}"
+            f"Unique Users: ~{stats.unique_users}\n"
+            f"Today: {today.memes} memes from ~{users_today} users\n"
+            f"Top Slogan: {stats.top_slogan or '-'}\n"
+            f"Queue: {self.scheduler.depth} waiting, avg wait {self.scheduler.metrics.avg_wait:.1f}s, "
+            f"{self.scheduler.metrics.coalesced} API calls saved by sharing\n"
+            f"Image Cache: {cache.hits} hits, {cache.misses} misses ({cache.hit_rate:.1f}%)\n"
+            f"Stock: {self.inventory.level} ready, {self.inventory.metrics.stock_ratio:.1f}% served from stock, "
+            f"{self.inventory.metrics.refill_rate:.1f} refills/hour"
         )
 
+    async def perf_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Show recent latency percentiles for each phase (admins only)"""
+        if update.effective_user.id not in self.admin_ids:
+            return
+
+        lines = ["⏱ Phase latency (recent, ms):", "phase: n p50 / p95 / p99"]
+        for phase, histogram in phase_seconds.children.items():
+            p50, p95, p99 = (value * 1000 for value in histogram.percentiles(0.5, 0.95, 0.99))
+            lines.append(f"{phase}: {len(histogram.recent)} {p50:.0f} / {p95:.0f} / {p99:.0f}")
+        if len(lines) == 2:
+            lines.append("No samples yet")
+        await update.effective_message.reply_text("\n".join(lines))
+
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         """Show help message"""
-        await update.message.reply_text(
+        await update.effective_message.reply_text(
             "🐝 Available Commands:\n"
             "/meme - Generate a bee meme\n"
             "/meme hd - Generate a high-quality meme\n"
+            "/meme fast - Get an instant meme from the bee template\n"
             "/stats - View bot statistics\n"
             "/help - Show this message\n"
             "/menu - Show interactive menu"
@@ -97,4 +223,18 @@ class CommandHandlers:
             [InlineKeyboardButton("Help", callback_data='help')]
         ]
         reply_markup = InlineKeyboardMarkup(keyboard)
-        await update.message.reply_text('Choose an option:', reply_markup=reply_markup) 
\ No newline at end of file
+        await update.message.reply_text('Choose an option:', reply_markup=reply_markup) 
+
+    async def button_callback(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        """Handle /menu button presses"""
+        query = update.callback_query
+        await query.answer()
+
+        if query.data == 'generate':
+            await self.send_meme(query.message, query.from_user.id, "standard")
+        elif query.data == 'generate_hd':
+            await self.send_meme(query.message, query.from_user.id, "hd")
+        elif query.data == 'stats':
+            await self.stats_command(update, context)
+        elif query.data == 'help':
+            await self.help_command(update, context)
\ No newline at end of file
@@ -0,0 +1,197 @@
+import asyncio
+import hashlib
+import logging
+import os
+import time
+from collections import OrderedDict
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# A temp file this old was left by a process that died mid-write
+STALE_TMP_SECONDS = 3600
+
+class ImageCache:
+    """Disk-backed, content-addressed cache of encoded meme images
+
+    The index lives on the event loop; every file read, write and delete runs in a thread.
+    """
+
+    def __init__(self, directory: str = 'cache/images', max_bytes: int = 500 * 1024 * 1024,
+                 max_age_seconds: float = 30 * 24 * 3600):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        # key -> (size, created), least recently used first
+        self._index = OrderedDict()
+        self._total_bytes = 0
+
+        # Indexed by load_index() during warm-up; until then entries are adopted as they are read
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'ImageCache':
+        """Build a cache from the `cache` section of config.yml"""
+        return cls(
+            directory=config.get('directory', 'cache/images'),
+            max_bytes=config.get('max_size_mb', 500) * 1024 * 1024,
+            max_age_seconds=config.get('max_age_days', 30) * 24 * 3600
+        )
+
+    @staticmethod
+    def make_key(model: str, prompt: str, size: str, quality: str, variant: str = '') -> str:
+        """Hash the generation parameters, and the post-processing applied after, into a cache key"""
+        parts = (model, prompt, size, quality, variant) if variant else (model, prompt, size, quality)
+        raw = '\0'.join(parts).encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def load_index(self):
+        """Index the files already in the directory, oldest access first; runs in a thread"""
+        entries, stale = [], []
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if not entry.is_file():
+                continue
+            st = entry.stat()
+            if entry.name.endswith('.tmp'):
+                # Per-process temp files are renamed right after writing, so an old one is a crash leftover
+                if now - st.st_mtime > STALE_TMP_SECONDS:
+                    stale.append(entry.path)
+            else:
+                entries.append((st.st_atime, entry.name, st.st_size, st.st_mtime))
+
+        self._index.clear()
+        self._total_bytes = 0
+        for _, key, size, created in sorted(entries):
+            self._index[key] = (size, created)
+            self._total_bytes += size
+        self._delete_files(stale + self._evict())
+        logger.info(f"Image cache loaded: {len(self._index)} entries, {self._total_bytes} bytes"
+                    + (f", removed {len(stale)} stale temp files" if stale else ""))
+
+    async def get(self, key: str) -> Optional[BytesIO]:
+        """Return a fresh reader over the cached image, or None on a miss"""
+        entry = self._index.get(key)
+        if entry is None:
+            entry = await asyncio.to_thread(self._stat, key)
+            if entry is not None:
+                entry = self._adopt(key, entry)
+        if entry is None or time.time() - entry[1] > self.max_age_seconds:
+            if entry is not None:
+                await self._remove(key)
+            self.misses += 1
+            return None
+
+        try:
+            data = await asyncio.to_thread(self._read, key, entry[1])
+        except OSError as e:
+            logger.error(f"Image cache read error: {e}")
+            await self._remove(key)
+            self.misses += 1
+            return None
+
+        if key in self._index:
+            self._index.move_to_end(key)
+        self.hits += 1
+        return BytesIO(data)
+
+    def _stat(self, key: str) -> Optional[Tuple[int, float]]:
+        try:
+            st = os.stat(self._path(key))
+        except OSError:
+            return None
+        return st.st_size, st.st_mtime
+
+    def _read(self, key: str, created: float) -> bytes:
+        with open(self._path(key), 'rb') as f:
+            data = f.read()
+        # Access time drives LRU order after a restart; mtime stays the creation time
+        os.utime(self._path(key), (time.time(), created))
+        return data
+
+    def _write(self, key: str, data: bytes):
+        path = self._path(key)
+        # Per-process temp name, so workers sharing the directory never write the same file
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            raise
+
+    def _adopt(self, key: str, entry: Tuple[int, float]) -> Tuple[int, float]:
+        """Index an entry another process sharing the directory has written"""
+        if key not in self._index:
+            self._index[key] = entry
+            self._total_bytes += entry[0]
+        return self._index[key]
+
+    async def put(self, key: str, data: bytes):
+        """Store encoded image bytes under `key`"""
+        try:
+            await asyncio.to_thread(self._write, key, data)
+        except OSError as e:
+            logger.error(f"Image cache write error: {e}")
+            return
+
+        if key in self._index:
+            self._total_bytes -= self._index[key][0]
+        self._index[key] = (len(data), time.time())
+        self._index.move_to_end(key)
+        self._total_bytes += len(data)
+        evicted = self._evict()
+        if evicted:
+            await asyncio.to_thread(self._delete_files, evicted)
+
+    def _drop(self, key: str) -> Optional[str]:
+        """Remove `key` from the index and return its path"""
+        entry = self._index.pop(key, None)
+        if entry is None:
+            return None
+        self._total_bytes -= entry[0]
+        return self._path(key)
+
+    async def _remove(self, key: str):
+        path = self._drop(key)
+        if path:
+            await asyncio.to_thread(self._delete_files, [path])
+
+    @staticmethod
+    def _delete_files(paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logger.error(f"Image cache delete error: {e}")
+
+    def _evict(self) -> List[str]:
+        """Drop expired entries, then least recently used ones until under the size limit
+
+        Only the index is updated; the caller deletes the returned paths off the loop.
+        """
+        cutoff = time.time() - self.max_age_seconds
+        paths = [self._drop(key) for key in [k for k, (_, created) in self._index.items() if created < cutoff]]
+        while self._total_bytes > self.max_bytes and self._index:
+            paths.append(self._drop(next(iter(self._index))))
+        return paths
+
+    @property
+    def hit_rate(self) -> float:
+        """Cache hit rate percentage"""
+        total = self.hits + self.misses
+        if total == 0:
+            return 0.0
+        return (self.hits / total) * 100
\ No newline at end of file
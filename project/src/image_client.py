@@ -0,0 +1,187 @@
+import asyncio
+import binascii
+import json
+import logging
+from io import BytesIO
+from typing import Optional
+import httpx
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BASE_URL = "https://api.openai.com/v1"
+
+# "b64_json" returns the image in the generation response; "url" needs a second request to fetch it
+RESPONSE_FORMATS = ("b64_json", "url")
+
+class ImageAPIError(Exception):
+    """Error payload returned by the image generation API"""
+    def __init__(self, message: str, code: Optional[str] = None, status: Optional[int] = None,
+                 retry_after: Optional[str] = None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.retry_after = retry_after
+
+class InlineImageDecoder:
+    """Incremental parser for an images response that decodes `b64_json` as the bytes arrive
+
+    Only the JSON around the image is kept and parsed; the base64 text is decoded in
+    4-character groups straight into the output buffer and never held as a whole.
+    """
+
+    FIELD = b'"b64_json"'
+
+    def __init__(self):
+        self.image = BytesIO()
+        self._head = bytearray()
+        self._tail = bytearray()
+        self._carry = b''
+        # head -> separator (up to the opening quote) -> value -> tail
+        self._state = 'head'
+
+    def feed(self, chunk: bytes):
+        if self._state == 'head':
+            start = max(0, len(self._head) - len(self.FIELD))
+            self._head += chunk
+            index = self._head.find(self.FIELD, start)
+            if index < 0:
+                return
+            end = index + len(self.FIELD)
+            chunk = bytes(self._head[end:])
+            del self._head[end:]
+            self._state = 'separator'
+        if self._state == 'separator':
+            quote = chunk.find(b'"')
+            self._head += chunk if quote < 0 else chunk[:quote + 1]
+            if quote < 0:
+                return
+            chunk = chunk[quote + 1:]
+            self._state = 'value'
+        if self._state == 'value':
+            quote = chunk.find(b'"')
+            self._decode(chunk if quote < 0 else chunk[:quote], final=quote >= 0)
+            if quote < 0:
+                return
+            chunk = chunk[quote:]
+            self._state = 'tail'
+        self._tail += chunk
+
+    def _decode(self, data: bytes, final: bool):
+        data = self._carry + data
+        backslash = b''
+        if b'\\' in data:
+            # JSON encoders may escape '/' and wrap long lines; an escape can straddle chunks
+            if data.endswith(b'\\') and not final:
+                data, backslash = data[:-1], b'\\'
+            data = data.replace(b'\\/', b'/').replace(b'\\n', b'').replace(b'\\r', b'')
+            if b'\\' in data:
+                raise ValueError("Unsupported escape in b64_json")
+        usable = len(data) if final else len(data) - len(data) % 4
+        self.image.write(binascii.a2b_base64(data[:usable]))
+        self._carry = data[usable:] + backslash
+
+    def close(self) -> dict:
+        """Parse the response; an inline image is returned as bytes under `image` in its entry"""
+        if self._state == 'head':
+            return json.loads(self._head)
+        if self._state != 'tail':
+            raise ValueError("Response ended inside b64_json")
+        # The head ends with the opening quote and the tail starts with the closing one
+        document = json.loads(self._head + self._tail)
+        for entry in document.get('data') or []:
+            if entry.get('b64_json') == '':
+                del entry['b64_json']
+                entry['image'] = self.image.getvalue()
+        return document
+
+class ImageClient:
+    """Async client for the image generation API with a shared connection pool"""
+
+    def __init__(self, api_key: str, base_url: str = DEFAULT_BASE_URL,
+                 connect_timeout: float = 5.0, read_timeout: float = 30.0,
+                 max_connections: int = 10, response_format: str = "b64_json"):
+        if response_format not in RESPONSE_FORMATS:
+            raise ValueError(f"response_format must be one of {RESPONSE_FORMATS}, not {response_format!r}")
+        self.api_key = api_key
+        self.base_url = base_url.rstrip('/')
+        self.response_format = response_format
+        self._client = httpx.AsyncClient(
+            timeout=httpx.Timeout(read_timeout, connect=connect_timeout),
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+                keepalive_expiry=60
+            )
+        )
+
+    @classmethod
+    def from_config(cls, api_key: str, config: dict) -> 'ImageClient':
+        """Build a client from the `api` section of config.yml"""
+        return cls(
+            api_key,
+            base_url=config.get('base_url', DEFAULT_BASE_URL),
+            connect_timeout=config.get('connect_timeout_seconds', 5),
+            read_timeout=config.get('timeout_seconds', 30),
+            max_connections=config.get('max_connections', 10),
+            response_format=config.get('response_format', 'b64_json')
+        )
+
+    async def create_image(self, prompt: str, model: str = "dall-e-3", size: str = "1024x1024",
+                           quality: str = "standard", response_format: Optional[str] = None) -> dict:
+        """Request a single image and return the first entry of the response `data`
+
+        The entry carries the image bytes under `image` when they came inline, and a `url`
+        to `download` otherwise.
+        """
+        decoder = InlineImageDecoder()
+        async with self._client.stream(
+            "POST",
+            f"{self.base_url}/images/generations",
+            headers={"Authorization": f"Bearer {self.api_key}"},
+            json={
+                "model": model,
+                "prompt": prompt,
+                "n": 1,
+                "size": size,
+                "quality": quality,
+                "response_format": response_format or self.response_format
+            }
+        ) as response:
+            async for chunk in response.aiter_bytes():
+                decoder.feed(chunk)
+        try:
+            response_data = decoder.close()
+        except ValueError:
+            # Gateways answer 502/503 with HTML
+            response_data = {}
+
+        if 'data' not in response_data:
+            error = response_data.get('error') or {}
+            raise ImageAPIError(
+                error.get('message', f"Unexpected API response ({response.status_code})"),
+                code=error.get('code'),
+                status=response.status_code,
+                retry_after=response.headers.get('Retry-After')
+            )
+        return response_data['data'][0]
+
+    async def download(self, url: str) -> bytes:
+        """Download a generated image; the API key is never sent to the image host"""
+        response = await self._client.get(url)
+        response.raise_for_status()
+        return response.content
+
+    async def warm_up(self, connections: int = 1):
+        """Open pooled connections ahead of the first generation, so it skips the TLS handshake"""
+        async def connect():
+            # Listing models is free; any answer leaves the connection in the pool
+            await self._client.get(f"{self.base_url}/models", headers={"Authorization": f"Bearer {self.api_key}"})
+
+        try:
+            await asyncio.gather(*(connect() for _ in range(connections)))
+        except httpx.HTTPError as e:
+            logger.warning(f"Could not pre-connect to the image API: {e}")
+
+    async def aclose(self):
+        """Close pooled connections"""
+        await self._client.aclose()
\ No newline at end of file
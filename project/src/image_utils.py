@@ -0,0 +1,43 @@
+import logging
+from io import BytesIO
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+SIGNATURES = (
+    (b'\x89PNG\r\n\x1a\n', 'PNG'),
+    (b'\xff\xd8\xff', 'JPEG'),
+    (b'GIF87a', 'GIF'),
+    (b'GIF89a', 'GIF'),
+)
+
+class InvalidImageError(ValueError):
+    """Downloaded payload is not a supported image"""
+
+def sniff_format(data: bytes) -> str:
+    """Identify the image format from its header without decoding it"""
+    header = bytes(memoryview(data)[:12])
+    for signature, image_format in SIGNATURES:
+        if header.startswith(signature):
+            return image_format
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'WEBP'
+    raise InvalidImageError(f"Unrecognised image header: {header[:8]!r}")
+
+def image_buffer(data: bytes, output_format: Optional[str] = None) -> BytesIO:
+    """Wrap downloaded image bytes for sending, transcoding only when asked to"""
+    source_format = sniff_format(data)
+    if not output_format or output_format.upper() == source_format:
+        # BytesIO shares the bytes object until it is written to, so this is not a copy
+        return BytesIO(data)
+
+    from PIL import Image
+
+    logger.debug("Transcoding %s to %s", source_format, output_format)
+    output = BytesIO()
+    with Image.open(BytesIO(data)) as image:
+        if output_format.upper() == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        image.save(output, format=output_format.upper())
+    output.seek(0)
+    return output
\ No newline at end of file
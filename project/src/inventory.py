@@ -0,0 +1,183 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import date
+from io import BytesIO
+from typing import Optional
+from .meme_generator import MemeGenerator
+from .catalog import PromptRotation
+from .prompts import build_meme_idea, random_prompt
+from .scheduler import GenerationScheduler, QueueFullError
+
+logger = logging.getLogger(__name__)
+
+# Stock draws from its own rotation, so pre-generated memes don't repeat each other
+ROTATION_KEY = 'inventory'
+
+@dataclass
+class StockItem:
+    slogan: str
+    meme_idea: str
+    quality: str
+    image_key: str
+    data: bytes
+
+    def open(self) -> BytesIO:
+        """Fresh reader over the stocked image"""
+        return BytesIO(self.data)
+
+@dataclass
+class InventoryMetrics:
+    refills: int = 0
+    refill_failures: int = 0
+    served_from_stock: int = 0
+    served_live: int = 0
+    started_at: float = 0.0
+
+    @property
+    def refill_rate(self) -> float:
+        """Refills per hour since the inventory started"""
+        hours = (time.monotonic() - self.started_at) / 3600
+        if hours <= 0:
+            return 0.0
+        return self.refills / hours
+
+    @property
+    def stock_ratio(self) -> float:
+        """Percentage of memes served from stock"""
+        total = self.served_from_stock + self.served_live
+        if total == 0:
+            return 0.0
+        return (self.served_from_stock / total) * 100
+
+class MemeInventory:
+    """Stock of pre-generated memes, refilled in the background while the bot is idle"""
+
+    def __init__(self, meme_generator: MemeGenerator, scheduler: GenerationScheduler,
+                 low_water: int = 5, high_water: int = 10, quality: str = "standard",
+                 daily_budget: float = 2.0, cost_per_image: dict = None,
+                 check_interval: float = 15.0, rotation: Optional[PromptRotation] = None,
+                 rotation_key: str = ROTATION_KEY):
+        self.meme_generator = meme_generator
+        self.scheduler = scheduler
+        self.low_water = low_water
+        self.high_water = high_water
+        self.quality = quality
+        self.daily_budget = daily_budget
+        self.cost_per_image = cost_per_image or {"standard": 0.04, "hd": 0.08}
+        self.check_interval = check_interval
+        self.rotation = rotation
+        self.rotation_key = rotation_key
+        self.metrics = InventoryMetrics()
+        self._stock = deque()
+        self._spent_today = 0.0
+        self._budget_day = date.today()
+        self._refilling = False
+        self._task = None
+
+    @classmethod
+    def from_config(cls, meme_generator: MemeGenerator, scheduler: GenerationScheduler,
+                    config: dict, rotation: Optional[PromptRotation] = None) -> 'MemeInventory':
+        """Build an inventory from the `inventory` section of config.yml"""
+        return cls(
+            meme_generator,
+            scheduler,
+            low_water=config.get('low_water', 5),
+            high_water=config.get('high_water', 10),
+            quality=config.get('quality', 'standard'),
+            daily_budget=config.get('daily_budget_usd', 2.0),
+            cost_per_image=config.get('cost_per_image'),
+            check_interval=config.get('check_interval_seconds', 15),
+            rotation=rotation,
+            rotation_key=config.get('rotation_key', ROTATION_KEY)
+        )
+
+    @property
+    def level(self) -> int:
+        """Number of memes in stock"""
+        return len(self._stock)
+
+    def take(self, quality: str) -> Optional[StockItem]:
+        """Pop a ready meme of the given quality, or None when live generation is needed"""
+        if quality == self.quality and self._stock:
+            self.metrics.served_from_stock += 1
+            return self._stock.popleft()
+        self.metrics.served_live += 1
+        return None
+
+    def _roll_over(self):
+        today = date.today()
+        if today != self._budget_day:
+            self._budget_day = today
+            self._spent_today = 0.0
+
+    def _budget_left(self) -> float:
+        self._roll_over()
+        return self.daily_budget - self._spent_today
+
+    def _charge(self, cost: float):
+        self._roll_over()
+        self._spent_today += cost
+
+    @property
+    def spent_today(self) -> float:
+        """Dollars spent on refills today"""
+        self._roll_over()
+        return self._spent_today
+
+    async def start(self):
+        """Start the background refill task"""
+        self.metrics.started_at = time.monotonic()
+        self._task = asyncio.create_task(self._refill_loop())
+
+    async def stop(self):
+        """Stop refilling"""
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _refill_loop(self):
+        while True:
+            if self.level < self.low_water:
+                self._refilling = True
+            elif self.level >= self.high_water:
+                self._refilling = False
+
+            cost = self.cost_per_image.get(self.quality, 0.0)
+            if self._refilling and self.scheduler.idle and self._budget_left() >= cost:
+                await self._refill_one(cost)
+            else:
+                await asyncio.sleep(self.check_interval)
+
+    async def _refill_one(self, cost: float):
+        if self.rotation is not None:
+            slogan, meme_idea, city = await self.rotation.next(self.rotation_key)
+            meme_idea = build_meme_idea(meme_idea, city)
+        else:
+            slogan, meme_idea = random_prompt()
+        try:
+            # Charged only once the API has produced an image, not for cache hits or failures
+            job = self.scheduler.submit(self.meme_generator.generate_meme, slogan, meme_idea, self.quality,
+                                        on_billed=lambda: self._charge(cost))
+        except QueueFullError:
+            return
+
+        meme_image = await job.result()
+        if meme_image is None:
+            self.metrics.refill_failures += 1
+            await asyncio.sleep(self.check_interval)
+            return
+
+        self._stock.append(StockItem(
+            slogan=slogan,
+            meme_idea=meme_idea,
+            quality=self.quality,
+            image_key=self.meme_generator.image_key(slogan, meme_idea, self.quality),
+            data=meme_image.getvalue()
+        ))
+        self.metrics.refills += 1
+        logger.info(f"Inventory refilled: {self.level} memes in stock, "
+                    f"${self._spent_today:.2f} spent today")
\ No newline at end of file
@@ -0,0 +1,135 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import List, Optional
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else was passed through `extra=`
+_RECORD_FIELDS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+# Arguments that cannot change between the log call and the listener thread formatting them
+_IMMUTABLE_ARGS = (str, int, float, bool, bytes, type(None))
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, with `extra=` fields kept as top-level keys"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_FIELDS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        if record.stack_info:
+            entry['stack'] = self.formatStack(record.stack_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+class DebugSampler(logging.Filter):
+    """Keeps one in every `rate` DEBUG records per call site; other levels always pass"""
+
+    def __init__(self, rate: int = 1):
+        super().__init__()
+        self.rate = max(1, rate)
+        self._seen = defaultdict(int)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.DEBUG or self.rate == 1:
+            return True
+        # Keyed by the template, not the formatted message, so one hot call site is one counter
+        key = (record.pathname, record.lineno)
+        count = self._seen[key]
+        self._seen[key] = count + 1
+        return count % self.rate == 0
+
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    """Hands records to the listener thread unformatted, and never blocks the caller
+
+    The stock QueueHandler formats every record before queueing it. Here a record
+    whose arguments are all immutable is queued as it is, and the message is built
+    by the listener. A full queue drops the record and counts it.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        args = record.args
+        if args and not (isinstance(args, tuple) and all(isinstance(arg, _IMMUTABLE_ARGS) for arg in args)):
+            # A dict or object argument may be mutated before the listener gets to it
+            record.msg = record.getMessage()
+            record.args = None
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class LogListener(logging.handlers.QueueListener):
+    """QueueListener that can be stopped more than once, e.g. by a shutdown hook and at exit"""
+
+    def enqueue_sentinel(self):
+        # Wait for room rather than fail when the queue is full at shutdown
+        self.queue.put(self._sentinel)
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+def start_logging(path: Optional[str] = None, level: int = logging.INFO, json_format: bool = True,
+                  debug_sample_rate: int = 1, queue_size: int = 10000, max_bytes: int = 1024 * 1024,
+                  backup_count: int = 5, console: bool = True) -> LogListener:
+    """Route the root logger through a queue to a listener thread that writes and rotates the files
+
+    The log file gets JSON lines (or text), the console gets text. Returns the
+    running listener; it is stopped, flushing what is queued, at interpreter exit.
+    """
+    handlers: List[logging.Handler] = []
+    if path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        file_handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes, backupCount=backup_count,
+                                                            encoding='utf-8')
+        file_handler.setFormatter(JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT))
+        handlers.append(file_handler)
+    if console:
+        console_handler = logging.StreamHandler()
+        console_handler.setFormatter(logging.Formatter(TEXT_FORMAT))
+        handlers.append(console_handler)
+
+    log_queue = queue.Queue(maxsize=queue_size)
+    queue_handler = LazyQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(debug_sample_rate))
+
+    root = logging.getLogger()
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+
+    listener = LogListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
+
+def start_logging_from_config(config: dict, path: str) -> LogListener:
+    """Start the pipeline from the `logging` section of config.yml"""
+    return start_logging(
+        path,
+        level=logging.getLevelName(str(config.get('level', 'INFO')).upper()),
+        json_format=config.get('format', 'json') == 'json',
+        debug_sample_rate=config.get('debug_sample_rate', 1),
+        queue_size=config.get('queue_size', 10000),
+        max_bytes=config.get('max_file_mb', 1) * 1024 * 1024,
+        backup_count=config.get('backup_count', 5)
+    )
\ No newline at end of file
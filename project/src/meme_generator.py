@@ -1,63 +1,98 @@
- import logging
+import logging
+import time
 from io import BytesIO
-from PIL import Image
-import requests
-import json
-import subprocess
-from functools import lru_cache
-from tenacity import retry, stop_after_attempt, wait_exponential
-import os
+from typing import Callable, Optional
+from .image_client import ImageClient, ImageAPIError
+from .image_cache import ImageCache
+from .image_utils import image_buffer
+from .postprocess import PostProcessor
+from .resilience import RetryPolicy, CircuitOpenError
+from .metrics import timed
 
 logger = logging.getLogger(__name__)
 
+# How long to stay in local-only mode after the API reports a billing limit
+BILLING_RECHECK_SECONDS = 3600
+
 class MemeGenerator:
-    def __init__(self, api_key: str):
-        self.api_key = api_key
-
-    @retry(
-        stop=stop_after_attempt(3),
-        wait=wait_exponential(multiplier=1, min=4, max=10)
-    )
-    @lru_cache(maxsize=100)
-    def generate_meme(self, slogan: str, meme_idea: str, quality: str = "standard") -> BytesIO:
-        """Generate a meme image using DALL-E"""
+    def __init__(self, client: ImageClient, cache: ImageCache, postprocessor: PostProcessor,
+                 retry_policy: RetryPolicy, model: str = "dall-e-3", size: str = "1024x1024"):
+        self.client = client
+        self.cache = cache
+        self.postprocessor = postprocessor
+        self.retry_policy = retry_policy
+        self.model = model
+        self.size = size
+        self.billing_limited_at = None
+
+    @property
+    def billing_limit_reached(self) -> bool:
+        """True while the API's billing hard limit is believed to be in effect"""
+        return (self.billing_limited_at is not None
+                and time.monotonic() - self.billing_limited_at < BILLING_RECHECK_SECONDS)
+
+    @property
+    def degraded(self) -> bool:
+        """True when memes should be rendered locally instead of calling the API"""
+        breaker = self.retry_policy.breaker
+        return self.billing_limit_reached or (breaker is not None and breaker.is_open)
+
+    def image_key(self, slogan: str, meme_idea: str, quality: str = "standard") -> str:
+        """Key identifying the image a generation call would produce"""
+        # Whitespace differences do not change the image, so they must not change the key
+        prompt = '\n'.join(' '.join(part.split()) for part in (slogan, meme_idea))
+        # The cache holds post-processed bytes, so new output settings must not hit old entries
+        return self.cache.make_key(self.model, prompt, self.size, quality,
+                                   self.postprocessor.options.fingerprint)
+
+    async def generate_meme(self, slogan: str, meme_idea: str, quality: str = "standard",
+                            on_billed: Optional[Callable[[], None]] = None) -> BytesIO:
+        """Generate a meme image using DALL-E
+
+        `on_billed` is called once the API has produced, and charged for, an image;
+        never on a cache hit or a failed call.
+        """
         try:
             full_prompt = f"{slogan}\n{meme_idea}"
-            logger.debug(f"Generating meme with prompt: {full_prompt}")
-
-            data = json.dumps({
-                "model": "dall-e-3",
-                "prompt": full_prompt,
-                "n": 1,
-                "size": "1024x1024",
-                "quality": quality,
-                "response_format": "url"
-            })
-
-            curl_command = [
-                "curl", "-X", "POST", "https://api.openai.com/v1/images/generations",
-                "-H", "Content-Type: application/json",
-                "-H", f"Authorization: Bearer {self.api_key}",
-                "-d", data
-            ]
-
-            response = subprocess.run(curl_command, capture_output=True, text=True, check=True)
-            response_data = json.loads(response.stdout)
-
-            if 'data' not in response_data:
-                logger.error(f"API error: {response_data}")
-                return None
-
-            image_url = response_data['data'][0]['url']
-            img_response = requests.get(image_url)
-            img_response.raise_for_status()
-
-            output = BytesIO()
-            image = Image.open(BytesIO(img_response.content))
-            image.save(output, format='PNG')
-            output.seek(0)
+            logger.debug("Generating meme with prompt: %s", full_prompt)
+
+            cache_key = self.image_key(slogan, meme_idea, quality)
+            cached = await self.cache.get(cache_key)
+            if cached is not None:
+                logger.debug("Image cache hit for %s", cache_key)
+                return cached
+
+            content = await self.retry_policy.call(self._fetch_image, full_prompt, quality)
+            if on_billed is not None:
+                on_billed()
+
+            with timed('postprocess'):
+                output = image_buffer(await self.postprocessor.process(content))
+            await self.cache.put(cache_key, output.getvalue())
             return output
 
+        except CircuitOpenError as e:
+            logger.warning(f"Meme generation skipped: {e}")
+            return None
+        except ImageAPIError as e:
+            if e.code == 'billing_hard_limit_reached':
+                self.billing_limited_at = time.monotonic()
+            logger.error(f"Meme generation error: {e}")
+            return None
         except Exception as e:
             logger.error(f"Meme generation error: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    async def _fetch_image(self, prompt: str, quality: str) -> bytes:
+        with timed('api_call'):
+            result = await self.client.create_image(
+                prompt,
+                model=self.model,
+                size=self.size,
+                quality=quality
+            )
+        if 'image' in result:
+            return result['image']
+        # The API ignored the inline format, or the client is configured for URLs
+        with timed('download'):
+            return await self.client.download(result['url'])
\ No newline at end of file
@@ -0,0 +1,174 @@
+import asyncio
+import bisect
+import logging
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Union
+
+logger = logging.getLogger(__name__)
+
+# Seconds; spans a cache hit through a slow HD generation
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60)
+
+class Histogram:
+    """Cumulative bucket counts for /metrics plus a window of recent samples for percentiles"""
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS, window: int = 1024):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=window)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def percentiles(self, *quantiles: float) -> List[float]:
+        """Percentiles over the recent window"""
+        samples = sorted(self.recent)
+        if not samples:
+            return [0.0] * len(quantiles)
+        return [samples[min(len(samples) - 1, int(q * len(samples)))] for q in quantiles]
+
+class HistogramFamily:
+    """Histograms sharing a name, one per value of a single label"""
+
+    def __init__(self, label: str, buckets: Sequence[float]):
+        self.label = label
+        self.buckets = buckets
+        self.children: "OrderedDict[str, Histogram]" = OrderedDict()
+
+    def labels(self, value: str) -> Histogram:
+        histogram = self.children.get(value)
+        if histogram is None:
+            histogram = self.children[value] = Histogram(self.buckets)
+        return histogram
+
+    @contextmanager
+    def time(self, value: str):
+        """Observe how long the block takes"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.labels(value).observe(time.perf_counter() - start)
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _number(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class MetricsRegistry:
+    """Metrics rendered in the Prometheus text exposition format"""
+
+    def __init__(self):
+        self._metrics = OrderedDict()
+
+    def histogram(self, name: str, help_text: str, label: str,
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> HistogramFamily:
+        family = HistogramFamily(label, buckets)
+        self._metrics[name] = ('histogram', help_text, family)
+        return family
+
+    def register(self, name: str, help_text: str, kind: str,
+                 collect: Callable[[], Union[float, Dict[str, float]]], label: Optional[str] = None):
+        """Add a counter or gauge whose value is read from `collect` at scrape time"""
+        self._metrics[name] = (kind, help_text, (collect, label))
+
+    def render(self) -> str:
+        lines = []
+        for name, (kind, help_text, data) in self._metrics.items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            if kind == 'histogram':
+                lines.extend(self._render_histogram(name, data))
+                continue
+
+            collect, label = data
+            try:
+                value = collect()
+            except Exception as e:
+                logger.warning(f"Could not collect metric {name}: {e}")
+                continue
+            if isinstance(value, dict):
+                for label_value, sample in value.items():
+                    lines.append(f'{name}{{{label}="{_escape(label_value)}"}} {_number(sample)}')
+            else:
+                lines.append(f"{name} {_number(value)}")
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_histogram(name: str, family: HistogramFamily) -> List[str]:
+        lines = []
+        for value, histogram in family.children.items():
+            label = f'{family.label}="{_escape(value)}"'
+            cumulative = 0
+            for bound, count in zip(histogram.buckets, histogram.counts):
+                cumulative += count
+                lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+            lines.append(f'{name}_bucket{{{label},le="+Inf"}} {histogram.count}')
+            lines.append(f'{name}_sum{{{label}}} {histogram.sum!r}')
+            lines.append(f'{name}_count{{{label}}} {histogram.count}')
+        return lines
+
+class MetricsServer:
+    """Minimal HTTP server answering GET /metrics, meant to listen on localhost only"""
+
+    def __init__(self, registry: MetricsRegistry, host: str = '127.0.0.1', port: int = 9090):
+        self.registry = registry
+        self.host = host
+        self.port = port
+        self._server = None
+
+    @classmethod
+    def from_config(cls, registry: MetricsRegistry, config: dict) -> 'MetricsServer':
+        """Build a server from the `metrics` section of config.yml"""
+        return cls(registry, host=config.get('listen', '127.0.0.1'), port=config.get('port', 9090))
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logger.info(f"Serving metrics on http://{self.host}:{self.port}/metrics")
+
+    async def stop(self):
+        if self._server:
+            self._server.close()
+            await self._server.wait_closed()
+            self._server = None
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request_line = await asyncio.wait_for(reader.readline(), 5)
+            while (await asyncio.wait_for(reader.readline(), 5)) not in (b'\r\n', b'\n', b''):
+                pass
+            parts = request_line.decode('latin-1').split()
+            if len(parts) >= 2 and parts[0] == 'GET' and parts[1].split('?')[0] == '/metrics':
+                status, body = '200 OK', self.registry.render().encode()
+            else:
+                status, body = '404 Not Found', b'Not Found\n'
+            writer.write(
+                f"HTTP/1.1 {status}\r\n"
+                f"Content-Type: text/plain; version=0.0.4; charset=utf-8\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        except (asyncio.TimeoutError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+registry = MetricsRegistry()
+
+# Where a /meme spends its time
+phase_seconds = registry.histogram(
+    'meme_phase_seconds', 'Time spent in each phase of serving a meme', label='phase'
+)
+
+def timed(phase: str):
+    """Context manager recording a phase duration in meme_phase_seconds"""
+    return phase_seconds.time(phase)
\ No newline at end of file
@@ -0,0 +1,218 @@
+import logging
+import sqlite3
+from datetime import datetime
+
+logger = logging.getLogger(__name__)
+
+def _initial_schema(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meme_history (
+            id INTEGER PRIMARY KEY,
+            user_id INTEGER,
+            slogan TEXT,
+            timestamp DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS user_stats (
+            user_id INTEGER PRIMARY KEY,
+            total_memes INTEGER DEFAULT 0,
+            successful_generations INTEGER DEFAULT 0,
+            failed_generations INTEGER DEFAULT 0,
+            last_used DATETIME
+        )
+    ''')
+
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS telegram_files (
+            image_key TEXT PRIMARY KEY,
+            file_id TEXT NOT NULL,
+            created DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+
+def _history_indexes(conn: sqlite3.Connection):
+    # Per-user windows (daily caps, personal stats) and global windows (leaderboards)
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meme_history_user_time
+        ON meme_history (user_id, timestamp)
+    ''')
+    conn.execute('''
+        CREATE INDEX IF NOT EXISTS idx_meme_history_time_user
+        ON meme_history (timestamp, user_id)
+    ''')
+    # Give the planner statistics so time-window queries pick the timestamp index
+    conn.execute('PRAGMA analysis_limit = 1000')
+    conn.execute('ANALYZE meme_history')
+
+def _history_rollup(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS meme_history_daily (
+            day DATE NOT NULL,
+            user_id INTEGER NOT NULL,
+            slogan TEXT NOT NULL,
+            memes INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (day, user_id, slogan)
+        ) WITHOUT ROWID
+    ''')
+
+def _channel_calendar(conn: sqlite3.Connection):
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS channel_schedules (
+            id INTEGER PRIMARY KEY,
+            channel_id TEXT NOT NULL,
+            cron TEXT NOT NULL,
+            missed TEXT NOT NULL DEFAULT 'skip',
+            lead_minutes INTEGER NOT NULL DEFAULT 30,
+            last_slot DATETIME,
+            UNIQUE (channel_id, cron)
+        )
+    ''')
+    # One row per slot; the image is generated ahead of the slot and dropped once posted
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS channel_posts (
+            schedule_id INTEGER NOT NULL,
+            slot DATETIME NOT NULL,
+            status TEXT NOT NULL,
+            slogan TEXT,
+            prompt TEXT,
+            caption TEXT,
+            image BLOB,
+            attempts INTEGER NOT NULL DEFAULT 0,
+            posted_at DATETIME,
+            PRIMARY KEY (schedule_id, slot)
+        )
+    ''')
+    # Position in each channel's shuffled pass over every slogan and city pairing
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS channel_rotation (
+            channel_id TEXT PRIMARY KEY,
+            seed INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            position INTEGER NOT NULL
+        )
+    ''')
+
+def _analytics_snapshots(conn: sqlite3.Connection):
+    # scope is total, hour, day, slogan or quality
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_counts (
+            scope TEXT NOT NULL,
+            key TEXT NOT NULL,
+            memes INTEGER NOT NULL,
+            successes INTEGER NOT NULL,
+            failures INTEGER NOT NULL,
+            PRIMARY KEY (scope, key)
+        ) WITHOUT ROWID
+    ''')
+    # HyperLogLog registers: all-time under an empty key, per day under the date
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS analytics_users (
+            key TEXT PRIMARY KEY,
+            registers BLOB NOT NULL
+        )
+    ''')
+
+def _rotation_cursors(conn: sqlite3.Connection):
+    # Position in each chat's or channel's shuffled pass over the prompt catalog.
+    # Positions in the old channel_rotation order don't carry over, so channels start a new pass
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rotation_cursors (
+            chat_id TEXT PRIMARY KEY,
+            seed INTEGER NOT NULL,
+            size INTEGER NOT NULL,
+            position INTEGER NOT NULL
+        )
+    ''')
+    conn.execute('DROP TABLE IF EXISTS channel_rotation')
+
+def _deferred_actions(conn: sqlite3.Connection):
+    # Timed message deletions and edits still to do; due is a Unix timestamp
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS deferred_actions (
+            action TEXT NOT NULL,
+            chat_id INTEGER NOT NULL,
+            message_id INTEGER NOT NULL,
+            text TEXT,
+            due REAL NOT NULL,
+            PRIMARY KEY (action, chat_id, message_id)
+        ) WITHOUT ROWID
+    ''')
+
+def _rate_limits(conn: sqlite3.Connection):
+    # Limiter state per key; a, b and c are the limit's own fields (tokens or window counts)
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS rate_limits (
+            key TEXT PRIMARY KEY,
+            a REAL NOT NULL,
+            b REAL NOT NULL,
+            c REAL NOT NULL,
+            last_seen REAL NOT NULL
+        )
+    ''')
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rate_limits_last_seen ON rate_limits (last_seen)')
+
+# Append new migrations to the end; never reorder or edit applied ones
+MIGRATIONS = [
+    (1, 'initial schema', _initial_schema),
+    (2, 'meme_history indexes', _history_indexes),
+    (3, 'meme_history daily rollup', _history_rollup),
+    (4, 'channel posting calendar', _channel_calendar),
+    (5, 'analytics snapshots', _analytics_snapshots),
+    (6, 'prompt rotation cursors', _rotation_cursors),
+    (7, 'deferred message actions', _deferred_actions),
+    (8, 'rate limit state', _rate_limits),
+]
+
+def schema_version(conn: sqlite3.Connection) -> int:
+    """Highest migration applied to the database"""
+    conn.execute('''
+        CREATE TABLE IF NOT EXISTS schema_version (
+            version INTEGER PRIMARY KEY,
+            name TEXT NOT NULL,
+            applied_at DATETIME NOT NULL
+        )
+    ''')
+    row = conn.execute('SELECT MAX(version) FROM schema_version').fetchone()
+    return row[0] or 0
+
+def run_migrations(conn: sqlite3.Connection):
+    """Apply every migration newer than the database's schema version"""
+    current = schema_version(conn)
+    conn.commit()
+    for version, name, migrate in MIGRATIONS:
+        if version <= current:
+            continue
+        try:
+            # Another process sharing the database may have applied it since we looked
+            conn.execute('BEGIN IMMEDIATE')
+            if schema_version(conn) >= version:
+                conn.rollback()
+                continue
+            logger.info(f"Applying database migration {version}: {name}")
+            migrate(conn)
+            conn.execute(
+                'INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, ?)',
+                (version, name, datetime.now())
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+
+def archive_history(conn: sqlite3.Connection, before: datetime) -> int:
+    """Fold meme_history rows older than `before` into meme_history_daily"""
+    conn.execute('BEGIN')
+    conn.execute('''
+        INSERT INTO meme_history_daily (day, user_id, slogan, memes)
+        SELECT date(timestamp), user_id, COALESCE(slogan, ''), COUNT(*)
+        FROM meme_history
+        WHERE timestamp < ?
+        GROUP BY date(timestamp), user_id, COALESCE(slogan, '')
+        ON CONFLICT (day, user_id, slogan) DO UPDATE SET
+            memes = memes + excluded.memes
+    ''', (before,))
+    archived = conn.execute('DELETE FROM meme_history WHERE timestamp < ?', (before,)).rowcount
+    conn.commit()
+    return archived
\ No newline at end of file
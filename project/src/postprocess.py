@@ -0,0 +1,104 @@
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from io import BytesIO
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+MIN_QUALITY = 40
+QUALITY_STEP = 10
+SCALE_STEP = 0.85
+
+@dataclass(frozen=True)
+class PostProcessOptions:
+    format: Optional[str] = None
+    quality: int = 85
+    max_dimension: Optional[int] = None
+    target_bytes: Optional[int] = None
+
+    @property
+    def enabled(self) -> bool:
+        """True when any transformation is configured"""
+        return bool(self.format or self.max_dimension or self.target_bytes)
+
+    @property
+    def fingerprint(self) -> str:
+        """Identifies the output these options produce; empty when images pass through unchanged"""
+        if not self.enabled:
+            return ''
+        return f"{self.format}/{self.quality}/{self.max_dimension}/{self.target_bytes}"
+
+def _encode(image, image_format: str, quality: int) -> bytes:
+    output = BytesIO()
+    if image_format in ('JPEG', 'WEBP'):
+        image.save(output, format=image_format, quality=quality)
+    else:
+        image.save(output, format=image_format, optimize=True)
+    return output.getvalue()
+
+def transcode(data: bytes, options: PostProcessOptions) -> bytes:
+    """Resize and re-encode an image; runs inside a worker process"""
+    from PIL import Image
+
+    with Image.open(BytesIO(data)) as image:
+        image_format = (options.format or image.format or 'PNG').upper()
+        if image_format == 'JPEG' and image.mode not in ('RGB', 'L'):
+            image = image.convert('RGB')
+        if options.max_dimension:
+            image.thumbnail((options.max_dimension, options.max_dimension), Image.LANCZOS)
+
+        quality = options.quality
+        encoded = _encode(image, image_format, quality)
+
+        # Trade quality first, then resolution, until the target size is met
+        while options.target_bytes and len(encoded) > options.target_bytes:
+            if image_format in ('JPEG', 'WEBP') and quality - QUALITY_STEP >= MIN_QUALITY:
+                quality -= QUALITY_STEP
+            else:
+                width, height = image.size
+                if min(width, height) < 256:
+                    break
+                image = image.resize((int(width * SCALE_STEP), int(height * SCALE_STEP)), Image.LANCZOS)
+            encoded = _encode(image, image_format, quality)
+
+        return encoded
+
+class PostProcessor:
+    """Runs image transcoding in a process pool so it never blocks the bot loop"""
+
+    def __init__(self, options: PostProcessOptions, workers: int = 1):
+        self.options = options
+        self.workers = workers
+        self._executor = None
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'PostProcessor':
+        """Build a post-processor from the `api` section of config.yml"""
+        options = PostProcessOptions(
+            format=config.get('output_format'),
+            quality=config.get('output_quality', 85),
+            max_dimension=config.get('max_dimension'),
+            target_bytes=config.get('target_bytes')
+        )
+        return cls(options, workers=config.get('postprocess_workers', 1))
+
+    async def process(self, data: bytes) -> bytes:
+        """Apply the configured transformations, or return `data` untouched"""
+        if not self.options.enabled:
+            return data
+
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers)
+
+        loop = asyncio.get_running_loop()
+        result = await loop.run_in_executor(self._executor, transcode, data, self.options)
+        logger.debug("Post-processed image from %d to %d bytes", len(data), len(result))
+        return result
+
+    def shutdown(self):
+        """Stop the worker processes"""
+        if self._executor is not None:
+            self._executor.shutdown(cancel_futures=True)
+            self._executor = None
\ No newline at end of file
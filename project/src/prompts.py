@@ -0,0 +1,11 @@
+from typing import Tuple
+from .catalog import load_catalog
+
+def build_meme_idea(meme_idea: str, capital_city: str) -> str:
+    """Set a meme idea in the given city"""
+    return f"{meme_idea} The scene is set in {capital_city}."
+
+def random_prompt() -> Tuple[str, str]:
+    """Pick a weighted random slogan and a meme idea set in a weighted random capital city"""
+    slogan, meme_idea, city = load_catalog().sample()
+    return slogan, build_meme_idea(meme_idea, city)
\ No newline at end of file
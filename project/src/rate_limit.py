@@ -0,0 +1,232 @@
+import asyncio
+import logging
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+from .migrations import run_migrations
+
+logger = logging.getLogger(__name__)
+
+State = Tuple[float, float, float]
+
+@dataclass
+class Decision:
+    allowed: bool
+    limit: Optional[str] = None
+    retry_after: float = 0.0
+
+class TokenBucket:
+    """Allows bursts of `capacity`, refilled at `rate` tokens per second"""
+
+    def __init__(self, capacity: float, rate: float):
+        self.capacity = capacity
+        self.rate = rate
+
+    @property
+    def ttl(self) -> float:
+        """Seconds after which an untouched bucket is full again"""
+        return self.capacity / self.rate
+
+    def apply(self, state: Optional[State], now: float) -> Tuple[bool, State, float]:
+        tokens, last, _ = state or (self.capacity, now, 0.0)
+        tokens = min(self.capacity, tokens + (now - last) * self.rate)
+        if tokens >= 1:
+            return True, (tokens - 1, now, 0.0), 0.0
+        return False, (tokens, now, 0.0), (1 - tokens) / self.rate
+
+class SlidingWindow:
+    """At most `limit` hits in any `window` seconds, using a two-bucket approximation"""
+
+    def __init__(self, limit: int, window: float):
+        self.limit = limit
+        self.window = window
+
+    @property
+    def ttl(self) -> float:
+        """Seconds after which an untouched window has fully drained"""
+        return 2 * self.window
+
+    def apply(self, state: Optional[State], now: float) -> Tuple[bool, State, float]:
+        start = now - now % self.window
+        bucket_start, current, previous = state or (start, 0.0, 0.0)
+        if start - bucket_start >= 2 * self.window:
+            current, previous = 0.0, 0.0
+        elif start > bucket_start:
+            current, previous = 0.0, current
+
+        weight = 1 - (now - start) / self.window
+        estimated = previous * weight + current
+        if estimated + 1 <= self.limit:
+            return True, (start, current + 1, previous), 0.0
+        return False, (start, current, previous), self._retry_after(start, current, previous, now)
+
+    def _retry_after(self, start: float, current: float, previous: float, now: float) -> float:
+        """Seconds until previous * weight + current + 1 <= limit, as the weights decay"""
+        room = self.limit - 1
+        if room < 0:
+            return 2 * self.window
+        if current <= room and previous > 0:
+            # Still in this bucket, once the previous bucket's weight has decayed enough
+            at = start + self.window * (1 - (room - current) / previous)
+        elif current <= room:
+            at = now
+        else:
+            # In the next bucket this bucket's hits become the decaying previous count
+            at = start + self.window + self.window * (1 - room / current)
+        return max(0.0, at - now)
+
+class MemoryStore:
+    """In-process state with expiry of idle keys"""
+
+    blocking = False
+
+    def __init__(self, idle_expiry: float):
+        self.idle_expiry = idle_expiry
+        # key -> (state, last_seen), oldest first
+        self._states: "OrderedDict[str, Tuple[State, float]]" = OrderedDict()
+
+    @contextmanager
+    def transaction(self):
+        yield
+
+    def get(self, key: str) -> Optional[State]:
+        entry = self._states.get(key)
+        return entry[0] if entry else None
+
+    def put(self, key: str, state: State, now: float):
+        self._states[key] = (state, now)
+        self._states.move_to_end(key)
+        # Keys are ordered by last use, so expired ones are always at the front
+        while self._states:
+            oldest = next(iter(self._states))
+            if now - self._states[oldest][1] < self.idle_expiry:
+                break
+            del self._states[oldest]
+
+    def __len__(self):
+        return len(self._states)
+
+class SQLiteStore:
+    """State kept in SQLite so limits survive restarts and are shared between processes
+
+    Every transaction takes the database write lock, so the limiter runs checks
+    against this store off the event loop.
+    """
+
+    blocking = True
+
+    def __init__(self, path: str, idle_expiry: float, busy_timeout: float = 0.5):
+        self.path = path
+        self.idle_expiry = idle_expiry
+        self.busy_timeout = busy_timeout
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        self._puts = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        # Opened on first use, so building a limiter never touches the disk
+        if self._conn is None:
+            conn = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False,
+                                   timeout=self.busy_timeout)
+            try:
+                conn.execute('PRAGMA journal_mode=WAL')
+                # The store may live in its own file, which init_db never sees
+                run_migrations(conn)
+            except sqlite3.Error:
+                conn.close()
+                raise
+            self._conn = conn
+        return self._conn
+
+    @contextmanager
+    def transaction(self):
+        with self._lock:
+            conn = self._connect()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                yield
+                conn.execute('COMMIT')
+            except Exception:
+                if conn.in_transaction:
+                    conn.execute('ROLLBACK')
+                raise
+
+    def get(self, key: str) -> Optional[State]:
+        return self._conn.execute('SELECT a, b, c FROM rate_limits WHERE key = ?', (key,)).fetchone()
+
+    def put(self, key: str, state: State, now: float):
+        self._conn.execute(
+            'INSERT OR REPLACE INTO rate_limits (key, a, b, c, last_seen) VALUES (?, ?, ?, ?, ?)',
+            (key, *state, now)
+        )
+        self._puts += 1
+        if self._puts % 1000 == 0:
+            self._conn.execute('DELETE FROM rate_limits WHERE last_seen < ?', (now - self.idle_expiry,))
+
+class RateLimiter:
+    """Checks a request against every configured limit and consumes them atomically"""
+
+    def __init__(self, store, user_limits: Dict[str, object], chat_limits: Dict[str, object] = None,
+                 global_limits: Dict[str, object] = None):
+        self.store = store
+        self.user_limits = user_limits
+        self.chat_limits = chat_limits or {}
+        self.global_limits = global_limits or {}
+
+    @classmethod
+    def from_config(cls, bot_config: dict, config: dict) -> 'RateLimiter':
+        """Build a limiter from the `bot` and `rate_limits` sections of config.yml"""
+        user_limits = {
+            'cooldown': TokenBucket(1, 1 / (bot_config.get('cooldown_minutes', 5) * 60)),
+            'daily': SlidingWindow(bot_config.get('max_daily_memes', 50), 24 * 3600)
+        }
+        chat_limits = {}
+        if config.get('chat_per_minute'):
+            chat_limits['chat'] = SlidingWindow(config['chat_per_minute'], 60)
+        global_limits = {}
+        if config.get('global_per_minute'):
+            global_limits['global'] = SlidingWindow(config['global_per_minute'], 60)
+
+        all_limits = [*user_limits.values(), *chat_limits.values(), *global_limits.values()]
+        idle_expiry = max(limit.ttl for limit in all_limits)
+        if config.get('store') == 'sqlite':
+            store = SQLiteStore(config.get('db_path', 'bot_data.db'), idle_expiry,
+                                config.get('busy_timeout_ms', 500) / 1000)
+        else:
+            store = MemoryStore(idle_expiry)
+        return cls(store, user_limits, chat_limits, global_limits)
+
+    def _keys(self, user_id: int, chat_id: Optional[int]) -> List[Tuple[str, object]]:
+        keys = [(f"user:{user_id}:{name}", limit) for name, limit in self.user_limits.items()]
+        if chat_id is not None:
+            keys += [(f"chat:{chat_id}:{name}", limit) for name, limit in self.chat_limits.items()]
+        keys += [(f"global:{name}", limit) for name, limit in self.global_limits.items()]
+        return keys
+
+    def _check(self, user_id: int, chat_id: Optional[int]) -> Decision:
+        now = time.time()
+        with self.store.transaction():
+            updates = []
+            for key, limit in self._keys(user_id, chat_id):
+                allowed, state, retry_after = limit.apply(self.store.get(key), now)
+                if not allowed:
+                    return Decision(False, key.rsplit(':', 1)[-1], retry_after)
+                updates.append((key, state))
+            for key, state in updates:
+                self.store.put(key, state, now)
+        return Decision(True)
+
+    async def check(self, user_id: int, chat_id: Optional[int] = None) -> Decision:
+        """Consume one request from every limit, or none if any limit is exhausted"""
+        if not self.store.blocking:
+            return self._check(user_id, chat_id)
+        try:
+            return await asyncio.to_thread(self._check, user_id, chat_id)
+        except sqlite3.OperationalError as e:
+            # A busy shared database must not stall the bot; let the request through
+            logger.warning(f"Rate limit store unavailable, allowing request: {e}")
+            return Decision(True)
\ No newline at end of file
@@ -0,0 +1,173 @@
+import asyncio
+import logging
+import random
+import subprocess
+import time
+from typing import Awaitable, Callable, Optional
+import httpx
+from .image_client import ImageAPIError
+
+logger = logging.getLogger(__name__)
+
+# API error codes that will fail the same way however often they are retried
+NON_RETRYABLE_CODES = {
+    'billing_hard_limit_reached',
+    'content_policy_violation',
+    'insufficient_quota',
+    'invalid_api_key',
+}
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream that is known to be down"""
+
+def _status_retryable(status: Optional[int]) -> bool:
+    return status is not None and (status == 429 or status >= 500)
+
+def is_retryable(exc: BaseException) -> bool:
+    """Whether a failed call is worth retrying"""
+    if isinstance(exc, ImageAPIError):
+        if exc.code in NON_RETRYABLE_CODES:
+            return False
+        return _status_retryable(exc.status)
+    if isinstance(exc, httpx.HTTPStatusError):
+        return _status_retryable(exc.response.status_code)
+    if isinstance(exc, (httpx.TimeoutException, httpx.TransportError, asyncio.TimeoutError)):
+        return True
+    if isinstance(exc, subprocess.CalledProcessError):
+        # curl exits non-zero on DNS, connect and timeout failures
+        return True
+    if isinstance(exc, OSError):
+        # requests exceptions are OSErrors; HTTP errors carry the response
+        response = getattr(exc, 'response', None)
+        if response is not None:
+            return _status_retryable(response.status_code)
+        return True
+    return False
+
+def retry_after(exc: BaseException) -> Optional[float]:
+    """Server-requested delay in seconds, if the error carries one"""
+    value = getattr(exc, 'retry_after', None)
+    if value is None:
+        response = getattr(exc, 'response', None)
+        value = response.headers.get('Retry-After') if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+class CircuitBreaker:
+    """Opens after repeated upstream failures and lets one probe through after a cool-off"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.trips = 0
+        self._probing = False
+
+    @property
+    def is_open(self) -> bool:
+        """True while calls are being short-circuited"""
+        if self.opened_at is None:
+            return False
+        return self._probing or time.monotonic() - self.opened_at < self.reset_timeout
+
+    def before_call(self) -> bool:
+        """Raise CircuitOpenError unless a call may go ahead; True when the call is the half-open probe"""
+        if self.opened_at is None:
+            return False
+        if self.is_open:
+            raise CircuitOpenError("Upstream is unavailable, failing fast")
+        # Half-open: let a single probe through
+        self._probing = True
+        return True
+
+    def abandon_probe(self):
+        """The probe ended without an answer (e.g. it was cancelled); let the next call probe instead"""
+        self._probing = False
+
+    def record_success(self):
+        if self.opened_at is not None:
+            logger.info("Circuit breaker closed, upstream recovered")
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            if not self._probing:
+                self.trips += 1
+                logger.warning(f"Circuit breaker opened after {self.failures} failures")
+            self.opened_at = time.monotonic()
+            self._probing = False
+
+class RetryPolicy:
+    """Async retries with full-jitter exponential backoff that honour Retry-After"""
+
+    def __init__(self, attempts: int = 3, base_delay: float = 1.0, max_delay: float = 20.0,
+                 breaker: Optional[CircuitBreaker] = None):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.breaker = breaker
+        self.retries = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'RetryPolicy':
+        """Build a policy and breaker from the `api` section of config.yml"""
+        breaker = CircuitBreaker(
+            failure_threshold=config.get('breaker_failure_threshold', 5),
+            reset_timeout=config.get('breaker_reset_seconds', 60)
+        )
+        return cls(
+            attempts=config.get('retry_attempts', 3),
+            base_delay=config.get('retry_base_delay_seconds', 1.0),
+            max_delay=config.get('retry_max_delay_seconds', 20.0),
+            breaker=breaker
+        )
+
+    def _delay(self, attempt: int, exc: BaseException) -> Optional[float]:
+        """Seconds to wait before the next attempt, or None when the server asks for longer than max_delay"""
+        requested = retry_after(exc)
+        if requested is not None:
+            # Never retry sooner than asked; waiting longer than the budget is not worth it
+            return requested if requested <= self.max_delay else None
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    async def call(self, func: Callable[..., Awaitable], *args, **kwargs):
+        """Await `func`, retrying retryable failures without blocking the loop"""
+        for attempt in range(self.attempts):
+            probe = self.breaker.before_call() if self.breaker else False
+            try:
+                result = await func(*args, **kwargs)
+            except Exception as e:
+                retryable = is_retryable(e)
+                if self.breaker:
+                    if retryable:
+                        self.breaker.record_failure()
+                    else:
+                        # The upstream answered, it is just refusing this request
+                        self.breaker.record_success()
+                if not retryable or attempt == self.attempts - 1:
+                    raise
+                if self.breaker and self.breaker.is_open:
+                    raise CircuitOpenError("Upstream is unavailable, failing fast") from e
+                delay = self._delay(attempt, e)
+                if delay is None:
+                    logger.warning(f"Attempt {attempt + 1} failed ({e}), server asked for a longer wait "
+                                   f"than {self.max_delay:.0f}s, giving up")
+                    raise
+                self.retries += 1
+                logger.warning(f"Attempt {attempt + 1} failed ({e}), retrying in {delay:.1f}s")
+                await asyncio.sleep(delay)
+            except BaseException:
+                # Cancelled or interrupted: the probe got no answer either way
+                if probe:
+                    self.breaker.abandon_probe()
+                raise
+            else:
+                if self.breaker:
+                    self.breaker.record_success()
+                return result
\ No newline at end of file
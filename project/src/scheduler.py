@@ -0,0 +1,159 @@
+import asyncio
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Awaitable, Callable, Tuple
+
+logger = logging.getLogger(__name__)
+
+class QueueFullError(Exception):
+    """Raised when the generation queue has no free slots"""
+
+@dataclass
+class SchedulerMetrics:
+    submitted: int = 0
+    completed: int = 0
+    failed: int = 0
+    rejected: int = 0
+    coalesced: int = 0
+    total_wait: float = 0.0
+    max_wait: float = 0.0
+
+    def record_wait(self, seconds: float):
+        """Track how long a job sat in the queue before a worker picked it up"""
+        self.total_wait += seconds
+        self.max_wait = max(self.max_wait, seconds)
+
+    @property
+    def avg_wait(self) -> float:
+        """Average queue wait in seconds"""
+        started = self.completed + self.failed
+        if started == 0:
+            return 0.0
+        return self.total_wait / started
+
+@dataclass
+class Job:
+    func: Callable[..., Awaitable]
+    args: tuple
+    kwargs: dict
+    position: int
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+    def result(self) -> Awaitable:
+        """Await the job's return value"""
+        return asyncio.shield(self.future)
+
+class GenerationScheduler:
+    """Bounded worker pool that all meme generation requests are submitted to"""
+
+    def __init__(self, workers: int = 2, queue_size: int = 20, coalesce: str = 'share'):
+        self.workers = workers
+        self.queue_size = queue_size
+        self.coalesce = coalesce
+        self.metrics = SchedulerMetrics()
+        self._queue = None
+        self._inflight = {}
+        self._tasks = []
+        self._active = 0
+
+    @classmethod
+    def from_config(cls, config: dict) -> 'GenerationScheduler':
+        """Build a scheduler from the `scheduler` section of config.yml"""
+        return cls(
+            workers=config.get('workers', 2),
+            queue_size=config.get('queue_size', 20),
+            coalesce=config.get('coalesce', 'share')
+        )
+
+    @property
+    def depth(self) -> int:
+        """Number of jobs waiting for a worker"""
+        return self._queue.qsize() if self._queue else 0
+
+    @property
+    def idle(self) -> bool:
+        """True when nothing is queued and at least one worker is free"""
+        return self.depth == 0 and self._active < self.workers
+
+    async def start(self):
+        """Spawn the worker tasks on the running loop"""
+        self._queue = asyncio.Queue(maxsize=self.queue_size)
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Generation scheduler started with {self.workers} workers")
+
+    async def stop(self):
+        """Cancel workers and fail any jobs still waiting"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while self._queue and not self._queue.empty():
+            job = self._queue.get_nowait()
+            job.future.cancel()
+
+    def submit(self, func: Callable[..., Awaitable], *args, **kwargs) -> Job:
+        """Queue a coroutine function call; raises QueueFullError when at capacity"""
+        if self._queue is None:
+            raise RuntimeError("Scheduler has not been started")
+
+        idle = self.workers - self._active
+        job = Job(
+            func=func,
+            args=args,
+            kwargs=kwargs,
+            position=max(0, self._queue.qsize() + 1 - idle),
+            future=asyncio.get_running_loop().create_future()
+        )
+        try:
+            self._queue.put_nowait(job)
+        except asyncio.QueueFull:
+            self.metrics.rejected += 1
+            raise QueueFullError(f"Generation queue is full ({self.queue_size} jobs)")
+
+        self.metrics.submitted += 1
+        return job
+
+    def in_flight(self, key: str) -> bool:
+        """True when a shared job for `key` is queued or running"""
+        return key in self._inflight
+
+    def submit_shared(self, key: str, func: Callable[..., Awaitable], *args, **kwargs) -> Tuple[Job, bool]:
+        """Submit a job, or join the identical one already in flight under `key`
+
+        Returns the job and whether it was shared with an earlier caller.
+        """
+        job = self._inflight.get(key)
+        if job is not None:
+            self.metrics.coalesced += 1
+            return job, True
+
+        job = self.submit(func, *args, **kwargs)
+        self._inflight[key] = job
+        job.future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return job, False
+
+    async def _worker(self, index: int):
+        while True:
+            job = await self._queue.get()
+            wait = time.monotonic() - job.enqueued_at
+            self.metrics.record_wait(wait)
+            logger.debug("Worker %d picked up job after %.2fs (depth %d)", index, wait, self.depth)
+
+            self._active += 1
+            try:
+                result = await job.func(*job.args, **job.kwargs)
+                if not job.future.done():
+                    job.future.set_result(result)
+                self.metrics.completed += 1
+            except asyncio.CancelledError:
+                job.future.cancel()
+                raise
+            except Exception as e:
+                if not job.future.done():
+                    job.future.set_exception(e)
+                self.metrics.failed += 1
+            finally:
+                self._active -= 1
+                self._queue.task_done()
\ No newline at end of file
@@ -0,0 +1,341 @@
+import asyncio
+import copy
+import hmac
+import logging
+import os
+import secrets
+import signal
+import subprocess
+from json import JSONDecodeError
+from typing import TYPE_CHECKING, Dict, List, Optional
+import httpx
+from telegram import Bot, Update
+from telegram.error import TelegramError
+from .updates import SECRET_HEADER
+
+# Every process imports this module for the worker constants; only the dispatcher
+# needs starlette and uvicorn, so they are imported where the dispatcher uses them
+if TYPE_CHECKING:
+    from starlette.requests import Request
+    from starlette.responses import Response
+
+logger = logging.getLogger(__name__)
+
+# Set by the dispatcher on each worker it spawns
+WORKER_INDEX_ENV = 'BOT_WORKER_INDEX'
+WORKER_PORT_ENV = 'BOT_WORKER_PORT'
+WORKER_SECRET_ENV = 'BOT_WORKER_SECRET'
+WORKER_PATH = '/telegram'
+
+# A polled update is retried this many times, a second apart, while its worker is busy
+# or restarting: long enough to ride out a rolling restart, short enough not to stall a shard
+DELIVERY_ATTEMPTS = 120
+
+# Update fields carrying a chat, in the order Telegram documents them
+CHAT_FIELDS = ('message', 'edited_message', 'channel_post', 'edited_channel_post',
+               'my_chat_member', 'chat_member', 'chat_join_request')
+SENDER_FIELDS = ('inline_query', 'chosen_inline_result', 'shipping_query', 'pre_checkout_query',
+                 'poll_answer')
+
+def update_chat_id(payload: dict) -> Optional[int]:
+    """Chat an update belongs to, falling back to the sender for chat-less updates"""
+    for field in CHAT_FIELDS:
+        chat = payload.get(field, {}).get('chat')
+        if chat:
+            return chat['id']
+    callback = payload.get('callback_query')
+    if callback:
+        message = callback.get('message')
+        return message['chat']['id'] if message else callback['from']['id']
+    for field in SENDER_FIELDS:
+        sender = payload.get(field, {}).get('from') or payload.get(field, {}).get('user')
+        if sender:
+            return sender['id']
+    return None
+
+def shard_for(chat_id: Optional[int], shards: int) -> int:
+    """Worker owning a chat; stable across restarts so a chat's updates stay in order"""
+    return chat_id % shards if chat_id is not None else 0
+
+def worker_config(config: dict, index: int, port: int) -> dict:
+    """config.yml adjusted for worker `index`, listening on `port`, sharing the database and cache"""
+    config = copy.deepcopy(config)
+    count = config.get('workers', {}).get('count', 2)
+    # Users can reach any worker through group chats, so their limits must be shared
+    config.setdefault('rate_limits', {})['store'] = 'sqlite'
+    config.setdefault('analytics', {})['shared'] = True
+    metrics = config.setdefault('metrics', {})
+    # Offset like the worker's own port, so a replacement never collides with the worker it replaces
+    metrics['port'] = metrics.get('port', 9090) + port - config.get('workers', {}).get('base_port', 9100)
+    inventory = config.setdefault('inventory', {})
+    inventory['daily_budget_usd'] = inventory.get('daily_budget_usd', 2.0) / count
+    # Every worker refills its own stock; a shared cursor would have them all pay for the same prompts
+    inventory['rotation_key'] = f"{inventory.get('rotation_key', 'inventory')}:{index}"
+    return config
+
+class WorkerProcess:
+    """A `main.py` child serving one shard over a local webhook"""
+
+    def __init__(self, index: int, port: int, secret: str, command: List[str]):
+        self.index = index
+        self.port = port
+        self.secret = secret
+        self.command = command
+        self.url = f"http://127.0.0.1:{port}{WORKER_PATH}"
+        self.process: Optional[subprocess.Popen] = None
+
+    def start(self):
+        env = {**os.environ, WORKER_INDEX_ENV: str(self.index), WORKER_PORT_ENV: str(self.port),
+               WORKER_SECRET_ENV: self.secret}
+        # Own session, so a Ctrl-C meant for the dispatcher does not stop workers behind its back
+        self.process = subprocess.Popen(self.command, env=env, start_new_session=True)
+        logger.info(f"Started worker {self.index} (pid {self.process.pid}) on port {self.port}")
+
+    @property
+    def alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    async def wait_ready(self, client: httpx.AsyncClient, timeout: float):
+        """Wait until the worker answers /healthz"""
+        deadline = asyncio.get_running_loop().time() + timeout
+        while True:
+            if not self.alive:
+                raise RuntimeError(f"Worker {self.index} exited during startup")
+            try:
+                response = await client.get(f"http://127.0.0.1:{self.port}/healthz")
+                # Anything else still bound to the port must not be mistaken for this worker
+                if response.status_code == 200 and response.json().get('pid') == self.process.pid:
+                    return
+            except httpx.TransportError:
+                pass
+            if asyncio.get_running_loop().time() > deadline:
+                raise RuntimeError(f"Worker {self.index} not ready after {timeout:.0f}s")
+            await asyncio.sleep(0.2)
+
+    async def stop(self, timeout: float):
+        """SIGTERM and wait for in-flight updates to drain, killing the worker if it takes too long"""
+        if not self.alive:
+            return
+        self.process.terminate()
+        try:
+            await asyncio.to_thread(self.process.wait, timeout)
+        except subprocess.TimeoutExpired:
+            logger.warning(f"Worker {self.index} did not drain within {timeout:.0f}s, killing it")
+            self.process.kill()
+            await asyncio.to_thread(self.process.wait)
+        logger.info(f"Worker {self.index} (pid {self.process.pid}) stopped")
+
+class Dispatcher:
+    """Receives every update and forwards it to the worker process owning its chat
+
+    Updates arrive by long polling, or on a public webhook when `url` is set. SIGHUP
+    restarts the workers one at a time: the replacement starts on the shard's spare
+    port and takes over only once healthy, then the old worker drains and exits.
+    """
+
+    def __init__(self, token: str, command: List[str], workers: int = 2, base_port: int = 9100,
+                 url: Optional[str] = None, secret_token: Optional[str] = None, path: str = '/telegram',
+                 listen: str = '0.0.0.0', port: int = 8443, max_connections: int = 40,
+                 ready_timeout: float = 60.0, drain_timeout: float = 60.0):
+        self.token = token
+        self.command = command
+        self.count = workers
+        self.base_port = base_port
+        self.url = url
+        self.secret_token = secret_token or secrets.token_urlsafe(32)
+        self.path = path
+        self.listen = listen
+        self.port = port
+        self.max_connections = max_connections
+        self.ready_timeout = ready_timeout
+        self.drain_timeout = drain_timeout
+        # Workers only accept updates carrying this, so nothing else on the host can inject them
+        self.worker_secret = secrets.token_urlsafe(32)
+        self.workers: Dict[int, WorkerProcess] = {}
+        self.forwarded = [0] * workers
+        self._client: Optional[httpx.AsyncClient] = None
+        self._restarting = False
+        self._stopping = asyncio.Event()
+        from starlette.applications import Starlette
+        from starlette.routing import Route
+        self.app = Starlette(routes=[
+            Route(path, self.handle_update, methods=['POST']),
+            Route('/healthz', self.health, methods=['GET']),
+        ])
+
+    @classmethod
+    def from_config(cls, token: str, command: List[str], config: dict, url: Optional[str] = None,
+                    secret_token: Optional[str] = None) -> 'Dispatcher':
+        """Build a dispatcher from the `workers` and `webhook` sections of config.yml"""
+        workers_config = config.get('workers', {})
+        webhook_config = config.get('webhook', {})
+        return cls(
+            token,
+            command,
+            workers=workers_config.get('count', 2),
+            base_port=workers_config.get('base_port', 9100),
+            url=(url or webhook_config.get('url')) if webhook_config.get('enabled') else None,
+            secret_token=secret_token,
+            path=webhook_config.get('path', '/telegram'),
+            listen=webhook_config.get('listen', '0.0.0.0'),
+            port=webhook_config.get('port', 8443),
+            max_connections=webhook_config.get('max_connections', 40),
+            ready_timeout=workers_config.get('ready_timeout_seconds', 60),
+            drain_timeout=workers_config.get('drain_timeout_seconds', 60)
+        )
+
+    def _spawn(self, index: int, port: int) -> WorkerProcess:
+        worker = WorkerProcess(index, port, self.worker_secret, self.command)
+        worker.start()
+        return worker
+
+    def _spare_port(self, index: int) -> int:
+        """Each shard alternates between two ports so a replacement can start beside the old worker"""
+        port = self.base_port + index
+        return port + self.count if self.workers[index].port == port else port
+
+    async def forward(self, payload: dict) -> int:
+        """Hand an update to its worker and return the worker's HTTP status"""
+        index = shard_for(update_chat_id(payload), self.count)
+        worker = self.workers[index]
+        try:
+            response = await self._client.post(worker.url, json=payload,
+                                               headers={SECRET_HEADER: self.worker_secret})
+        except httpx.TransportError as e:
+            logger.warning(f"Worker {index} unreachable: {e}")
+            return 503
+        if response.status_code == 200:
+            self.forwarded[index] += 1
+        return response.status_code
+
+    async def handle_update(self, request: 'Request') -> 'Response':
+        from starlette.responses import Response
+        supplied = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(supplied.encode(), self.secret_token.encode()):
+            return Response(status_code=403)
+        try:
+            payload = await request.json()
+        except JSONDecodeError:
+            return Response(status_code=400)
+        # Worker backpressure and restarts surface as 503, which Telegram redelivers
+        status = await self.forward(payload)
+        return Response(status_code=status, headers={'Retry-After': '1'} if status == 503 else None)
+
+    async def health(self, request: 'Request') -> 'Response':
+        from starlette.responses import JSONResponse
+        return JSONResponse({
+            'workers': [{'index': w.index, 'pid': w.process.pid, 'port': w.port, 'alive': w.alive,
+                         'forwarded': self.forwarded[w.index]} for w in self.workers.values()],
+            'restarting': self._restarting
+        })
+
+    async def rolling_restart(self):
+        """Replace the workers one at a time without dropping updates"""
+        if self._restarting:
+            return
+        self._restarting = True
+        try:
+            for index in range(self.count):
+                old = self.workers[index]
+                new = self._spawn(index, self._spare_port(index))
+                try:
+                    await new.wait_ready(self._client, self.ready_timeout)
+                except RuntimeError as e:
+                    logger.error(f"Rolling restart aborted, keeping the running workers: {e}")
+                    await new.stop(self.drain_timeout)
+                    return
+                self.workers[index] = new
+                await old.stop(self.drain_timeout)
+            logger.info("Rolling restart complete")
+        finally:
+            self._restarting = False
+
+    async def _supervise(self):
+        """Respawn workers that die outside a restart"""
+        while not self._stopping.is_set():
+            await asyncio.sleep(1)
+            if self._restarting:
+                continue
+            for index, worker in list(self.workers.items()):
+                if not worker.alive and not self._stopping.is_set():
+                    logger.error(f"Worker {index} exited with {worker.process.returncode}, restarting it")
+                    self.workers[index] = self._spawn(index, worker.port)
+
+    async def _poll(self, bot: Bot):
+        """Long-poll Telegram and forward each batch, in order within every shard"""
+        await bot.delete_webhook()
+        offset = None
+        try:
+            while True:
+                try:
+                    updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=Update.ALL_TYPES)
+                except TelegramError as e:
+                    logger.warning(f"getUpdates failed: {e}")
+                    await asyncio.sleep(1)
+                    continue
+
+                shards: Dict[int, List[dict]] = {}
+                for update in updates:
+                    payload = update.to_dict()
+                    shards.setdefault(shard_for(update_chat_id(payload), self.count), []).append(payload)
+                await asyncio.gather(*(self._deliver(batch) for batch in shards.values()))
+                if updates:
+                    offset = updates[-1].update_id + 1
+        finally:
+            # Acknowledge the last delivered batch so it is not fetched again after a restart
+            if offset is not None:
+                await bot.get_updates(offset=offset, timeout=0)
+
+    async def _deliver(self, payloads: List[dict]):
+        for payload in payloads:
+            # Only a busy or unreachable worker (503) is retried; a 500 is a handler failing
+            # on this update, which would fail the same way forever
+            for attempt in range(DELIVERY_ATTEMPTS):
+                status = await self.forward(payload)
+                if status != 503:
+                    break
+                await asyncio.sleep(1)
+            if status != 200:
+                logger.error(f"Dropping update {payload.get('update_id')}: worker answered {status}"
+                             + (f" after {DELIVERY_ATTEMPTS} attempts" if status == 503 else ""))
+
+    async def serve(self):
+        """Start the workers and dispatch updates to them until interrupted"""
+        loop = asyncio.get_running_loop()
+        loop.add_signal_handler(signal.SIGHUP, lambda: asyncio.ensure_future(self.rolling_restart()))
+        self._client = httpx.AsyncClient(timeout=30, limits=httpx.Limits(max_connections=self.max_connections))
+        for index in range(self.count):
+            self.workers[index] = self._spawn(index, self.base_port + index)
+        supervisor = None
+        try:
+            await asyncio.gather(*(w.wait_ready(self._client, self.ready_timeout) for w in self.workers.values()))
+            supervisor = asyncio.create_task(self._supervise())
+            logger.info(f"Dispatching updates to {self.count} workers")
+            async with Bot(self.token) as bot:
+                if self.url:
+                    await bot.set_webhook(url=self.url.rstrip('/') + self.path, secret_token=self.secret_token,
+                                          max_connections=self.max_connections, allowed_updates=Update.ALL_TYPES)
+                    logger.info(f"Webhook registered at {self.url.rstrip('/')}{self.path}")
+                    import uvicorn
+                    from .webhook import GracefulServer
+                    server = GracefulServer(uvicorn.Config(
+                        self.app, host=self.listen, port=self.port, log_level='warning'
+                    ))
+                    await server.serve()
+                else:
+                    for sig in (signal.SIGINT, signal.SIGTERM):
+                        loop.add_signal_handler(sig, self._stopping.set)
+                    poller = asyncio.create_task(self._poll(bot))
+                    await self._stopping.wait()
+                    poller.cancel()
+                    await asyncio.gather(poller, return_exceptions=True)
+        finally:
+            self._stopping.set()
+            if supervisor:
+                supervisor.cancel()
+            await asyncio.gather(*(w.stop(self.drain_timeout) for w in self.workers.values()))
+            await self._client.aclose()
+
+    def run(self):
+        """Blocking entry point"""
+        asyncio.run(self.serve())
\ No newline at end of file
@@ -0,0 +1,20 @@
+from telegram.ext import SimpleUpdateProcessor
+
+# Header Telegram echoes the webhook secret in; the dispatcher uses it towards workers too
+SECRET_HEADER = 'X-Telegram-Bot-Api-Secret-Token'
+
+class UpdateProcessor(SimpleUpdateProcessor):
+    """Runs at most `max_concurrent_updates` handlers at once and counts what it has started"""
+
+    def __init__(self, max_concurrent_updates: int):
+        super().__init__(max_concurrent_updates)
+        self.started = 0
+        self.active = 0
+
+    async def do_process_update(self, update, coroutine):
+        self.started += 1
+        self.active += 1
+        try:
+            await coroutine
+        finally:
+            self.active -= 1
\ No newline at end of file
@@ -0,0 +1,30 @@
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict
+from telegram import Bot
+from telegram.error import TelegramError
+
+logger = logging.getLogger(__name__)
+
+async def _timed(name: str, step: Callable[[], Awaitable], timings: Dict[str, float]):
+    start = time.perf_counter()
+    await step()
+    timings[name] = time.perf_counter() - start
+
+async def warm_up(steps: Dict[str, Callable[[], Awaitable]]) -> Dict[str, float]:
+    """Run independent startup steps concurrently and return how long each took"""
+    timings = {}
+    start = time.perf_counter()
+    await asyncio.gather(*(_timed(name, step, timings) for name, step in steps.items()))
+    elapsed = time.perf_counter() - start
+    logger.info(f"Warm-up done in {elapsed * 1000:.0f} ms: "
+                + ', '.join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in timings.items()))
+    return timings
+
+async def warm_telegram(bot: Bot, connections: int):
+    """Open `connections` pooled connections to the Bot API before the first reply needs one"""
+    try:
+        await asyncio.gather(*(bot.get_me() for _ in range(connections)))
+    except TelegramError as e:
+        logger.warning(f"Could not pre-connect to the Bot API: {e}")
\ No newline at end of file
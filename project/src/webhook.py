@@ -0,0 +1,135 @@
+import asyncio
+import hmac
+import logging
+import os
+import signal
+from dataclasses import dataclass
+from json import JSONDecodeError
+from typing import Optional
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, Response
+from starlette.routing import Route
+from telegram import Update
+from telegram.ext import Application
+from .updates import SECRET_HEADER, UpdateProcessor
+
+logger = logging.getLogger(__name__)
+
+@dataclass
+class WebhookMetrics:
+    received: int = 0
+    rejected: int = 0
+    unauthorized: int = 0
+    malformed: int = 0
+
+class GracefulServer(uvicorn.Server):
+    """uvicorn server that returns from serve() on SIGINT/SIGTERM instead of ending the process"""
+
+    def handle_exit(self, sig, frame):
+        # Newer uvicorn re-raises the captured signal once serve() returns, which would kill the
+        # process before the application is stopped and pending writes are flushed
+        if self.should_exit and sig == signal.SIGINT:
+            self.force_exit = True
+        else:
+            self.should_exit = True
+
+class WebhookServer:
+    """ASGI endpoint that feeds Telegram webhook updates into a PTB application"""
+
+    def __init__(self, application: Application, secret_token: str, url: Optional[str] = None,
+                 path: str = '/telegram', listen: str = '0.0.0.0', port: int = 8443,
+                 max_pending: int = 1000, max_connections: int = 40):
+        self.application = application
+        self.secret_token = secret_token
+        self.url = url
+        self.path = path
+        self.listen = listen
+        self.port = port
+        self.max_pending = max_pending
+        self.max_connections = max_connections
+        self.metrics = WebhookMetrics()
+        self.app = Starlette(routes=[
+            Route(path, self.handle_update, methods=['POST']),
+            Route('/healthz', self.health, methods=['GET']),
+        ])
+
+    @classmethod
+    def from_config(cls, application: Application, config: dict, secret_token: str,
+                    url: Optional[str] = None) -> 'WebhookServer':
+        """Build a server from the `webhook` section of config.yml"""
+        return cls(
+            application,
+            secret_token,
+            url=url or config.get('url'),
+            path=config.get('path', '/telegram'),
+            listen=config.get('listen', '0.0.0.0'),
+            port=config.get('port', 8443),
+            max_pending=config.get('max_pending_updates', 1000),
+            max_connections=config.get('max_connections', 40)
+        )
+
+    @property
+    def pending(self) -> int:
+        """Updates accepted but still waiting for a free handler slot"""
+        processor = self.application.update_processor
+        if isinstance(processor, UpdateProcessor):
+            return self.metrics.received - processor.started
+        return self.application.update_queue.qsize()
+
+    async def handle_update(self, request: Request) -> Response:
+        supplied = request.headers.get(SECRET_HEADER, '')
+        if not hmac.compare_digest(supplied.encode(), self.secret_token.encode()):
+            self.metrics.unauthorized += 1
+            return Response(status_code=403)
+
+        # Telegram redelivers on non-2xx, so a full backlog pushes back instead of dropping
+        if self.pending >= self.max_pending:
+            self.metrics.rejected += 1
+            return Response(status_code=503, headers={'Retry-After': '1'})
+
+        try:
+            update = Update.de_json(await request.json(), self.application.bot)
+        except (JSONDecodeError, TypeError, KeyError) as e:
+            self.metrics.malformed += 1
+            logger.warning(f"Discarding malformed webhook update: {e}")
+            return Response(status_code=400)
+
+        self.metrics.received += 1
+        await self.application.update_queue.put(update)
+        return Response(status_code=200)
+
+    async def health(self, request: Request) -> Response:
+        return JSONResponse({'pid': os.getpid(), 'pending': self.pending, **self.metrics.__dict__})
+
+    async def serve(self):
+        """Run the application behind the webhook until the server is stopped"""
+        application = self.application
+        await application.initialize()
+        if application.post_init:
+            await application.post_init(application)
+        await application.start()
+        try:
+            if self.url:
+                await application.bot.set_webhook(
+                    url=self.url.rstrip('/') + self.path,
+                    secret_token=self.secret_token,
+                    max_connections=self.max_connections,
+                    allowed_updates=Update.ALL_TYPES
+                )
+                logger.info(f"Webhook registered at {self.url.rstrip('/')}{self.path}")
+            server = GracefulServer(uvicorn.Config(
+                self.app, host=self.listen, port=self.port, log_level='warning'
+            ))
+            logger.info(f"Listening for webhook updates on {self.listen}:{self.port}")
+            await server.serve()
+        finally:
+            await application.stop()
+            await application.shutdown()
+            if application.post_shutdown:
+                await application.post_shutdown(application)
+
+    def run(self):
+        """Blocking entry point, the webhook counterpart of `run_polling`"""
+        asyncio.run(self.serve())
\ No newline at end of file